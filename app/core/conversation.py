@@ -0,0 +1,125 @@
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Sequence
+
+HISTORY_HEADER = "CONVERSATION SO FAR (oldest first):"
+EARLIER_HEADER = "Earlier in this conversation (summarised):"
+ROLE_LABELS = {"user": "User", "assistant": "Assistant"}
+
+def token_counter(client) -> Callable[[str], int]:
+    """Token counts from the client's tokenizer; ~4 characters per token for remote/fake clients."""
+    tokenizer = getattr(client, "tokenizer", None)
+    if tokenizer is None:
+        return lambda text: len(text) // 4 + 1
+    return lambda text: len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def summarise_turn(text: str, max_chars: int = 160) -> str:
+    """One-line extractive summary: the first sentence, markdown stripped, cut at `max_chars`."""
+    text = re.sub(r"[*_#`>]+", "", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    m = re.match(r"(.+?[.!?])(\s|$)", text)
+    if m and len(m.group(1)) <= max_chars:
+        return m.group(1)
+    return text if len(text) <= max_chars else text[: max_chars - 1].rstrip() + "…"
+
+@dataclass
+class _Turn:
+    role: str
+    text: str
+    line: str
+    tokens: int
+    summary: str
+    summary_tokens: int
+
+@dataclass
+class _Session:
+    turns: list[_Turn] = field(default_factory=list)
+    verbatim_from: int = 0  # turns before this are summarised
+    kept_from: int = 0  # turns before this are dropped
+
+class ConversationContext:
+    """Prior turns of a chat session, rendered into the prompt under a token budget.
+
+    The newest turns go in verbatim, older ones collapse to one-line summaries and the oldest
+    are dropped once even those do not fit. Each turn is tokenised once, when first seen. The
+    verbatim/summary cut-off only moves when the budget overflows, and then frees `headroom`
+    of the budget at once, so the rendered history stays identical for several turns and the
+    model's KV cache for it can be reused.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], budget_tokens: int = 1024, headroom: float = 0.35,
+                 summary_chars: int = 160, max_sessions: int = 256):
+        self.count_tokens = count_tokens
+        self.budget_tokens = budget_tokens
+        self.headroom = headroom
+        self.summary_chars = summary_chars
+        self.max_sessions = max_sessions
+        self.tokenised_turns = 0
+        self._sessions: OrderedDict[str, _Session] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _turn(self, role: str, text: str) -> _Turn:
+        label = ROLE_LABELS.get(role, role.title())
+        line = f"{label}: {text.strip()}"
+        summary = f"- {label}: {summarise_turn(text, self.summary_chars)}"
+        self.tokenised_turns += 1
+        return _Turn(role, text, line, self.count_tokens(line), summary, self.count_tokens(summary))
+
+    @staticmethod
+    def _extends(s: _Session, history: Sequence[tuple[str, str]]) -> bool:
+        # Messages are append-only; anything else (edited or deleted history) starts over
+        if len(history) < len(s.turns):
+            return False
+        if not s.turns:
+            return True
+        last = s.turns[-1]
+        return (last.role, last.text) == tuple(history[len(s.turns) - 1][:2])
+
+    def _session(self, session_id: str | None, history: Sequence[tuple[str, str]]) -> _Session:
+        s = self._sessions.get(session_id) if session_id is not None else None
+        if s is None or not self._extends(s, history):
+            s = _Session()
+        if session_id is not None:
+            self._sessions[session_id] = s
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        for role, text, *_ in history[len(s.turns):]:
+            s.turns.append(self._turn(role, text))
+        return s
+
+    def _cost(self, s: _Session, verbatim_from: int, kept_from: int) -> int:
+        return (sum(t.summary_tokens for t in s.turns[kept_from:verbatim_from])
+                + sum(t.tokens for t in s.turns[verbatim_from:]))
+
+    def render(self, session_id: str | None, history: Sequence[tuple[str, str]]) -> tuple[str, dict]:
+        """History block for `build_user_prompt` from (role, content) turns, plus size stats."""
+        with self._lock:
+            s = self._session(session_id, history)
+            v, k = s.verbatim_from, s.kept_from
+            if self._cost(s, v, k) > self.budget_tokens:
+                target = self.budget_tokens * (1 - self.headroom)
+                while v < len(s.turns) and self._cost(s, v, k) > target:
+                    v += 1
+                while k < v and self._cost(s, v, k) > target:
+                    k += 1
+                s.verbatim_from, s.kept_from = v, k
+
+            lines = [HISTORY_HEADER]
+            if k < v:
+                lines.append(EARLIER_HEADER)
+                lines += [t.summary for t in s.turns[k:v]]
+            lines += [t.line for t in s.turns[v:]]
+            stats = {
+                "history_tokens": self._cost(s, v, k),
+                "turns_verbatim": len(s.turns) - v,
+                "turns_summarised": v - k,
+                "turns_dropped": k,
+            }
+            return "\n".join(lines), stats
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
@@ -1,5 +1,16 @@
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from app.utils.io import read_jsonl
+
+@dataclass
+class RuleMatch:
+    rule_id: str
+    category: str  # unsafe | urgent
+    start: int
+    end: int
+    text: str
 
 @dataclass
 class GuardrailResult:
@@ -7,6 +18,7 @@ class GuardrailResult:
     reason: str = ""
     override_response: str | None = None
     urgency: str = "routine"  # routine | urgent
+    matches: list[RuleMatch] = field(default_factory=list)
 
 UNSAFE_PATTERNS = [
     r"\b(dose|dosage|mg|milligram|prescribe)\b",
@@ -20,27 +32,162 @@ URGENT_SYMPTOMS = [
     r"\b(severe bleeding|passed out|unconscious)\b",
 ]
 
-def run_guardrails(user_text: str) -> GuardrailResult:
-    t = user_text.lower()
+REFUSAL_RESPONSE = (
+    "I can’t help with that request. If this is a medical concern, "
+    "please contact a licensed clinician. If you’re in immediate danger, "
+    "seek local emergency help right now."
+)
+
+@dataclass(frozen=True)
+class Rule:
+    rule_id: str
+    category: str  # unsafe | urgent
+    pattern: str | None = None
+    keywords: tuple[str, ...] = ()
+
+_KEYWORD_RULE = re.compile(r"^\\b\(([\w\s|'-]+)\)\\b$")
+
+def _literal_keywords(pattern: str) -> tuple[str, ...] | None:
+    """`\\b(a|b c)\\b` -> ("a", "b c"); None if the pattern is not a plain keyword list."""
+    m = _KEYWORD_RULE.match(pattern)
+    return tuple(k.lower() for k in m.group(1).split("|")) if m else None
+
+_WORD_CHAR = re.compile(r"\w")
+
+def _trie_regex(words: list[str]) -> str:
+    """Compile keywords into one trie-shaped alternation, so matching cost does not grow with the
+    number of keywords."""
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if end else body
+
+    return emit(trie)
+
+def _at_boundary(text: str, i: int) -> bool:
+    """`\\b` at position i."""
+    before = i > 0 and _WORD_CHAR.match(text[i - 1]) is not None
+    after = i < len(text) and _WORD_CHAR.match(text[i]) is not None
+    return before != after
+
+class GuardrailEngine:
+    """All guardrail rules compiled into combined matchers; every rule reports its own matches.
+
+    Keyword rules (the common `\\b(word|phrase)\\b` shape) share one case-insensitive trie
+    regex, used as a zero-width lookahead to find every position where some keyword starts;
+    from each of those a walk down the keyword trie emits all keywords ending there on a word
+    boundary, so nested and overlapping keywords ("severe bleeding" / "bleeding") of different
+    rules all fire. Other regex rules are searched one by one.
+    """
 
-    for p in UNSAFE_PATTERNS:
-        if re.search(p, t):
+    def __init__(self, rules: list[Rule]):
+        self.rules = list(rules)
+        self._by_id = {r.rule_id: r for r in self.rules}
+
+        self._keyword_rules: dict[str, list[str]] = {}
+        self._regex_rules: list[tuple[Rule, re.Pattern]] = []
+        for r in self.rules:
+            keywords = r.keywords or (_literal_keywords(r.pattern) if r.pattern else None)
+            if keywords:
+                for k in keywords:
+                    self._keyword_rules.setdefault(k.lower(), []).append(r.rule_id)
+            elif r.pattern:
+                self._regex_rules.append((r, re.compile(r.pattern, re.IGNORECASE)))
+
+        self._keyword_re = None
+        self._trie: dict = {}
+        if self._keyword_rules:
+            self._keyword_re = re.compile(r"\b(?=" + _trie_regex(sorted(self._keyword_rules)) + r"\b)", re.IGNORECASE)
+            for k, rule_ids in self._keyword_rules.items():
+                node = self._trie
+                for ch in k:
+                    node = node.setdefault(ch, {})
+                node[""] = rule_ids
+
+    @classmethod
+    def default(cls) -> "GuardrailEngine":
+        rules = [Rule(f"unsafe_{i}", "unsafe", p) for i, p in enumerate(UNSAFE_PATTERNS)]
+        rules += [Rule(f"urgent_{i}", "urgent", p) for i, p in enumerate(URGENT_SYMPTOMS)]
+        return cls(rules)
+
+    @classmethod
+    def from_file(cls, path: str | Path, include_defaults: bool = True) -> "GuardrailEngine":
+        """Load rules from JSONL: {"id", "category", "pattern"} or {"id", "category", "keywords": [...]}."""
+        rules = cls.default().rules if include_defaults else []
+        for i, row in enumerate(read_jsonl(path)):
+            rules.append(Rule(
+                rule_id=row.get("id") or f"rule_{i}",
+                category=row["category"],
+                pattern=row.get("pattern"),
+                keywords=tuple(row.get("keywords") or ()),
+            ))
+        return cls(rules)
+
+    def scan(self, text: str) -> list[RuleMatch]:
+        """Every matched rule with its span, in text order."""
+        matches = []
+        if self._keyword_re is not None:
+            for m in self._keyword_re.finditer(text):
+                node, i = self._trie, m.start()
+                for j in range(i, len(text)):
+                    node = node.get(text[j].lower())
+                    if node is None:
+                        break
+                    if "" in node and _at_boundary(text, j + 1):
+                        for rule_id in node[""]:
+                            matches.append(RuleMatch(rule_id, self._by_id[rule_id].category, i, j + 1, text[i:j + 1]))
+        for rule, pattern in self._regex_rules:
+            for m in pattern.finditer(text):
+                matches.append(RuleMatch(rule.rule_id, rule.category, m.start(), m.end(), m.group(0)))
+        matches.sort(key=lambda x: x.start)
+        return matches
+
+    def check(self, user_text: str) -> GuardrailResult:
+        matches = self.scan(user_text)
+        if any(m.category == "unsafe" for m in matches):
             return GuardrailResult(
                 allowed=False,
                 reason="unsafe_request",
-                override_response=(
-                    "I can’t help with that request. If this is a medical concern, "
-                    "please contact a licensed clinician. If you’re in immediate danger, "
-                    "seek local emergency help right now."
-                )
+                override_response=REFUSAL_RESPONSE,
+                matches=matches,
             )
-
-    for p in URGENT_SYMPTOMS:
-        if re.search(p, t):
+        if any(m.category == "urgent" for m in matches):
             return GuardrailResult(
                 allowed=True,
                 urgency="urgent",
                 reason="urgent_symptoms_detected",
+                matches=matches,
             )
+        return GuardrailResult(allowed=True, matches=matches)
+
+    def check_batch(self, texts: list[str]) -> list[GuardrailResult]:
+        return [self.check(t) for t in texts]
+
+_default_engine: GuardrailEngine | None = None
+
+def get_engine() -> GuardrailEngine:
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = GuardrailEngine.default()
+    return _default_engine
+
+def set_engine(engine: GuardrailEngine):
+    """Swap in a different rule set (e.g. `GuardrailEngine.from_file(...)`)."""
+    global _default_engine
+    _default_engine = engine
+
+def run_guardrails(user_text: str) -> GuardrailResult:
+    return get_engine().check(user_text)
 
-    return GuardrailResult(allowed=True)
+def run_guardrails_batch(texts: list[str]) -> list[GuardrailResult]:
+    return get_engine().check_batch(texts)
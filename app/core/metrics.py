@@ -1,14 +1,235 @@
+import atexit
+import bisect
 import json
+import math
+import os
+import threading
 import time
+from collections import deque
 from pathlib import Path
 
 LOG_PATH = Path("metrics_log.jsonl")
 
+class LatencyHistogram:
+    """Log-spaced buckets (~5% wide, 0.1 ms to ~1 h): constant memory, quantiles within a bucket."""
+
+    def __init__(self, min_s: float = 1e-4, max_s: float = 3600.0, growth: float = 1.05):
+        n = int(math.log(max_s / min_s) / math.log(growth)) + 1
+        self.bounds = [min_s * growth ** i for i in range(n)]
+        self.counts = [0] * (n + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.total += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float | None:
+        if not self.total:
+            return None
+        target = q * self.total
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target and c:
+                return self.bounds[min(i, len(self.bounds) - 1)]
+        return self.bounds[-1]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.total,
+            "mean": self.sum / self.total if self.total else None,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+class MetricsAggregator:
+    """In-process counters and latency histograms, updated from every logged event."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = {"chat": 0, "refusal": 0, "urgent": 0, "sections_ok": 0, "cached": 0,
+                           "section_control": 0, "forced_headings": 0, "stopped_early": 0}
+            self.groundedness_sum = 0.0
+            self.tokens_saved = 0
+            self.latencies: dict[str, LatencyHistogram] = {}
+
+    def observe_latency(self, name: str, seconds: float):
+        with self._lock:
+            self._observe(name, seconds)
+
+    def _observe(self, name: str, seconds: float):
+        hist = self.latencies.get(name)
+        if hist is None:
+            hist = self.latencies[name] = LatencyHistogram()
+        hist.observe(seconds)
+
+    def update(self, event: dict):
+        kind = event.get("type")
+        with self._lock:
+            if kind == "refusal":
+                self.counts["refusal"] += 1
+            elif kind == "chat":
+                self.counts["chat"] += 1
+                self.counts["urgent"] += bool(event.get("urgent"))
+                self.counts["sections_ok"] += bool(event.get("sections_ok"))
+                self.counts["cached"] += bool(event.get("cached"))
+                self.groundedness_sum += float(event.get("groundedness_proxy") or 0.0)
+                for key in ("generation_s", "ttft_s"):
+                    if event.get(key) is not None:
+                        self._observe(key, event[key])
+            elif kind == "section_control":
+                self.counts["section_control"] += 1
+                self.counts["forced_headings"] += int(event.get("forced_headings") or 0)
+                self.counts["stopped_early"] += event.get("stop") is not None
+                self.tokens_saved += int(event.get("tokens_saved") or 0)
+
+    def summary(self) -> dict:
+        with self._lock:
+            chats = self.counts["chat"]
+            requests = chats + self.counts["refusal"]
+            rate = lambda n, d: n / d if d else 0.0
+            return {
+                "requests": requests,
+                "refusal_rate": rate(self.counts["refusal"], requests),
+                "urgent_rate": rate(self.counts["urgent"], chats),
+                "sections_ok_rate": rate(self.counts["sections_ok"], chats),
+                "groundedness_mean": rate(self.groundedness_sum, chats),
+                "cached_rate": rate(self.counts["cached"], chats),
+                "section_stop_rate": rate(self.counts["stopped_early"], self.counts["section_control"]),
+                "tokens_saved_mean": rate(self.tokens_saved, self.counts["section_control"]),
+                "latency": {name: h.summary() for name, h in self.latencies.items()},
+            }
+
+class MetricsLogger:
+    """Background JSONL writer: events are buffered and written in batches off the request thread.
+
+    Writes happen when `max_batch` events are pending or every `flush_interval_s`; the file is
+    rotated past `max_bytes` (keeping `backups` old files). On interpreter shutdown the writer is
+    stopped and joined after it has written everything logged. `log` only appends to a deque
+    under a short lock: if the buffer is full the event is dropped and counted, never blocking.
+    """
+
+    def __init__(self, path: Path | None = None, max_batch: int = 512, flush_interval_s: float = 1.0,
+                 max_bytes: int = 50 * 2**20, backups: int = 5, max_buffer: int = 100_000):
+        self.path = path
+        self.max_batch = max_batch
+        self.flush_interval_s = flush_interval_s
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self.written = 0
+        self._buffer: deque = deque()
+        self._logged = 0  # events accepted by log()
+        self._settled = 0  # of those, written and fsynced (or dropped by a failed write)
+        self._stopping = False
+        self._wake = threading.Event()
+        self._done = threading.Condition()
+        self._worker = threading.Thread(target=self._loop, name="metrics-writer", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+
+    @property
+    def log_path(self) -> Path:
+        # Resolved at write time so LOG_PATH can still be repointed
+        return self.path or LOG_PATH
+
+    def log(self, event: dict):
+        with self._done:
+            # Counts events still being written, so a slow disk cannot grow memory without bound
+            if self._logged - self._settled >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._buffer.append(event)
+            self._logged += 1
+        if len(self._buffer) >= self.max_batch:
+            self._wake.set()
+
+    def flush(self):
+        """Block until everything logged so far is on disk (or dropped)."""
+        with self._done:
+            target = self._logged
+            self._wake.set()
+            self._done.wait_for(lambda: self._settled >= target or not self._worker.is_alive())
+
+    def close(self):
+        """Write out what is pending, then stop the writer thread."""
+        self._stopping = True
+        self._wake.set()
+        self._worker.join()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            stopping = self._stopping
+            while self._buffer:
+                batch = []
+                while self._buffer and len(batch) < self.max_batch * 8:
+                    batch.append(self._buffer.popleft())
+                try:
+                    self._write(batch)
+                except OSError:
+                    self.dropped += len(batch)
+                # Settled only now: a flush() must not return while this batch is still in flight
+                with self._done:
+                    self._settled += len(batch)
+                    self._done.notify_all()
+            if stopping:
+                return
+
+    def _write(self, batch: list[dict]):
+        path = self.log_path
+        with path.open("a", encoding="utf-8") as f:
+            f.write("".join([json.dumps(e, ensure_ascii=False) + "\n" for e in batch]))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        self.written += len(batch)
+        if self.max_bytes and size > self.max_bytes:
+            self._rotate(path)
+
+    def _rotate(self, path: Path):
+        for i in range(self.backups - 1, 0, -1):
+            src = path.with_name(f"{path.stem}.{i}{path.suffix}")
+            if src.exists():
+                src.replace(path.with_name(f"{path.stem}.{i + 1}{path.suffix}"))
+        if self.backups:
+            path.replace(path.with_name(f"{path.stem}.1{path.suffix}"))
+        else:
+            path.unlink()
+
+aggregator = MetricsAggregator()
+_logger: MetricsLogger | None = None
+_logger_lock = threading.Lock()
+
+def get_logger() -> MetricsLogger:
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                _logger = MetricsLogger()
+    return _logger
+
+def flush_metrics():
+    if _logger is not None:
+        _logger.flush()
+
 def log_event(event: dict):
     event = dict(event)
     event["ts"] = time.time()
-    with LOG_PATH.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    aggregator.update(event)
+    get_logger().log(event)
+
+def get_metrics_summary() -> dict:
+    return aggregator.summary()
 
 def has_required_sections(text: str) -> bool:
     required = [
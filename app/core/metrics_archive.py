@@ -0,0 +1,447 @@
+"""Streaming analytics and compaction for metrics_log.jsonl.
+
+`MetricsArchive.update()` reads the log and its rotated backups from where the previous run
+stopped, memory-mapped one chunk at a time, and appends every event as a row of fixed-width
+NumPy column files (time, type, flags, groundedness, generation/TTFT seconds: 22 bytes an
+event instead of ~250 of JSON). An hourly index of column rows and raw-log byte offsets lets
+a time range be read without scanning from the start. Windowed rates are computed over the
+columns block by block, and `compact()` deletes rotated raw logs once they are archived and
+old enough. Memory stays flat however large the log.
+
+  python -m app.core.metrics_archive update
+  python -m app.core.metrics_archive report --window day --last 7
+  python -m app.core.metrics_archive compact --keep-raw-days 7
+"""
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+
+from app.core import metrics
+
+ARCHIVE_DIR = Path("metrics_archive")
+CHUNK_BYTES = 8 * 2**20  # raw log mapped and parsed this much at a time
+BLOCK_ROWS = 2**20  # column rows aggregated at a time
+HOUR_S = 3600
+WINDOWS = {"hour": HOUR_S, "day": 86400}
+# Events are assumed to be logged at most this long out of timestamp order (threads racing to log)
+ORDER_SLACK_S = HOUR_S
+
+KINDS = ("other", "chat", "refusal", "section_control", "achat", "speculative", "response_cache")
+_KIND_CODES = {k.encode(): i for i, k in enumerate(KINDS)}
+CHAT, REFUSAL = _KIND_CODES[b"chat"], _KIND_CODES[b"refusal"]
+URGENT, SECTIONS_OK, CACHED = 1, 2, 4
+COLUMNS = {"ts": "<f8", "kind": "u1", "flags": "u1", "groundedness": "<f4", "generation_s": "<f4", "ttft_s": "<f4"}
+INDEX_DTYPE = np.dtype([("hour", "<i8"), ("row", "<i8"), ("inode", "<i8"), ("offset", "<i8")])
+
+# A logged event (type first, ts last, as log_event writes them), with the chat fields read
+# when they come in the order the orchestrator logs them; any other line matches empty
+_LINE = re.compile(
+    rb'^\{"type": "(\w*)"(?:, "urgent": ([tf])\w*, "sections_ok": ([tf])\w*, "groundedness_proxy": ([^,\n]*), '
+    rb'"cached": ([tf])\w*, "generation_s": ([^,\n]*), "ttft_s": ([^,\n]*))?[^\n]*, "ts": ([-+.\deE]+)\}$'
+    rb'|^[^\n]*$',
+    re.MULTILINE,
+)
+
+def parse_line(line: bytes) -> tuple[float, int, int, float, float, float]:
+    """(ts, kind, flags, groundedness, generation_s, ttft_s) of one JSON event line.
+
+    Raises ValueError (or KeyError/TypeError) for a line that is not a logged event.
+    """
+    event = json.loads(line)
+    if not isinstance(event, dict):
+        raise ValueError("not an event")
+    num = lambda key: math.nan if event.get(key) is None else float(event[key])
+    flags = bool(event.get("urgent")) * URGENT | bool(event.get("sections_ok")) * SECTIONS_OK | bool(event.get("cached")) * CACHED
+    return (float(event["ts"]), _KIND_CODES.get(str(event.get("type")).encode(), 0), flags, num("groundedness_proxy"),
+            num("generation_s"), num("ttft_s"))
+
+def _floats(a: np.ndarray, dtype) -> np.ndarray:
+    a = a.astype(f"S{max(a.itemsize, 3)}")  # room for "nan"
+    a[(a == b"") | (a == b"null")] = b"nan"
+    return a.astype(dtype)
+
+def parse_chunk(data: bytes) -> tuple[dict[str, np.ndarray], np.ndarray, int]:
+    """Columns and line start offsets of the lines in data (complete lines only), and how many were bad.
+
+    The fast path matches every line of the chunk with one regex call and converts fields
+    as whole arrays; lines in another shape (older event layouts, nested values, corrupt
+    writes) go through json.loads one by one.
+    """
+    starts = np.flatnonzero(np.frombuffer(data, np.uint8) == 10)
+    ends, starts = starts, np.concatenate(([0], starts[:-1] + 1))
+    fields = _LINE.findall(data[:-1])
+    if len(fields) != len(starts):
+        fields = [_LINE.fullmatch(line).groups() for line in data[:-1].split(b"\n")]
+    kind, urgent, sections_ok, grounded, cached, gen, ttft, ts = map(np.array, zip(*fields))
+    slow = (ts == b"") | ((kind == b"chat") & (urgent == b""))
+    cols = {"ts": _floats(ts, "<f8"), "kind": np.zeros(len(starts), np.uint8)}
+    for name, code in _KIND_CODES.items():
+        cols["kind"][kind == name] = code
+    cols["flags"] = ((urgent == b"t") * URGENT | (sections_ok == b"t") * SECTIONS_OK | (cached == b"t") * CACHED).astype(np.uint8)
+    cols["groundedness"] = _floats(grounded, "<f4")
+    cols["generation_s"] = _floats(gen, "<f4")
+    cols["ttft_s"] = _floats(ttft, "<f4")
+
+    keep = np.ones(len(starts), bool)
+    for i in np.flatnonzero(slow).tolist():
+        try:
+            values = parse_line(data[starts[i]:ends[i]])
+        except (ValueError, KeyError, TypeError):
+            keep[i] = False
+            continue
+        for name, v in zip(COLUMNS, values):
+            cols[name][i] = v
+    bad = len(keep) - int(keep.sum())
+    if bad:
+        cols = {name: c[keep] for name, c in cols.items()}
+        starts = starts[keep]
+    return cols, starts, bad
+
+def _chunks(f, offset: int, size: int) -> Iterator[tuple[int, bytes]]:
+    """(offset, data) runs of complete lines from offset up to the last newline before size.
+
+    Each chunk gets its own mapping, released before the next, so resident memory stays at
+    one chunk. A trailing line without its newline is still being written and is left for later.
+    """
+    span = CHUNK_BYTES
+    while offset < size:
+        base = offset - offset % mmap.ALLOCATIONGRANULARITY
+        end = min(size, offset + span)
+        with mmap.mmap(f.fileno(), end - base, access=mmap.ACCESS_READ, offset=base) as mm:
+            cut = mm.rfind(b"\n", offset - base)
+            if cut < 0:
+                if end == size:
+                    return
+                span *= 2  # a line longer than a chunk
+                continue
+            data = mm[offset - base:cut + 1]
+        yield offset, data
+        offset = base + cut + 1
+        span = CHUNK_BYTES
+
+@dataclass
+class UpdateReport:
+    events: int = 0
+    bad_lines: int = 0
+    bytes_read: int = 0
+    files: int = 0
+    elapsed_s: float = 0.0
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.bytes_read / 2**20 / self.elapsed_s if self.elapsed_s else 0.0
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "mb_per_s": round(self.mb_per_s, 1)}
+
+class MetricsArchive:
+    """Columnar archive of a metrics log, updated incrementally.
+
+    `state.json` records which log file (by inode and first bytes, so rotation renames are
+    followed) and byte offset the last update reached, plus the row counts it committed;
+    column files are cut back to those counts before appending, so an interrupted update
+    is simply redone.
+    """
+
+    def __init__(self, path: Path | None = None, log_path: Path | None = None):
+        self.path = Path(path or ARCHIVE_DIR)
+        self._log_path = log_path
+
+    @property
+    def log_path(self) -> Path:
+        # Resolved at use so metrics.LOG_PATH can still be repointed
+        return Path(self._log_path or metrics.LOG_PATH)
+
+    # --- state and files ---
+    def _load_state(self) -> dict:
+        try:
+            return json.loads((self.path / "state.json").read_text())
+        except FileNotFoundError:
+            return {"inode": None, "head": None, "offset": 0, "rows": 0, "index_rows": 0, "max_ts": None,
+                    "bad_lines": 0}
+
+    def _save_state(self, state: dict):
+        tmp = self.path / "state.json.tmp"
+        tmp.write_text(json.dumps(state))
+        tmp.replace(self.path / "state.json")
+
+    def _log_files(self) -> list[Path]:
+        """Rotated backups oldest first (MetricsLogger names them stem.N.suffix), then the live log."""
+        log = self.log_path
+        backups = []
+        for p in log.parent.glob(f"{log.stem}.*{log.suffix}"):
+            n = p.name[len(log.stem) + 1:len(p.name) - len(log.suffix)]
+            if n.isdigit():
+                backups.append((int(n), p))
+        return [p for _, p in sorted(backups, reverse=True)] + ([log] if log.exists() else [])
+
+    @staticmethod
+    def _head(path: Path) -> str:
+        with path.open("rb") as f:
+            return f.read(64).hex()
+
+    @property
+    def rows(self) -> int:
+        return self._load_state()["rows"]
+
+    def _column(self, name: str) -> np.ndarray:
+        p = self.path / f"{name}.bin"
+        if not p.exists() or p.stat().st_size == 0:
+            return np.zeros(0, COLUMNS[name])
+        return np.memmap(p, dtype=COLUMNS[name], mode="r")
+
+    def _index(self) -> np.ndarray:
+        p = self.path / "index.bin"
+        if not p.exists() or p.stat().st_size == 0:
+            return np.zeros(0, INDEX_DTYPE)
+        return np.memmap(p, dtype=INDEX_DTYPE, mode="r")
+
+    # --- ingest ---
+    def update(self, on_progress: Callable[[UpdateReport], None] | None = None) -> UpdateReport:
+        """Archive every complete event logged since the previous update."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        state = self._load_state()
+        for name, dtype in COLUMNS.items():
+            self._truncate(self.path / f"{name}.bin", state["rows"] * np.dtype(dtype).itemsize)
+        self._truncate(self.path / "index.bin", state["index_rows"] * INDEX_DTYPE.itemsize)
+
+        files = self._log_files()
+        start = 0
+        for i, p in enumerate(files):
+            # The head only grows while a file is written, so a match on its prefix is the same file
+            if p.stat().st_ino == state["inode"] and self._head(p).startswith(state["head"] or ""):
+                start = i
+                break
+        else:
+            state["offset"] = 0  # first run, or the file we were reading is gone: take what is left
+
+        report = UpdateReport()
+        t0 = time.perf_counter()
+        outs = {name: (self.path / f"{name}.bin").open("ab") for name in COLUMNS}
+        index_out = (self.path / "index.bin").open("ab")
+        try:
+            for p in files[start:]:
+                with p.open("rb") as f:
+                    st = os.fstat(f.fileno())
+                    if st.st_ino != state["inode"]:
+                        state.update(inode=st.st_ino, head="", offset=0)
+                    if st.st_size < state["offset"]:
+                        state["offset"] = 0  # truncated and rewritten
+                    report.files += 1
+                    for offset, data in _chunks(f, state["offset"], st.st_size):
+                        self._ingest(data, offset, state, outs, index_out, report)
+                        for out in (*outs.values(), index_out):
+                            out.flush()
+                        state["offset"] = offset + len(data)
+                        state["head"] = self._head(p)
+                        self._save_state(state)
+                        report.bytes_read += len(data)
+                        report.elapsed_s = time.perf_counter() - t0
+                        if on_progress is not None:
+                            on_progress(report)
+        finally:
+            for out in (*outs.values(), index_out):
+                out.close()
+        report.elapsed_s = time.perf_counter() - t0
+        return report
+
+    @staticmethod
+    def _truncate(path: Path, size: int):
+        if path.exists() and path.stat().st_size > size:
+            with path.open("r+b") as f:
+                f.truncate(size)
+
+    def _ingest(self, data: bytes, offset: int, state: dict, outs: dict, index_out, report: UpdateReport):
+        cols, starts, bad = parse_chunk(data)
+        for name, dtype in COLUMNS.items():
+            outs[name].write(cols[name].astype(dtype, copy=False).tobytes())
+        # Index the first event of each new hour (by running max, so a late event does not start
+        # an hour twice): where it sits in the columns and in the raw log
+        prev = state["max_ts"] if state["max_ts"] is not None else -math.inf
+        running = np.fmax.accumulate(np.concatenate(([prev], cols["ts"])))
+        hours = np.floor(running / HOUR_S)
+        new = np.flatnonzero(hours[1:] > hours[:-1])
+        index = np.zeros(len(new), INDEX_DTYPE)
+        index["hour"] = hours[1:][new]
+        index["row"] = state["rows"] + new
+        index["inode"] = state["inode"]
+        index["offset"] = offset + starts[new]
+        index_out.write(index.tobytes())
+
+        report.events += len(starts)
+        report.bad_lines += bad
+        state["bad_lines"] += bad
+        max_ts = float(running[-1])
+        state.update(rows=state["rows"] + len(starts), max_ts=max_ts if max_ts > -math.inf else None,
+                     index_rows=state["index_rows"] + len(new))
+
+    # --- queries ---
+    def _row_range(self, start: float | None, end: float | None) -> tuple[int, int]:
+        """Column rows that can hold events in [start, end), found from the hourly index."""
+        rows, index = self.rows, self._index()
+        lo, hi = 0, rows
+        if start is not None and len(index):
+            i = np.searchsorted(index["hour"], math.floor((start - ORDER_SLACK_S) / HOUR_S), side="right") - 1
+            lo = int(index["row"][i]) if i >= 0 else 0
+        if end is not None and len(index):
+            i = np.searchsorted(index["hour"], math.floor((end + ORDER_SLACK_S) / HOUR_S) + 1)
+            hi = int(index["row"][i]) if i < len(index) else rows
+        return lo, min(hi, rows)
+
+    def read(self, start: float | None = None, end: float | None = None) -> dict[str, np.ndarray]:
+        """Column arrays of the events in [start, end) (unix seconds), in log order."""
+        lo, hi = self._row_range(start, end)
+        cols = {name: np.asarray(self._column(name)[lo:hi]) for name in COLUMNS}
+        ts = cols["ts"]
+        mask = np.ones(len(ts), bool)
+        if start is not None:
+            mask &= ts >= start
+        if end is not None:
+            mask &= ts < end
+        return {name: c[mask] for name, c in cols.items()}
+
+    def window_rates(self, window: str = "hour", start: float | None = None, end: float | None = None,
+                     utc_offset_s: int = 0) -> list[dict]:
+        """Per-window request counts and rates, oldest first, named as in get_metrics_summary.
+
+        Windows are aligned to local midnight/hours via `utc_offset_s`; empty windows are left out.
+        """
+        bucket_s = WINDOWS[window]
+        lo, hi = self._row_range(start, end)
+        cols = {name: self._column(name) for name in ("ts", "kind", "flags", "groundedness")}
+        totals: dict[int, np.ndarray] = {}  # window -> requests, chats, refusals, urgent, sections_ok, groundedness
+        for b in range(lo, hi, BLOCK_ROWS):
+            ts = np.asarray(cols["ts"][b:min(b + BLOCK_ROWS, hi)])
+            kind = np.asarray(cols["kind"][b:b + len(ts)])
+            flags = np.asarray(cols["flags"][b:b + len(ts)])
+            g = np.asarray(cols["groundedness"][b:b + len(ts)], dtype=np.float64)
+            keep = (kind == CHAT) | (kind == REFUSAL)
+            if start is not None:
+                keep &= ts >= start
+            if end is not None:
+                keep &= ts < end
+            ts, kind, flags, g = ts[keep], kind[keep], flags[keep], g[keep]
+            if not len(ts):
+                continue
+            window = np.floor((ts + utc_offset_s) / bucket_s).astype(np.int64)
+            first = int(window.min())
+            inv = window - first
+            chat = kind == CHAT
+            per = np.stack([
+                np.bincount(inv),
+                np.bincount(inv, weights=chat),
+                np.bincount(inv, weights=~chat),
+                np.bincount(inv, weights=chat & ((flags & URGENT) > 0)),
+                np.bincount(inv, weights=chat & ((flags & SECTIONS_OK) > 0)),
+                # Missing groundedness counts as 0, as in MetricsAggregator
+                np.bincount(inv, weights=np.where(chat, np.nan_to_num(g), 0.0)),
+            ], axis=1)
+            for i in np.flatnonzero(per[:, 0]).tolist():
+                w = first + i
+                totals[w] = totals[w] + per[i] if w in totals else per[i]
+        rate = lambda n, d: n / d if d else 0.0
+        out = []
+        for w in sorted(totals):
+            requests, chats, refusals, urgent, sections_ok, grounded = totals[w]
+            out.append({
+                "start": w * bucket_s - utc_offset_s,
+                "requests": int(requests),
+                "refusal_rate": rate(refusals, requests),
+                "urgent_rate": rate(urgent, chats),
+                "sections_ok_rate": rate(sections_ok, chats),
+                "groundedness_mean": rate(grounded, chats),
+            })
+        return out
+
+    def raw_events(self, start: float, end: float) -> Iterator[dict]:
+        """Raw events in [start, end) still present in the log files, read from the indexed byte offset."""
+        index = self._index()
+        i = np.searchsorted(index["hour"], math.floor((start - ORDER_SLACK_S) / HOUR_S), side="right") - 1
+        files = self._log_files()
+        inodes = [p.stat().st_ino for p in files]
+        first, offset = 0, 0
+        if i >= 0 and int(index["inode"][i]) in inodes:
+            first, offset = inodes.index(int(index["inode"][i])), int(index["offset"][i])
+        for p in files[first:]:
+            with p.open("rb") as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue
+                    ts = event.get("ts", 0)
+                    if ts >= end + ORDER_SLACK_S:
+                        return
+                    if start <= ts < end:
+                        yield event
+            offset = 0
+
+    # --- compaction ---
+    def compact(self, keep_raw_s: float = 7 * 86400, now: float | None = None) -> list[Path]:
+        """Archive what is new, then delete rotated logs that are archived and last written before keep_raw_s ago.
+
+        The live log is never touched; MetricsLogger's rotation bounds its size.
+        """
+        self.update()
+        state = self._load_state()
+        now = time.time() if now is None else now
+        removed = []
+        for p in self._log_files():
+            st = p.stat()
+            current = st.st_ino == state["inode"]
+            if p == self.log_path or (current and state["offset"] < st.st_size):
+                break  # still being written or read, and everything after it
+            # Re-checked by inode: a rotation may have renamed another file onto this name
+            if st.st_mtime < now - keep_raw_s and p.stat().st_ino == st.st_ino:
+                p.unlink()
+                removed.append(p)
+            if current:
+                break
+        return removed
+
+def format_rates(rows: list[dict], window: str) -> str:
+    fmt = "%Y-%m-%d %H:00" if window == "hour" else "%Y-%m-%d"
+    lines = [f"{window:16s} {'requests':>9s} {'refusal':>8s} {'urgent':>8s} {'sections':>9s} {'grounded':>9s}"]
+    for r in rows:
+        lines.append(f"{time.strftime(fmt, time.localtime(r['start'])):16s} {r['requests']:9d} "
+                     f"{r['refusal_rate']:8.1%} {r['urgent_rate']:8.1%} {r['sections_ok_rate']:9.1%} "
+                     f"{r['groundedness_mean']:9.2f}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("command", choices=["update", "report", "compact"])
+    ap.add_argument("--log", type=Path, default=None, help=f"metrics log (default {metrics.LOG_PATH})")
+    ap.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    ap.add_argument("--window", choices=list(WINDOWS), default="hour")
+    ap.add_argument("--last", type=int, default=24, help="report the last N windows")
+    ap.add_argument("--keep-raw-days", type=float, default=7.0)
+    args = ap.parse_args(argv)
+
+    archive = MetricsArchive(args.archive, args.log)
+    if args.command == "compact":
+        for p in archive.compact(args.keep_raw_days * 86400):
+            print(f"removed {p}")
+        return
+    report = archive.update(on_progress=lambda r: print(f"\r{r.bytes_read / 2**20:,.0f} MB, {r.mb_per_s:,.0f} MB/s",
+                                                         end="", flush=True))
+    print()
+    if args.command == "update":
+        print(json.dumps(report.as_dict(), indent=2))
+        return
+    utc_offset_s = time.localtime().tm_gmtoff
+    start = (math.floor((time.time() + utc_offset_s) / WINDOWS[args.window]) - args.last + 1) * WINDOWS[args.window] - utc_offset_s
+    print(format_rates(archive.window_rates(args.window, start=start, utc_offset_s=utc_offset_s), args.window))
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,75 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Sequence
+
 from PIL import Image
+from app.core import tracing
+from app.core.conversation import ConversationContext, token_counter
 from app.core.prompts import build_user_prompt
-from app.core.guardrails import run_guardrails
+from app.core.guardrails import run_guardrails, GuardrailResult
 from app.core.metrics import log_event, has_required_sections, groundedness_proxy
+from app.core.response_cache import CacheKey, ResponseCache
+from app.utils.images import decode_image
+
+GENERATION_PARAMS = {"max_new_tokens": 650, "temperature": 0.2}
+
+URGENT_NOTE = (
+    "⚠️ **Urgent note:** Some symptoms you mentioned can be serious. "
+    "If you feel unsafe or symptoms are severe/worsening, seek urgent care or local emergency services.\n\n"
+)
+
+# Per-stage limits for achat, in seconds; "generate" runs from the first token request to the last
+STAGE_TIMEOUTS_S = {
+    "transcribe": 120.0,
+    "image": 30.0,
+    "guardrails": 5.0,
+    "generate": 600.0,
+    "persist": 10.0,
+    "post_check": 10.0,
+}
+
+class StageTimeout(TimeoutError):
+    def __init__(self, stage: str, timeout_s: float):
+        super().__init__(f"{stage} did not finish within {timeout_s:g}s")
+        self.stage = stage
+        self.timeout_s = timeout_s
+
+class NoQuestion(ValueError):
+    pass
+
+@dataclass
+class ChatResult:
+    answer: str
+    question: str
+    refused: bool = False
+    cached: bool = False
+    timings: dict[str, float] = field(default_factory=dict)  # stage -> seconds, plus "total"
 
 class Orchestrator:
-    def __init__(self, medgemma_client, medasr_client=None):
+    def __init__(self, medgemma_client, medasr_client=None, response_cache: ResponseCache | None = None,
+                 context: ConversationContext | None = None, timeouts: dict[str, float] | None = None,
+                 max_workers: int = 4):
         self.medgemma = medgemma_client
         self.medasr = medasr_client
+        self.response_cache = response_cache
+        self.context = context or ConversationContext(token_counter(medgemma_client))
+        self.timeouts = {**STAGE_TIMEOUTS_S, **(timeouts or {})}
+        # Blocking stages of achat (ASR, image prep, generation, DB writes) run here
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="orchestrator")
+
+    def close(self):
+        """Stop the stage pool's threads, after the stages still running finish."""
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "Orchestrator":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def transcribe_if_audio(self, audio_path: str | None) -> str | None:
         if not audio_path:
@@ -15,33 +78,300 @@ class Orchestrator:
             return None
         return self.medasr.transcribe(audio_path)
 
-    def chat(self, user_id: str, user_question: str, pasted_text: str | None, image: Image.Image | None):
-        gr = run_guardrails(user_question + "\n" + (pasted_text or ""))
+    def _check(self, user_question: str, pasted_text: str | None) -> GuardrailResult:
+        with tracing.span("guardrails"):
+            gr = run_guardrails(user_question + "\n" + (pasted_text or ""))
         if not gr.allowed:
             log_event({"type": "refusal", "reason": gr.reason})
-            return gr.override_response
+        return gr
 
-        prompt = build_user_prompt(user_question, pasted_text)
+    def _cache_lookup(self, user_question: str, pasted_text: str | None, image) -> tuple[CacheKey | None, str | None]:
+        if self.response_cache is None:
+            return None, None
+        with tracing.span("response_cache") as sp:
+            key = CacheKey.build(user_question, pasted_text, image, **self._cache_params())
+            answer, tier = self.response_cache.get(key)
+            sp.set(tier=tier)
+        log_event({"type": "response_cache", "tier": tier, "hit_rate": round(self.response_cache.hit_rate, 4)})
+        return key, answer
 
-        answer = self.medgemma.generate(prompt=prompt, image=image, max_new_tokens=650, temperature=0.2)
+    def _cache_params(self) -> dict:
+        """What a cached answer depends on besides the question and attachments: a different
+        model or section-control mode must not be served another's answers."""
+        sections = (getattr(self.medgemma, "supports_sections", False)
+                    and getattr(self.medgemma, "section_control", True))
+        return {**GENERATION_PARAMS, "model": getattr(self.medgemma, "model_id", None), "sections": bool(sections)}
 
+    def _generation_params(self, gr: GuardrailResult | None, session_id: str | None = None) -> dict:
+        params = dict(GENERATION_PARAMS)
+        # Queued backends (the model server client) serve urgent requests first
+        if gr is not None and getattr(self.medgemma, "accepts_priority", False):
+            params["priority"] = "urgent" if gr.urgency == "urgent" else "routine"
+        if session_id is not None and getattr(self.medgemma, "supports_session_cache", False):
+            params["session_id"] = session_id
+        # Cap rambling sections and stop once "What this is based on" is complete
+        if getattr(self.medgemma, "supports_sections", False):
+            params["sections"] = True
+        return params
+
+    def _build_prompt(self, user_question: str, pasted_text: str | None, session_id: str | None,
+                      history: Sequence[tuple[str, str]] | None) -> tuple[str, int]:
+        with tracing.span("build_prompt") as sp:
+            history_block, history_tokens = None, 0
+            if history:
+                history_block, stats = self.context.render(session_id, history)
+                history_tokens = stats["history_tokens"]
+                sp.set(**stats)
+            return build_user_prompt(user_question, pasted_text, history_block), history_tokens
+
+    def _post_check(self, answer: str, pasted_text: str | None, gr: GuardrailResult, cached: bool = False,
+                    generation_s: float | None = None, ttft_s: float | None = None, history_tokens: int = 0):
         # Light post-check + logging
-        sec_ok = has_required_sections(answer)
-        ground = groundedness_proxy(answer, pasted_text)
+        with tracing.span("post_check"):
+            sec_ok = has_required_sections(answer)
+            ground = groundedness_proxy(answer, pasted_text)
 
         log_event({
             "type": "chat",
             "urgent": (gr.urgency == "urgent"),
             "sections_ok": sec_ok,
-            "groundedness_proxy": ground
+            "groundedness_proxy": ground,
+            "cached": cached,
+            "generation_s": generation_s,
+            "ttft_s": ttft_s,
+            "history_tokens": history_tokens,
         })
 
-        # If urgent symptoms, prepend a cautious note
+    def chat(self, user_id: str, user_question: str, pasted_text: str | None, image: Image.Image | None,
+             session_id: str | None = None, history: Sequence[tuple[str, str]] | None = None):
+        """`history` is the session's earlier (role, content) turns, oldest first."""
+        with tracing.span("chat"):
+            gr = self._check(user_question, pasted_text)
+            if not gr.allowed:
+                return gr.override_response
+
+            # Cached answers are stored without the urgent note; guardrails above always run.
+            # Answers that depend on earlier turns are not shared through the cache.
+            key, answer = self._cache_lookup(user_question, pasted_text, image) if not history else (None, None)
+            cached = answer is not None
+            generation_s = None
+            history_tokens = 0
+            if not cached:
+                prompt, history_tokens = self._build_prompt(user_question, pasted_text, session_id, history)
+                t0 = time.perf_counter()
+                answer = self.medgemma.generate(prompt=prompt, image=image, **self._generation_params(gr, session_id))
+                generation_s = time.perf_counter() - t0
+                if key is not None:
+                    self.response_cache.put(key, answer)
+
+            self._post_check(answer, pasted_text, gr, cached=cached, generation_s=generation_s,
+                             history_tokens=history_tokens)
+
+            # If urgent symptoms, prepend a cautious note
+            if gr.urgency == "urgent":
+                answer = URGENT_NOTE + answer
+
+            return answer
+
+    def chat_stream(
+        self, user_id: str, user_question: str, pasted_text: str | None, image: Image.Image | None,
+        session_id: str | None = None, history: Sequence[tuple[str, str]] | None = None,
+    ) -> Iterator[str]:
+        """Streaming variant of `chat`: yields text deltas; the joined deltas equal `chat`'s answer."""
+        with tracing.span("chat", stream=True):
+            yield from self._chat_stream(user_question, pasted_text, image, session_id, history)
+
+    def _chat_stream(self, user_question: str, pasted_text: str | None, image, session_id: str | None,
+                     history: Sequence[tuple[str, str]] | None) -> Iterator[str]:
+        gr = self._check(user_question, pasted_text)
+        if not gr.allowed:
+            yield gr.override_response
+            return
+
+        # The urgent note goes out first so it is visible before the model starts talking
         if gr.urgency == "urgent":
-            answer = (
-                "⚠️ **Urgent note:** Some symptoms you mentioned can be serious. "
-                "If you feel unsafe or symptoms are severe/worsening, seek urgent care or local emergency services.\n\n"
-                + answer
-            )
+            yield URGENT_NOTE
+
+        key, answer = self._cache_lookup(user_question, pasted_text, image) if not history else (None, None)
+        if answer is not None:
+            yield answer
+            self._post_check(answer, pasted_text, gr, cached=True)
+            return
+
+        prompt, history_tokens = self._build_prompt(user_question, pasted_text, session_id, history)
+
+        parts = []
+        ttft_s = None
+        t0 = time.perf_counter()
+        for delta in self.medgemma.generate_stream(prompt=prompt, image=image, **self._generation_params(gr, session_id)):
+            if ttft_s is None:
+                ttft_s = time.perf_counter() - t0
+            parts.append(delta)
+            yield delta
+        generation_s = time.perf_counter() - t0
+
+        answer = "".join(parts).strip()
+        if key is not None:
+            self.response_cache.put(key, answer)
+        self._post_check(answer, pasted_text, gr, generation_s=generation_s, ttft_s=ttft_s,
+                         history_tokens=history_tokens)
+
+    async def _stage(self, stage: str, timings: dict, fn: Callable, *args):
+        """Run blocking `fn` on the pool under the stage's timeout ("persist.user" uses "persist")."""
+        timeout_s = self.timeouts[stage.split(".")[0]]
+        t0 = time.perf_counter()
+        # Pool threads do not inherit context variables; the copy keeps the stage's spans in the request's trace
+        ctx = contextvars.copy_context()
+        try:
+            return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(self._pool, ctx.run, fn, *args), timeout_s)
+        except asyncio.TimeoutError:
+            raise StageTimeout(stage, timeout_s) from None
+        finally:
+            timings[stage] = round(time.perf_counter() - t0, 6)
+
+    def _load_image(self, image):
+        """Decode upload bytes and run the processor's image preprocessing ahead of generation."""
+        if isinstance(image, (bytes, bytearray)):
+            cache = getattr(self.medgemma, "image_cache", None)
+            image = cache.load_image(bytes(image)) if cache is not None else decode_image(bytes(image))
+        prepare = getattr(self.medgemma, "prepare_image", None)
+        if prepare is not None:
+            prepare(image)
+        return image
+
+    def _stream_into(self, loop, queue: asyncio.Queue, prompt: str, image, params: dict, cancel: threading.Event):
+        """Pool thread: push generated deltas onto `queue`, then an exception if one occurred, then None."""
+        def push(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass  # the event loop is gone (request abandoned)
+
+        if getattr(self.medgemma, "supports_cancel", False):
+            params = {**params, "cancel": cancel}
+        try:
+            for delta in self.medgemma.generate_stream(prompt=prompt, image=image, **params):
+                if cancel.is_set():
+                    break
+                push(delta)
+        except Exception as e:
+            push(e)
+        push(None)
+
+    async def achat(
+        self, user_id: str, user_question: str | None = None, pasted_text: str | None = None, image=None,
+        audio_path: str | None = None, session_id: str | None = None,
+        history: Sequence[tuple[str, str]] | None = None, on_delta: Callable[[str], None] | None = None,
+        persist: Callable[[str, str], None] | None = None,
+    ) -> ChatResult:
+        """Async `chat` with independent stages overlapped on the orchestrator's thread pool.
+
+        Transcription of `audio_path` (which, when it yields text, replaces `user_question`)
+        and decoding/preprocessing of `image` (a PIL image or upload bytes) run concurrently.
+        Generation starts once both are ready, alongside guardrails, and is cancelled if they
+        refuse. `on_delta` gets the answer as it streams, urgent note first; `persist(role,
+        content)` stores the question and answer off the event loop. Cancelling the task, or
+        an exception from `on_delta`, stops generation at the next token. A stage that runs
+        past its timeout raises StageTimeout.
+        """
+        # One trace per request: stage tasks and pool threads run in copies of this context
+        with tracing.span("chat", stream=True, audio=bool(audio_path), image=image is not None):
+            return await self._achat(user_question, pasted_text, image, audio_path, session_id, history, on_delta, persist)
+
+    async def _achat(self, user_question, pasted_text, image, audio_path, session_id, history, on_delta,
+                     persist) -> ChatResult:
+        t_start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        timings: dict[str, float] = {}
+        cancel = threading.Event()
+        queue: asyncio.Queue = asyncio.Queue()
+        emit = on_delta or (lambda delta: None)
+        background: list[asyncio.Task] = []  # DB writes and logging, awaited before returning
+        image_task = gr_task = None
+        if image is not None:
+            image_task = asyncio.create_task(self._stage("image", timings, self._load_image, image))
+
+        try:
+            question = user_question
+            if audio_path:
+                question = await self._stage("transcribe", timings, self.transcribe_if_audio, audio_path) or question
+            if not question or not question.strip():
+                raise NoQuestion("no question: type one or record audio")
+            if persist is not None:
+                background.append(asyncio.create_task(self._stage("persist.user", timings, persist, "user", question)))
+
+            gr_task = asyncio.create_task(self._stage("guardrails", timings, self._check, question, pasted_text))
+            if image_task is not None:
+                image = await image_task
+            if getattr(self.medgemma, "accepts_priority", False):
+                # Queued backends need the urgency to pick the request's priority
+                await gr_task
+
+            key, answer = self._cache_lookup(question, pasted_text, image) if not history else (None, None)
+            cached = answer is not None
+            history_tokens = 0
+            if not cached:
+                prompt, history_tokens = self._build_prompt(question, pasted_text, session_id, history)
+                params = self._generation_params(gr_task.result() if gr_task.done() else None, session_id)
+                t_gen = time.perf_counter()
+                loop.run_in_executor(self._pool, contextvars.copy_context().run, self._stream_into, loop, queue,
+                                     prompt, image, params, cancel)
+
+            gr = await gr_task
+            if not gr.allowed:
+                cancel.set()
+                emit(gr.override_response)
+                if persist is not None:
+                    # The refusal is saved as the reply, as chat() callers did before achat
+                    background.append(asyncio.create_task(
+                        self._stage("persist.answer", timings, persist, "assistant", gr.override_response)))
+                await asyncio.gather(*background)
+                timings["total"] = round(time.perf_counter() - t_start, 6)
+                return ChatResult(gr.override_response, question, refused=True, timings=timings)
+
+            # The urgent note goes out first so it is visible before the model starts talking
+            if gr.urgency == "urgent":
+                emit(URGENT_NOTE)
+
+            generation_s = ttft_s = None
+            if cached:
+                emit(answer)
+            else:
+                parts = []
+                timeout_s = self.timeouts["generate"]
+                deadline = t_gen + timeout_s
+                try:
+                    while (item := await asyncio.wait_for(queue.get(), max(0.0, deadline - time.perf_counter()))) \
+                            is not None and not isinstance(item, Exception):
+                        if ttft_s is None:
+                            ttft_s = time.perf_counter() - t_gen
+                        parts.append(item)
+                        emit(item)
+                except asyncio.TimeoutError:
+                    raise StageTimeout("generate", timeout_s) from None
+                if isinstance(item, Exception):
+                    raise item
+                generation_s = time.perf_counter() - t_gen
+                timings["generate"] = round(generation_s, 6)
+                answer = "".join(parts).strip()
+                if key is not None:
+                    self.response_cache.put(key, answer)
 
-        return answer
+            final = URGENT_NOTE + answer if gr.urgency == "urgent" else answer
+            background.append(asyncio.create_task(self._stage(
+                "post_check", timings, self._post_check, answer, pasted_text, gr, cached, generation_s, ttft_s,
+                history_tokens,
+            )))
+            if persist is not None:
+                background.append(asyncio.create_task(self._stage("persist.answer", timings, persist, "assistant", final.strip())))
+            await asyncio.gather(*background)
+            timings["total"] = round(time.perf_counter() - t_start, 6)
+            log_event({"type": "achat", "stages": timings, "audio": bool(audio_path), "image": image is not None})
+            return ChatResult(final, question, cached=cached, timings=timings)
+        except BaseException:
+            # Refused, abandoned (task cancelled, on_delta raised) or timed out: stop generating
+            cancel.set()
+            for task in [image_task, gr_task, *background]:
+                if task is not None and not task.done():
+                    task.cancel()
+            raise
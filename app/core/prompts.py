@@ -16,12 +16,16 @@ You MUST NOT:
 If symptoms suggest emergency, advise seeking urgent care / local emergency services.
 """
 
-def build_user_prompt(user_question: str, pasted_text: str | None) -> str:
+def build_user_prompt(user_question: str, pasted_text: str | None, history_block: str | None = None) -> str:
     context_block = ""
     if pasted_text and pasted_text.strip():
         context_block = f"\n\nUSER-PROVIDED REPORT / NOTES:\n{pasted_text.strip()}\n"
 
-    return f"""{SYSTEM_STYLE}
+    # Prior turns sit between the fixed preamble and the question, so a follow-up prompt
+    # repeats the previous one's prefix and its KV cache can be reused
+    history = f"\n\n{history_block.strip()}" if history_block else ""
+
+    return f"""{SYSTEM_STYLE}{history}
 
 USER QUESTION:
 {user_question.strip()}
@@ -0,0 +1,205 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Sequence
+
+import numpy as np
+
+from app.db.store import DB_PATH
+from app.utils.images import image_key
+
+CACHE_DB_PATH = DB_PATH.with_name("response_cache.db")
+
+def normalize_question(question: str) -> str:
+    t = question.lower().strip()
+    t = re.sub(r"[^\w\s]", " ", t)
+    return re.sub(r"\s+", " ", t).strip()
+
+def text_hash(text: str | None) -> str:
+    if not text or not text.strip():
+        return ""
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+def image_hash(image) -> str:
+    # Shares the hash computed for the image preprocessing cache
+    return image_key(image) if image is not None else ""
+
+def hashed_ngram_embedding(text: str, dim: int = 512) -> np.ndarray:
+    """Cheap character-trigram hashing embedding; swap in a sentence encoder for real paraphrases."""
+    t = f" {normalize_question(text)} "
+    vec = np.zeros(dim, dtype=np.float32)
+    for i in range(len(t) - 2):
+        digest = hashlib.blake2b(t[i:i + 3].encode(), digest_size=4).digest()
+        vec[int.from_bytes(digest, "little") % dim] += 1.0
+    return vec
+
+@dataclass(frozen=True)
+class CacheKey:
+    question: str
+    pasted_hash: str
+    image_hash: str
+    params: tuple
+
+    @classmethod
+    def build(cls, question: str, pasted_text: str | None, image, **params) -> "CacheKey":
+        return cls(normalize_question(question), text_hash(pasted_text), image_hash(image), tuple(sorted(params.items())))
+
+    @property
+    def has_attachment(self) -> bool:
+        return bool(self.pasted_hash or self.image_hash)
+
+    def digest(self) -> str:
+        raw = "\x1f".join([self.question, self.pasted_hash, self.image_hash, repr(self.params)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Answer cache in front of MedGemma: exact LRU tier (+ optional SQLite) and optional semantic tier.
+
+    The semantic tier only serves attachment-free questions, since two reports can look alike
+    while saying different things. It is enabled by passing `embed_fn`.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_s: float = 24 * 3600,
+        db_path: Path | None = None,
+        embed_fn: Callable[[str], Sequence[float]] | None = None,
+        similarity_threshold: float = 0.95,
+        max_persisted: int = 20000,
+    ):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.db_path = db_path
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.max_persisted = max_persisted
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        # digest -> (params, unit vector, answer, created_at) for attachment-free questions
+        self._vectors: dict[str, tuple[tuple, np.ndarray, str, float]] = {}
+
+        if db_path is not None:
+            with sqlite3.connect(db_path) as conn:
+                conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """)
+                conn.execute("DELETE FROM response_cache WHERE created_at < ?", (time.time() - ttl_s,))
+                conn.commit()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.exact_hits + self.semantic_hits + self.misses
+        return (self.exact_hits + self.semantic_hits) / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "entries": len(self._entries),
+        }
+
+    def get(self, key: CacheKey) -> tuple[str | None, str | None]:
+        """Return (answer, tier) where tier is "exact", "semantic" or None on a miss."""
+        digest = key.digest()
+        now = time.time()
+        with self._lock:
+            answer = self._get_exact(digest, now)
+            if answer is not None:
+                self.exact_hits += 1
+                return answer, "exact"
+
+            if self.embed_fn is not None and not key.has_attachment:
+                answer = self._get_semantic(key, now)
+                if answer is not None:
+                    self.semantic_hits += 1
+                    return answer, "semantic"
+
+            self.misses += 1
+            return None, None
+
+    def put(self, key: CacheKey, answer: str):
+        digest = key.digest()
+        now = time.time()
+        vec = None
+        if self.embed_fn is not None and not key.has_attachment:
+            vec = np.asarray(self.embed_fn(key.question), dtype=np.float32)
+            norm = float(np.linalg.norm(vec))
+            vec = vec / norm if norm else None
+
+        with self._lock:
+            self._entries[digest] = (answer, now)
+            self._entries.move_to_end(digest)
+            if vec is not None:
+                self._vectors[digest] = (key.params, vec, answer, now)
+            self._trim()
+
+            if self.db_path is not None:
+                with sqlite3.connect(self.db_path) as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO response_cache (key, answer, created_at) VALUES (?, ?, ?)",
+                        (digest, answer, now),
+                    )
+                    conn.execute(
+                        "DELETE FROM response_cache WHERE key IN "
+                        "(SELECT key FROM response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_persisted,),
+                    )
+                    conn.commit()
+
+    def _trim(self):
+        while len(self._entries) > self.max_entries:
+            old, _ = self._entries.popitem(last=False)
+            self._vectors.pop(old, None)
+
+    def _get_exact(self, digest: str, now: float) -> str | None:
+        entry = self._entries.get(digest)
+        if entry is None and self.db_path is not None:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute("SELECT answer, created_at FROM response_cache WHERE key=?", (digest,)).fetchone()
+            if row:
+                entry = (row[0], row[1])
+                self._entries[digest] = entry
+                self._trim()
+        if entry is None:
+            return None
+        answer, created_at = entry
+        if now - created_at > self.ttl_s:
+            self._entries.pop(digest, None)
+            self._vectors.pop(digest, None)
+            return None
+        self._entries.move_to_end(digest)
+        return answer
+
+    def _get_semantic(self, key: CacheKey, now: float) -> str | None:
+        candidates = [(d, v) for d, v in self._vectors.items() if v[0] == key.params and now - v[3] <= self.ttl_s]
+        if not candidates:
+            return None
+        q = np.asarray(self.embed_fn(key.question), dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if not norm:
+            return None
+        sims = np.stack([v[1] for _, v in candidates]) @ (q / norm)
+        best = int(np.argmax(sims))
+        if sims[best] < self.similarity_threshold:
+            return None
+        digest, (_, _, answer, _) = candidates[best]
+        if digest in self._entries:
+            self._entries.move_to_end(digest)
+        return answer
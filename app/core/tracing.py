@@ -0,0 +1,189 @@
+"""Lightweight request tracing: nested spans per pipeline stage, exported as JSONL.
+
+Disabled by default; `span()` then returns a shared no-op object, so instrumented code pays
+one function call per stage. Enable with MEDGEMMA_TRACE=1 (or `enable()`); set
+MEDGEMMA_TORCH_PROFILE=<dir> to also capture torch profiler traces around generation.
+
+Summary of an exported log: python -m app.core.tracing traces_log.jsonl
+"""
+import contextlib
+import contextvars
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from app.core.metrics import LatencyHistogram, MetricsLogger
+from app.utils.io import read_jsonl
+
+TRACE_PATH = Path("traces_log.jsonl")
+
+_enabled = os.environ.get("MEDGEMMA_TRACE", "") not in ("", "0", "false")
+_profile_dir = os.environ.get("MEDGEMMA_TORCH_PROFILE") or None
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_ids = itertools.count(1)
+_exporter: MetricsLogger | None = None
+_recent: deque = deque(maxlen=1000)
+_stats: dict[str, LatencyHistogram] = {}
+_stats_lock = threading.Lock()
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NOOP = _NoopSpan()
+
+class Span:
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(_ids)
+        self.parent: Span | None = None
+        self.root: Span = self
+        self.children: list[Span] = []
+        self.start = self.end = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.parent = _current.get()
+        if self.parent is not None:
+            self.root = self.parent.root
+            self.root.children.append(self)
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Exited in another context, e.g. an abandoned chat_stream generator closed by the GC
+            pass
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        if self.parent is None:
+            _finish_trace(self)
+        return False
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end - self.start) * 1000
+
+def enable(path: Path | None = None, torch_profile_dir: str | None = None):
+    global _enabled, _profile_dir, TRACE_PATH
+    _enabled = True
+    if path is not None:
+        TRACE_PATH = Path(path)
+    if torch_profile_dir is not None:
+        _profile_dir = torch_profile_dir
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+def span(name: str, **attrs):
+    """Context manager timing one stage; nests under the enclosing span of the current context."""
+    if not _enabled:
+        return _NOOP
+    return Span(name, attrs)
+
+def current_span():
+    return _current.get() if _enabled else _NOOP
+
+def torch_profile(name: str):
+    """torch.profiler capture around a block when MEDGEMMA_TORCH_PROFILE is set; otherwise a no-op."""
+    if not (_enabled and _profile_dir):
+        return contextlib.nullcontext()
+    return _torch_profile(name)
+
+@contextlib.contextmanager
+def _torch_profile(name: str):
+    import torch
+
+    out_dir = Path(_profile_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    with torch.profiler.profile(activities=activities, record_shapes=True) as prof:
+        yield prof
+    prof.export_chrome_trace(str(out_dir / f"{name}_{int(time.time() * 1000)}.json"))
+
+def _finish_trace(root: Span):
+    spans = [root] + root.children
+    record = {
+        "trace_id": root.span_id,
+        "name": root.name,
+        "ts": time.time(),
+        "duration_ms": round(root.duration_ms, 3),
+        "spans": [
+            {
+                "id": s.span_id,
+                "parent": s.parent.span_id if s.parent is not None else None,
+                "name": s.name,
+                "start_ms": round((s.start - root.start) * 1000, 3),
+                "duration_ms": round(s.duration_ms, 3),
+                **({"attrs": s.attrs} if s.attrs else {}),
+            }
+            for s in spans
+        ],
+    }
+    with _stats_lock:
+        for s in spans:
+            hist = _stats.get(s.name)
+            if hist is None:
+                hist = _stats[s.name] = LatencyHistogram()
+            hist.observe(s.end - s.start)
+    _recent.append(record)
+    _get_exporter().log(record)
+
+def _get_exporter() -> MetricsLogger:
+    global _exporter
+    if _exporter is None or _exporter.path != TRACE_PATH:
+        _exporter = MetricsLogger(path=TRACE_PATH)
+    return _exporter
+
+def flush():
+    if _exporter is not None:
+        _exporter.flush()
+
+def recent_traces() -> list[dict]:
+    return list(_recent)
+
+def summary() -> dict[str, dict]:
+    """Per-span-name latency stats (seconds) for traces finished in this process."""
+    with _stats_lock:
+        return {name: h.summary() for name, h in _stats.items()}
+
+def summarize_file(path: str | Path) -> dict[str, dict]:
+    stats: dict[str, LatencyHistogram] = {}
+    for record in read_jsonl(path):
+        for s in record["spans"]:
+            stats.setdefault(s["name"], LatencyHistogram()).observe(s["duration_ms"] / 1000)
+    return {name: h.summary() for name, h in stats.items()}
+
+def format_summary(stats: dict[str, dict]) -> str:
+    lines = [f"{'span':40s} {'count':>7s} {'mean ms':>10s} {'p50 ms':>10s} {'p95 ms':>10s} {'p99 ms':>10s}"]
+    for name, s in sorted(stats.items()):
+        ms = lambda v: f"{v * 1000:10.2f}" if v is not None else f"{'-':>10s}"
+        lines.append(f"{name:40s} {s['count']:7d} {ms(s['mean'])} {ms(s['p50'])} {ms(s['p95'])} {ms(s['p99'])}")
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    print(format_summary(summarize_file(sys.argv[1] if len(sys.argv) > 1 else TRACE_PATH)))
@@ -0,0 +1,288 @@
+"""Vitals analytics over arbitrary time windows, kept up to date as readings are added.
+
+Each (user, vitals type) series is held in memory as sorted NumPy arrays plus running
+(prefix) sums of the values, their squares, time x value products and threshold flags. A
+window's mean, spread, least-squares slope and out-of-range counts are then two binary
+searches and one subtraction, whatever its size; a new reading appends one row instead of
+reloading and re-sorting the history.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from app.core.vitals_analyzer import advice
+from app.db import store
+
+DAY_S = 86400
+WEEK_S = 7 * DAY_S
+
+# (main, secondary) limits; a reading is high/low when either value is past its limit.
+# `trend` is the slope (units per week) below which a series counts as stable.
+THRESHOLDS = {
+    "blood_pressure": {"high": (140, 90), "low": (90, 60), "trend": 1.0},
+    "sugar": {"high": (180, None), "low": (70, None), "trend": 2.0},
+}
+TIME_OF_DAY = ("night", "morning", "afternoon", "evening")  # 6-hour buckets from midnight
+
+# Columns of the running sums; t is days since the series' first reading, tod_* the count
+# and main-value total per time-of-day bucket
+_COLS = ("v1", "v1sq", "v2", "v2sq", "n2", "t", "tt", "tv1", "tv2", "high", "low", "enter") \
+    + tuple(f"tod_n{b}" for b in range(4)) + tuple(f"tod_v{b}" for b in range(4))
+_C = {name: i for i, name in enumerate(_COLS)}
+
+@dataclass
+class VitalsSummary:
+    vitals_type: str
+    count: int
+    start: int | None = None  # window bounds, unix seconds
+    end: int | None = None
+    mean: tuple[float | None, float | None] = (None, None)  # (main, secondary)
+    std: tuple[float | None, float | None] = (None, None)
+    slope_per_week: tuple[float | None, float | None] = (None, None)
+    trend: str = "n/a"  # rising | falling | stable
+    high_count: int = 0
+    low_count: int = 0
+    crossings: int = 0  # times a reading went out of range after an in-range one
+    time_of_day: dict = field(default_factory=dict)  # bucket -> {"count", "mean"} of the main value
+    latest: tuple | None = None  # (created_at, main, secondary)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+class _Series:
+    def __init__(self, vitals_type: str, utc_offset_s: int, capacity: int = 1024):
+        self.utc_offset_s = utc_offset_s
+        limits = THRESHOLDS.get(vitals_type, {})
+        self.high = limits.get("high", (None, None))
+        self.low = limits.get("low", (None, None))
+        self.n = 0
+        self.origin = None
+        self.ts = np.empty(capacity, dtype=np.int64)
+        self.v1 = np.empty(capacity)
+        self.v2 = np.empty(capacity)
+        self.sums = np.zeros((capacity + 1, len(_COLS)))
+
+    def _reserve(self, n: int):
+        cap = len(self.ts)
+        if n <= cap:
+            return
+        new_cap = max(n, 2 * cap)
+        for name in ("ts", "v1", "v2"):
+            arr = getattr(self, name)
+            grown = np.empty(new_cap, dtype=arr.dtype)
+            grown[: self.n] = arr[: self.n]
+            setattr(self, name, grown)
+        sums = np.zeros((new_cap + 1, len(_COLS)))
+        sums[: self.n + 1] = self.sums[: self.n + 1]
+        self.sums = sums
+
+    def _out_of_range(self, v1: np.ndarray, v2: np.ndarray, limits: tuple, above: bool) -> np.ndarray:
+        flag = np.zeros(len(v1), dtype=bool)
+        for values, limit in ((v1, limits[0]), (v2, limits[1])):
+            if limit is not None:
+                with np.errstate(invalid="ignore"):
+                    flag |= values > limit if above else values < limit
+        return flag
+
+    def _rebuild(self, start: int):
+        """Recompute the running sums from row `start` on."""
+        ts, v1, v2 = self.ts[start : self.n], self.v1[start : self.n], self.v2[start : self.n]
+        has2 = ~np.isnan(v2)
+        v2z = np.where(has2, v2, 0.0)
+        t = (ts - self.origin) / DAY_S
+        high = self._out_of_range(v1, v2, self.high, True)
+        low = self._out_of_range(v1, v2, self.low, False)
+        bad = high | low
+        prev_bad = False
+        if start > 0:
+            p1, p2 = self.v1[start - 1 : start], self.v2[start - 1 : start]
+            prev_bad = bool((self._out_of_range(p1, p2, self.high, True) | self._out_of_range(p1, p2, self.low, False))[0])
+        was_bad = np.concatenate(([prev_bad], bad[:-1]))
+        bucket = ((ts + self.utc_offset_s) // 3600 % 24) // 6
+        tod = bucket[:, None] == np.arange(4)
+        rows = np.column_stack((v1, v1 * v1, v2z, v2z * v2z, has2, t, t * t, t * v1, t * v2z, high, low, bad & ~was_bad,
+                                tod, tod * v1[:, None]))
+        self.sums[start + 1 : self.n + 1] = self.sums[start] + np.cumsum(rows, axis=0)
+
+    def extend(self, ts: np.ndarray, v1: np.ndarray, v2: np.ndarray):
+        ts = np.asarray(ts, dtype=np.int64)
+        if not len(ts):
+            return
+        v1 = np.asarray(v1, dtype=float)
+        v2 = np.asarray(v2, dtype=float)
+        if self.origin is None:
+            self.origin = int(ts.min())
+        n_old = self.n
+        self._reserve(n_old + len(ts))
+        in_order = n_old == 0 or ts[0] >= self.ts[n_old - 1]
+        if in_order and (len(ts) == 1 or np.all(ts[1:] >= ts[:-1])):
+            # The common case (a new reading): append rows and extend the sums
+            self.ts[n_old : n_old + len(ts)] = ts
+            self.v1[n_old : n_old + len(ts)] = v1
+            self.v2[n_old : n_old + len(ts)] = v2
+            self.n += len(ts)
+            self._rebuild(n_old)
+            return
+        # Back-dated readings: merge, then recompute the sums from the first row that moved
+        start = int(np.searchsorted(self.ts[:n_old], ts.min(), side="right"))
+        all_ts = np.concatenate((self.ts[start:n_old], ts))
+        order = np.argsort(all_ts, kind="stable")
+        self.ts[start : n_old + len(ts)] = all_ts[order]
+        self.v1[start : n_old + len(ts)] = np.concatenate((self.v1[start:n_old], v1))[order]
+        self.v2[start : n_old + len(ts)] = np.concatenate((self.v2[start:n_old], v2))[order]
+        self.n += len(ts)
+        self._rebuild(start)
+
+    def bounds(self, start: int | None, end: int | None, last: int | None) -> tuple[int, int]:
+        ts = self.ts[: self.n]
+        i = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        j = self.n if end is None else int(np.searchsorted(ts, end, side="right"))
+        if last is not None:
+            i = max(i, j - last)
+        return i, j
+
+    def summary(self, vitals_type: str, i: int, j: int) -> VitalsSummary:
+        n = j - i
+        if n <= 0:
+            return VitalsSummary(vitals_type, 0)
+        s = dict(zip(_COLS, self.sums[j] - self.sums[i]))
+        out = VitalsSummary(vitals_type, n, int(self.ts[i]), int(self.ts[j - 1]),
+                            high_count=int(round(s["high"])), low_count=int(round(s["low"])),
+                            crossings=int(round(s["enter"])),
+                            latest=(int(self.ts[j - 1]), float(self.v1[j - 1]), _opt(self.v2[j - 1])))
+
+        n2 = int(round(s["n2"]))
+        mean1 = s["v1"] / n
+        mean2 = s["v2"] / n2 if n2 else None
+        std1 = np.sqrt(max(s["v1sq"] / n - mean1 ** 2, 0.0))
+        std2 = np.sqrt(max(s["v2sq"] / n2 - mean2 ** 2, 0.0)) if n2 else None
+        out.mean = (float(mean1), _opt(mean2))
+        out.std = (float(std1), _opt(std2))
+
+        # Least-squares slope from the same sums: cov(t, v) / var(t)
+        var_t = s["tt"] / n - (s["t"] / n) ** 2
+        if n >= 2 and var_t > 1e-12:
+            slope1 = (s["tv1"] / n - (s["t"] / n) * mean1) / var_t * 7
+            # The secondary slope reuses the time sums, so it needs a secondary value on every row
+            slope2 = (s["tv2"] / n - (s["t"] / n) * mean2) / var_t * 7 if n2 == n else None
+            out.slope_per_week = (float(slope1), _opt(slope2))
+            limit = THRESHOLDS.get(vitals_type, {}).get("trend", 1.0)
+            out.trend = "stable" if abs(slope1) < limit else ("rising" if slope1 > 0 else "falling")
+
+        out.time_of_day = {}
+        for b, name in enumerate(TIME_OF_DAY):
+            c = int(round(s[f"tod_n{b}"]))
+            out.time_of_day[name] = {"count": c, "mean": float(s[f"tod_v{b}"] / c) if c else None}
+        return out
+
+    def frame(self, i: int, j: int, rolling_s: int | None) -> pd.DataFrame:
+        ts = self.ts[i:j]
+        df = pd.DataFrame({"created_at": ts, "main": self.v1[i:j], "secondary": self.v2[i:j]})
+        if rolling_s:
+            # Mean over the readings in (t - rolling_s, t] for every row, from the running sums
+            first = np.searchsorted(self.ts[: self.n], ts - rolling_s, side="right")
+            last = np.arange(i, j) + 1
+            count = last - first
+            df["main_mean"] = (self.sums[last, _C["v1"]] - self.sums[first, _C["v1"]]) / count
+            n2 = self.sums[last, _C["n2"]] - self.sums[first, _C["n2"]]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                df["secondary_mean"] = np.where(n2 > 0, (self.sums[last, _C["v2"]] - self.sums[first, _C["v2"]]) / n2, np.nan)
+        return df
+
+def _opt(x) -> float | None:
+    return None if x is None or x != x else float(x)
+
+class VitalsAnalytics:
+    """Per-user vitals series loaded once from the store and updated in place by `add_vital`.
+
+    Series are evicted least-recently-used past `max_series`; `invalidate` drops one after
+    writes that bypass this object (e.g. another process).
+    """
+
+    def __init__(self, max_series: int = 512, utc_offset_s: int | None = None):
+        self.max_series = max_series
+        # Local standard time for the time-of-day buckets
+        self.utc_offset_s = -time.timezone if utc_offset_s is None else utc_offset_s
+        self.loads = 0
+        self._series: OrderedDict[tuple[str, str], _Series] = OrderedDict()
+        # Series to reload, marked by store write callbacks; they run on the writer thread and
+        # must not take the lock, which a reader may hold while it waits for that thread
+        self._stale: set[tuple[str, str]] = set()
+        self._lock = threading.RLock()
+
+    def _get(self, username: str, vitals_type: str) -> _Series:
+        key = (username, vitals_type)
+        if key in self._stale:
+            self._stale.discard(key)
+            self._series.pop(key, None)
+        series = self._series.get(key)
+        if series is None:
+            rows = store.get_vitals_history(username, vitals_type)
+            series = _Series(vitals_type, self.utc_offset_s, capacity=max(1024, len(rows)))
+            if rows:
+                series.extend(
+                    np.fromiter((r[3] for r in rows), dtype=np.int64, count=len(rows)),
+                    np.fromiter((r[0] for r in rows), dtype=float, count=len(rows)),
+                    np.fromiter((np.nan if r[1] is None else r[1] for r in rows), dtype=float, count=len(rows)),
+                )
+            self.loads += 1
+            self._series[key] = series
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+        self._series.move_to_end(key)
+        return series
+
+    def add_vital(self, username: str, vitals_type: str, v1, v2=None, notes=None) -> Future:
+        """Write through to the store and update the in-memory series; returns the store write's
+        Future (done once committed, holding the error if the insert failed)."""
+        with self._lock:
+            created_at = int(time.time())
+            future = store.add_vital(username, vitals_type, v1, v2, notes, created_at=created_at)
+            series = self._series.get((username, vitals_type))
+            if series is not None:
+                series.extend([created_at], [v1], [np.nan if v2 is None else v2])
+            # A reading that never reached the database must not stay in the series
+            future.add_done_callback(lambda f: f.exception() is not None and self._stale.add((username, vitals_type)))
+            return future
+
+    def record(self, username: str, vitals_type: str, created_at, v1, v2=None):
+        """Fold readings already written to the store (scalars or arrays) into a loaded series."""
+        with self._lock:
+            series = self._series.get((username, vitals_type))
+            if series is not None:
+                v2 = np.full(np.shape(v1), np.nan) if v2 is None else np.where(pd.isna(v2), np.nan, v2)
+                series.extend(np.atleast_1d(created_at), np.atleast_1d(v1), np.atleast_1d(v2))
+
+    def invalidate(self, username: str, vitals_type: str | None = None):
+        with self._lock:
+            for key in [k for k in self._series if k[0] == username and vitals_type in (None, k[1])]:
+                del self._series[key]
+
+    def summary(self, username: str, vitals_type: str, start: int | None = None, end: int | None = None,
+                window_s: int | None = None, last: int | None = None) -> VitalsSummary:
+        """Stats over readings in [start, end], the trailing `window_s` seconds and/or the `last` N."""
+        with self._lock:
+            series = self._get(username, vitals_type)
+            if window_s is not None and series.n:
+                start = max(start or 0, int(series.ts[series.n - 1]) - window_s)
+            i, j = series.bounds(start, end, last)
+            return series.summary(vitals_type, i, j)
+
+    def frame(self, username: str, vitals_type: str, start: int | None = None, end: int | None = None,
+              rolling_s: int | None = None) -> pd.DataFrame:
+        """Readings as a DataFrame (created_at, main, secondary), plus trailing means when `rolling_s` is set."""
+        with self._lock:
+            series = self._get(username, vitals_type)
+            i, j = series.bounds(start, end, None)
+            return series.frame(i, j, rolling_s)
+
+    def advice(self, username: str, vitals_type: str, last: int = 5) -> str:
+        s = self.summary(username, vitals_type, last=last)
+        if not s.count:
+            return advice(vitals_type, None, None)
+        return advice(vitals_type, s.mean[0], s.mean[1])
@@ -1,19 +1,14 @@
+import heapq
 from typing import List, Tuple
-from datetime import datetime, timedelta
 
-def analyze_vitals(history: List[Tuple], vitals_type: str) -> str:
-    if not history:
+def advice(vitals_type: str, main_avg: float | None, secondary_avg: float | None = None) -> str:
+    """Suggestion text for the recent average reading (systolic/diastolic or glucose)."""
+    if main_avg is None:
         return "No data available yet to provide suggestions."
 
-    # Sort by time
-    history = sorted(history, key=lambda x: x[3])
-    
-    recent_entries = history[-5:] # look at last 5 entries
-    
     if vitals_type == "blood_pressure":
-        systolic_avg = sum(e[0] for e in recent_entries) / len(recent_entries)
-        diastolic_avg = sum(e[1] for e in recent_entries) / len(recent_entries)
-        
+        systolic_avg, diastolic_avg = main_avg, secondary_avg or 0.0
+
         if systolic_avg > 140 or diastolic_avg > 90:
             return (f"Your recent average ({int(systolic_avg)}/{int(diastolic_avg)}) is high. "
                     "Try reducing salt intake, staying hydrated, and consulting a doctor if this persists.")
@@ -23,8 +18,8 @@ def analyze_vitals(history: List[Tuple], vitals_type: str) -> str:
             return "Your blood pressure trends look stable and within a healthy range. Keep up the good work!"
 
     elif vitals_type == "sugar":
-        sugar_avg = sum(e[0] for e in recent_entries) / len(recent_entries)
-        
+        sugar_avg = main_avg
+
         if sugar_avg > 180:
             return (f"Your recent average sugar level ({int(sugar_avg)} mg/dL) is elevated. "
                     "Consider monitoring your carb intake and staying active. Please speak with your doctor about these readings.")
@@ -32,5 +27,17 @@ def analyze_vitals(history: List[Tuple], vitals_type: str) -> str:
             return "Your recent sugar levels are low (hypoglycemia). Ensure you're eating consistent meals."
         else:
             return "Your blood sugar levels are currently within target ranges."
-            
+
     return "Trend analysis complete. Keep monitoring regularly."
+
+def analyze_vitals(history: List[Tuple], vitals_type: str) -> str:
+    if not history:
+        return advice(vitals_type, None)
+
+    # Last 5 entries by time without sorting the whole history; ties keep insertion order
+    recent_entries = heapq.nlargest(5, enumerate(history), key=lambda x: (x[1][3], x[0]))
+    recent_entries = [e for _, e in recent_entries]
+
+    main_avg = sum(e[0] for e in recent_entries) / len(recent_entries)
+    secondary_avg = sum((e[1] or 0) for e in recent_entries) / len(recent_entries)
+    return advice(vitals_type, main_avg, secondary_avg)
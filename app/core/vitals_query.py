@@ -0,0 +1,60 @@
+"""Chart-sized vitals series: a bounded number of points whatever the history size."""
+import numpy as np
+import pandas as pd
+
+from app.db import store
+from app.utils.timeseries import bucket_seconds, lttb_indices
+
+CHART_MAX_POINTS = 500
+METHODS = ("buckets", "lttb")
+
+def vitals_chart(username: str, vitals_type: str, start: int | None = None, end: int | None = None,
+                 max_points: int = CHART_MAX_POINTS, method: str = "buckets") -> pd.DataFrame:
+    """Readings in [start, end] reduced to at most ~`max_points` rows, oldest first.
+
+    "buckets" aggregates in SQL per time bucket: columns created_at (bucket start), count,
+    main/main_min/main_max and the same for secondary. "lttb" keeps real readings picked by
+    Largest-Triangle-Three-Buckets: created_at, main, secondary. Ranges with no more than
+    `max_points` readings come back as the readings themselves in the same columns.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown downsampling method {method!r}; expected one of {METHODS}")
+    count, first, last = store.get_vitals_extent(username, vitals_type, start, end)
+    if not count:
+        return _empty(method)
+
+    if count <= max_points:
+        rows = store.get_vitals_range(username, vitals_type, start, end)
+        df = pd.DataFrame(rows, columns=["main", "secondary", "created_at"], dtype=float)
+        df["created_at"] = df["created_at"].astype(np.int64)
+        if method == "buckets":
+            df["count"] = 1
+            for col in ("main", "secondary"):
+                df[f"{col}_min"] = df[f"{col}_max"] = df[col]
+        return df[_columns(method)]
+
+    if method == "buckets":
+        width = bucket_seconds(last - first + 1, max_points)
+        rows = store.get_vitals_buckets(username, vitals_type, width, start, end)
+        df = pd.DataFrame(rows, columns=["created_at", "count", "main_min", "main", "main_max",
+                                         "secondary_min", "secondary", "secondary_max"])
+        return df[_columns(method)].astype({c: float for c in _columns(method)[2:]})
+
+    rows = store.get_vitals_range(username, vitals_type, start, end)
+    data = np.array(rows, dtype=float)  # None (no secondary value) becomes nan
+    ts, main, secondary = data[:, 2], data[:, 0], data[:, 1]
+    has_secondary = not np.isnan(secondary).all()
+    # With two values, half the budget goes to each so both series keep their spikes
+    keep = lttb_indices(ts, main, max_points // 2 if has_secondary else max_points)
+    if has_secondary:
+        filled = np.where(np.isnan(secondary), np.nanmean(secondary), secondary)
+        keep = np.union1d(keep, lttb_indices(ts, filled, max_points // 2))
+    return pd.DataFrame({"created_at": ts[keep].astype(np.int64), "main": main[keep], "secondary": secondary[keep]})
+
+def _columns(method: str) -> list[str]:
+    if method == "buckets":
+        return ["created_at", "count", "main_min", "main", "main_max", "secondary_min", "secondary", "secondary_max"]
+    return ["created_at", "main", "secondary"]
+
+def _empty(method: str) -> pd.DataFrame:
+    return pd.DataFrame({c: pd.Series(dtype=float) for c in _columns(method)})
@@ -1,12 +1,279 @@
+import atexit
+import logging
+import queue
+import re
 import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Any
 import time
 
 DB_PATH = Path("medgemma_copilot.db")
 
+log = logging.getLogger(__name__)
+
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",       # readers no longer block on the writer
+    "PRAGMA synchronous=NORMAL",     # safe with WAL, avoids an fsync per commit
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",      # ~16 MB page cache per connection
+    "PRAGMA mmap_size=134217728",
+    "PRAGMA busy_timeout=5000",
+]
+
+class ConnectionPool:
+    """Thread-safe pool of long-lived SQLite connections with WAL and tuned pragmas.
+
+    Connections keep sqlite3's per-connection statement cache warm, so repeated queries
+    reuse their prepared statements instead of re-parsing the SQL on every call.
+    """
+
+    def __init__(self, db_path: Path, size: int = 8):
+        self.db_path = Path(db_path)
+        self.size = size
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, cached_statements=256)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                grow = self._created < self.size
+                if grow:
+                    self._created += 1
+            conn = self._connect() if grow else self._idle.get()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class WriteBehindQueue:
+    """Groups queued INSERTs into one transaction per flush (size- or time-triggered).
+
+    Reads call `flush()` first, so a session always sees its own writes. Each `submit` returns
+    a Future that completes once the row is committed, or carries the error if that row
+    failed (also logged); a failure never surfaces in whichever reader flushes next. Futures
+    are resolved on the writer thread after `flush()` callers are released, so done-callbacks
+    may take locks a reader holds or read the store themselves.
+    """
+
+    def __init__(self, pool: ConnectionPool, max_batch: int = 256, max_delay_s: float = 0.05):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay_s = max_delay_s
+        self.failed = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._flush_now = threading.Event()
+        self._worker = threading.Thread(target=self._loop, name="db-write-behind", daemon=True)
+        self._worker.start()
+
+    def submit(self, sql: str, params: tuple) -> Future:
+        future = Future()
+        self._queue.put((sql, params, future))
+        return future
+
+    def flush(self):
+        """Block until every write submitted so far is committed (or has failed)."""
+        # A Future callback reading the store runs on the writer thread, which cannot wait for itself
+        if self._queue.unfinished_tasks == 0 or threading.current_thread() is self._worker:
+            return
+        self._flush_now.set()
+        self._queue.join()
+        self._flush_now.clear()
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._flush_now.is_set():
+                    # A reader is waiting: drain what is already queued and commit
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                    continue
+                try:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.005)))
+                except queue.Empty:
+                    pass
+            try:
+                errors = self._write(batch)
+            except Exception as e:
+                # Not a row error (e.g. the database cannot be opened): every row of the batch failed
+                errors = [e] * len(batch)
+            for _ in batch:
+                self._queue.task_done()
+            self._settle(batch, errors)
+
+    def _write(self, batch: list[tuple[str, tuple, Future]]) -> list[Exception | None]:
+        """Commit the batch; returns each row's error, None where the row was committed."""
+        # Consecutive rows for the same statement go through one executemany, all in one transaction
+        groups: list[tuple[str, list[tuple]]] = []
+        for sql, params, _ in batch:
+            if groups and groups[-1][0] == sql:
+                groups[-1][1].append(params)
+            else:
+                groups.append((sql, [params]))
+        with self.pool.connection() as conn:
+            try:
+                with conn:
+                    for sql, rows in groups:
+                        conn.executemany(sql, rows)
+            except sqlite3.Error:
+                # Retry row by row so one bad row does not drop the whole batch
+                errors = []
+                for sql, params, _ in batch:
+                    try:
+                        with conn:
+                            conn.execute(sql, params)
+                    except sqlite3.Error as e:
+                        errors.append(e)
+                    else:
+                        errors.append(None)
+                return errors
+        return [None] * len(batch)
+
+    def _settle(self, batch: list[tuple[str, tuple, Future]], errors: list[Exception | None]):
+        for (sql, _, future), error in zip(batch, errors):
+            if error is None:
+                future.set_result(None)
+                continue
+            self.failed += 1
+            log.error("queued write failed: %s (%s)", error, sql.split("(")[0].strip())
+            future.set_exception(error)
+
+_engine_lock = threading.Lock()
+_engine: tuple[Path, ConnectionPool, WriteBehindQueue] | None = None
+
+def _get_engine() -> tuple[ConnectionPool, WriteBehindQueue]:
+    global _engine
+    # DB_PATH may be repointed (e.g. by benchmarks); build a fresh engine when it changes
+    if _engine is None or _engine[0] != DB_PATH:
+        with _engine_lock:
+            if _engine is None or _engine[0] != DB_PATH:
+                if _engine is not None:
+                    _engine[2].flush()
+                pool = ConnectionPool(DB_PATH)
+                _engine = (DB_PATH, pool, WriteBehindQueue(pool))
+    return _engine[1], _engine[2]
+
+@contextmanager
+def _read():
+    pool, writer = _get_engine()
+    writer.flush()
+    with pool.connection() as conn:
+        yield conn
+
+@contextmanager
+def _write():
+    pool, writer = _get_engine()
+    writer.flush()
+    with pool.connection() as conn:
+        with conn:
+            yield conn
+
+def _enqueue(sql: str, params: tuple) -> Future:
+    return _get_engine()[1].submit(sql, params)
+
+def flush_writes():
+    """Commit any queued message/vital inserts now."""
+    if _engine is not None:
+        _engine[2].flush()
+
+atexit.register(flush_writes)
+
+# Schema migrations, applied in order on init_db; PRAGMA user_version records how many ran
+MIGRATIONS = [
+    # 1: secondary indexes for session listing and message loading
+    [
+        "CREATE INDEX IF NOT EXISTS idx_sessions_user_created ON chat_sessions(username, created_at, session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_session_created ON messages(session_id, created_at)",
+    ],
+    # 2: range scans over one user's vitals series (charts, windowed queries)
+    [
+        "CREATE INDEX IF NOT EXISTS idx_vitals_user_type_created ON health_vitals(username, vitals_type, created_at)",
+    ],
+    # 3: full-text search over message content and session titles. messages_fts is an
+    # external-content index over the messages_search view (no text is stored twice); `owner`
+    # holds hex(username) as a single token so one user's hits are found inside the index.
+    [
+        """
+        CREATE VIEW IF NOT EXISTS messages_search AS
+        SELECT m.id AS id, m.content AS content, s.title AS title, hex(s.username) AS owner
+        FROM messages m JOIN chat_sessions s ON s.session_id = m.session_id
+        """,
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, title, owner, "
+        "content='messages_search', content_rowid='id', tokenize='porter unicode61 remove_diacritics 2')",
+        # Title hits count for less than content hits; owner never affects ranking
+        "INSERT INTO messages_fts(messages_fts, rank) VALUES('rank', 'bm25(1.0, 0.5, 0.0)')",
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts(rowid, content, title, owner)
+            SELECT new.id, new.content, s.title, hex(s.username) FROM chat_sessions s WHERE s.session_id = new.session_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content, title, owner)
+            SELECT 'delete', old.id, old.content, s.title, hex(s.username) FROM chat_sessions s WHERE s.session_id = old.session_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, session_id ON messages BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content, title, owner)
+            SELECT 'delete', old.id, old.content, s.title, hex(s.username) FROM chat_sessions s WHERE s.session_id = old.session_id;
+            INSERT INTO messages_fts(rowid, content, title, owner)
+            SELECT new.id, new.content, s.title, hex(s.username) FROM chat_sessions s WHERE s.session_id = new.session_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS sessions_fts_update AFTER UPDATE OF title, username ON chat_sessions BEGIN
+            INSERT INTO messages_fts(messages_fts, rowid, content, title, owner)
+            SELECT 'delete', m.id, m.content, old.title, hex(old.username) FROM messages m WHERE m.session_id = old.session_id;
+            INSERT INTO messages_fts(rowid, content, title, owner)
+            SELECT m.id, m.content, new.title, hex(new.username) FROM messages m WHERE m.session_id = new.session_id;
+        END
+        """,
+        # Index the history that predates the migration, merged into one segment so the
+        # trigger inserts that follow do not keep merging the backfill's segments
+        "INSERT INTO messages_fts(messages_fts) VALUES('rebuild')",
+        "INSERT INTO messages_fts(messages_fts) VALUES('optimize')",
+    ],
+]
+
+def _migrate(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for i, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        for sql in statements:
+            conn.execute(sql)
+        conn.execute(f"PRAGMA user_version={i}")
+
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
+    with _write() as conn:
         # User table
         conn.execute("""
         CREATE TABLE IF NOT EXISTS users (
@@ -52,21 +319,20 @@ def init_db():
             FOREIGN KEY(username) REFERENCES users(username)
         )
         """)
-        
-        conn.commit()
+
+        _migrate(conn)
 
 # --- User Auth ---
 def create_user(username, password):
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with _write() as conn:
             conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, password))
-            conn.commit()
         return True
     except sqlite3.IntegrityError:
         return False
 
 def verify_user(username, password):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read() as conn:
         cur = conn.execute("SELECT password FROM users WHERE username=?", (username,))
         row = cur.fetchone()
         if row and row[0] == password:
@@ -74,47 +340,232 @@ def verify_user(username, password):
     return False
 
 # --- Chat Sessions ---
-def create_session(username, title):
-    session_id = f"{username}_{int(time.time())}"
-    with sqlite3.connect(DB_PATH) as conn:
+def new_session_id(username):
+    return f"{username}_{int(time.time())}"
+
+def create_session(username, title, session_id=None):
+    session_id = session_id or new_session_id(username)
+    with _write() as conn:
         conn.execute(
             "INSERT INTO chat_sessions (session_id, username, title, created_at) VALUES (?, ?, ?, ?)",
             (session_id, username, title, int(time.time()))
         )
-        conn.commit()
     return session_id
 
 def get_user_sessions(username):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read() as conn:
         cur = conn.execute("SELECT session_id, title FROM chat_sessions WHERE username=? ORDER BY created_at DESC", (username,))
         return cur.fetchall()
 
-def add_message(session_id, role, content, image_path=None):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "INSERT INTO messages (session_id, role, content, image_path, created_at) VALUES (?, ?, ?, ?, ?)",
-            (session_id, role, content, image_path, int(time.time()))
+def get_user_sessions_page(username, limit=20, cursor=None):
+    """Keyset-paginated sessions, newest first.
+
+    Returns (rows, next_cursor) with rows of (session_id, title, created_at); pass
+    next_cursor back to get the following page. next_cursor is None on the last page.
+    """
+    with _read() as conn:
+        if cursor is None:
+            cur = conn.execute(
+                "SELECT session_id, title, created_at FROM chat_sessions WHERE username=? "
+                "ORDER BY created_at DESC, session_id DESC LIMIT ?",
+                (username, limit + 1)
+            )
+        else:
+            cur = conn.execute(
+                "SELECT session_id, title, created_at FROM chat_sessions WHERE username=? "
+                "AND (created_at, session_id) < (?, ?) ORDER BY created_at DESC, session_id DESC LIMIT ?",
+                (username, cursor[0], cursor[1], limit + 1)
+            )
+        rows = cur.fetchall()
+    return _page(rows, limit, lambda r: (r[2], r[0]))
+
+def load_user_history(username, limit=20, cursor=None):
+    """One query for a page of sessions together with all of their messages.
+
+    Returns (sessions, next_cursor) where sessions is a list of
+    (session_id, title, created_at, [(role, content, image_path), ...]).
+    """
+    page_filter = "" if cursor is None else "AND (created_at, session_id) < (?, ?)"
+    params = (username,) + (() if cursor is None else tuple(cursor)) + (limit + 1,)
+    with _read() as conn:
+        cur = conn.execute(
+            f"""
+            WITH page AS (
+                SELECT session_id, title, created_at FROM chat_sessions
+                WHERE username=? {page_filter}
+                ORDER BY created_at DESC, session_id DESC LIMIT ?
+            )
+            SELECT p.session_id, p.title, p.created_at, m.id, m.created_at, m.role, m.content, m.image_path
+            FROM page p LEFT JOIN messages m ON m.session_id = p.session_id
+            """,
+            params
         )
-        conn.commit()
+        # Ordering is done here rather than in SQL, which would sort every joined row in a temp b-tree
+        by_session = {}
+        for sid, title, created_at, mid, m_created, role, content, image_path in cur:
+            entry = by_session.setdefault(sid, (sid, title, created_at, []))
+            if mid is not None:
+                entry[3].append((m_created, mid, role, content, image_path))
+    sessions = sorted(by_session.values(), key=lambda s: (s[2], s[0]), reverse=True)
+    for entry in sessions:
+        entry[3].sort(key=lambda m: (m[0], m[1]))
+        entry[3][:] = [m[2:] for m in entry[3]]
+    return _page(sessions, limit, lambda s: (s[2], s[0]))
+
+def _page(rows, limit, cursor_of):
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, cursor_of(rows[-1])
+    return rows, None
+
+def add_message(session_id, role, content, image_path=None):
+    """Queue a message; returns a Future that completes once it is committed (or holds the error)."""
+    # Queued and committed in a group with other inserts; reads flush the queue first
+    return _enqueue(
+        "INSERT INTO messages (session_id, role, content, image_path, created_at) VALUES (?, ?, ?, ?, ?)",
+        (session_id, role, content, image_path, int(time.time()))
+    )
 
 def get_session_messages(session_id):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read() as conn:
         cur = conn.execute("SELECT role, content, image_path FROM messages WHERE session_id=? ORDER BY created_at ASC", (session_id,))
         return cur.fetchall()
 
-# --- Health Vitals ---
-def add_vital(username, vitals_type, v1, v2=None, notes=None):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "INSERT INTO health_vitals (username, vitals_type, value_main, value_secondary, notes, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-            (username, vitals_type, v1, v2, notes, int(time.time()))
+def get_session_messages_page(session_id, limit=50, cursor=None):
+    """Keyset-paginated messages, oldest first.
+
+    Returns (rows, next_cursor) with rows of (id, role, content, image_path, created_at).
+    """
+    with _read() as conn:
+        if cursor is None:
+            cur = conn.execute(
+                "SELECT id, role, content, image_path, created_at FROM messages WHERE session_id=? "
+                "ORDER BY created_at ASC, id ASC LIMIT ?",
+                (session_id, limit + 1)
+            )
+        else:
+            cur = conn.execute(
+                "SELECT id, role, content, image_path, created_at FROM messages WHERE session_id=? "
+                "AND (created_at, id) > (?, ?) ORDER BY created_at ASC, id ASC LIMIT ?",
+                (session_id, cursor[0], cursor[1], limit + 1)
+            )
+        rows = cur.fetchall()
+    return _page(rows, limit, lambda r: (r[4], r[0]))
+
+_FTS_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+def _fts_query(text):
+    """Free text -> an FTS5 expression: every word or "quoted phrase" must match; `word*` matches a prefix.
+
+    Words are reduced to their letters/digits and quoted, so FTS5 operators typed by the user
+    are searched for as text instead of being parsed.
+    """
+    terms = []
+    for phrase, word in _FTS_TERM.findall(text):
+        tokens = re.findall(r"\w+", phrase or word)
+        if tokens:
+            # Prefixes are opt-in: without a prefix index they expand to every matching term
+            terms.append('"' + " ".join(tokens) + '"' + ("*" if word.endswith("*") else ""))
+    return " ".join(terms)
+
+def search_messages(username, query, limit=20, cursor=None, highlight=("**", "**"), snippet_tokens=16):
+    """Ranked full-text search over a user's messages and session titles.
+
+    Returns (rows, next_cursor) with rows of (id, session_id, title, role, snippet, created_at),
+    best match first; matched terms in the snippet are wrapped in `highlight`.
+    """
+    terms = _fts_query(query)
+    if not terms:
+        return [], None
+    match = f"owner:{username.encode().hex()} AND {{content title}}: ({terms})"
+    page_filter = "" if cursor is None else "AND (f.rank, f.rowid) > (?, ?)"
+    params = (highlight[0], highlight[1], snippet_tokens, match, username) + (() if cursor is None else tuple(cursor)) + (limit + 1,)
+    with _read() as conn:
+        # The owner token narrows the match inside the index; the username join keeps it exact
+        cur = conn.execute(
+            f"""
+            SELECT f.rowid, m.session_id, s.title, m.role, snippet(messages_fts, 0, ?, ?, '…', ?), m.created_at, f.rank
+            FROM messages_fts f
+            JOIN messages m ON m.id = f.rowid
+            JOIN chat_sessions s ON s.session_id = m.session_id
+            WHERE messages_fts MATCH ? AND s.username = ? {page_filter}
+            ORDER BY f.rank, f.rowid LIMIT ?
+            """,
+            params
         )
-        conn.commit()
+        rows = cur.fetchall()
+    rows, next_cursor = _page(rows, limit, lambda r: (r[6], r[0]))
+    return [r[:6] for r in rows], next_cursor
+
+# --- Health Vitals ---
+INSERT_VITAL_UNIQUE_SQL = (
+    "INSERT INTO health_vitals (username, vitals_type, value_main, value_secondary, notes, created_at) "
+    "SELECT ?1, ?2, ?3, ?4, ?5, ?6 WHERE NOT EXISTS "
+    "(SELECT 1 FROM health_vitals WHERE username=?1 AND vitals_type=?2 AND created_at=?6)"
+)
+
+def add_vital(username, vitals_type, v1, v2=None, notes=None, created_at=None):
+    """Queue a reading (created_at defaults to now, unix seconds); returns a Future like add_message."""
+    created_at = int(time.time()) if created_at is None else int(created_at)
+    return _enqueue(
+        "INSERT INTO health_vitals (username, vitals_type, value_main, value_secondary, notes, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (username, vitals_type, v1, v2, notes, created_at)
+    )
+
+def insert_vitals(rows, skip_duplicates=True):
+    """Insert (username, vitals_type, value_main, value_secondary, notes, created_at) rows in one
+    transaction, bypassing the write-behind queue; returns how many were inserted. With
+    `skip_duplicates`, rows whose user, type and created_at are already stored are skipped."""
+    sql = INSERT_VITAL_UNIQUE_SQL if skip_duplicates else (
+        "INSERT INTO health_vitals (username, vitals_type, value_main, value_secondary, notes, created_at) VALUES (?, ?, ?, ?, ?, ?)"
+    )
+    with _write() as conn:
+        before = conn.total_changes
+        conn.executemany(sql, rows)
+        return conn.total_changes - before
 
 def get_vitals_history(username, vitals_type):
-    with sqlite3.connect(DB_PATH) as conn:
+    with _read() as conn:
         cur = conn.execute(
             "SELECT value_main, value_secondary, notes, created_at FROM health_vitals WHERE username=? AND vitals_type=? ORDER BY created_at ASC",
             (username, vitals_type)
         )
         return cur.fetchall()
+
+def _vitals_range(start, end):
+    # Unbounded ends still compare, so every query is one index range scan
+    return (-(2 ** 63) if start is None else int(start)), (2 ** 63 - 1 if end is None else int(end))
+
+def get_vitals_extent(username, vitals_type, start=None, end=None):
+    """(count, first created_at, last created_at) of the readings in [start, end]."""
+    with _read() as conn:
+        return conn.execute(
+            "SELECT COUNT(*), MIN(created_at), MAX(created_at) FROM health_vitals "
+            "WHERE username=? AND vitals_type=? AND created_at BETWEEN ? AND ?",
+            (username, vitals_type, *_vitals_range(start, end))
+        ).fetchone()
+
+def get_vitals_range(username, vitals_type, start=None, end=None):
+    """(value_main, value_secondary, created_at) rows in [start, end], oldest first."""
+    with _read() as conn:
+        cur = conn.execute(
+            "SELECT value_main, value_secondary, created_at FROM health_vitals "
+            "WHERE username=? AND vitals_type=? AND created_at BETWEEN ? AND ? ORDER BY created_at ASC",
+            (username, vitals_type, *_vitals_range(start, end))
+        )
+        return cur.fetchall()
+
+def get_vitals_buckets(username, vitals_type, bucket_s, start=None, end=None):
+    """Per-bucket aggregates in [start, end], aggregated in SQLite.
+
+    Buckets are `bucket_s` wide and aligned to the epoch; rows are
+    (bucket_start, count, min, avg, max of value_main, min, avg, max of value_secondary).
+    """
+    with _read() as conn:
+        cur = conn.execute(
+            "SELECT created_at / ?1 * ?1 AS bucket, COUNT(*), MIN(value_main), AVG(value_main), MAX(value_main), "
+            "MIN(value_secondary), AVG(value_secondary), MAX(value_secondary) FROM health_vitals "
+            "WHERE username=?2 AND vitals_type=?3 AND created_at BETWEEN ?4 AND ?5 GROUP BY bucket ORDER BY bucket",
+            (int(bucket_s), username, vitals_type, *_vitals_range(start, end))
+        )
+        return cur.fetchall()
@@ -0,0 +1,256 @@
+"""Bulk import of vitals from CSV / JSONL device exports (BP cuffs, glucose meters).
+
+Rows are streamed in chunks through validation and unit normalisation and inserted with
+one executemany per chunk, each chunk in its own transaction, so memory stays flat however
+large the file. A reading whose (user, type, timestamp) is already stored, or appeared
+earlier in the file, is skipped as a duplicate.
+
+  python -m app.db.vitals_import export.csv --user alice
+  python -m app.db.vitals_import libre.jsonl --user alice --type sugar --unit mmol/L
+"""
+import argparse
+import csv
+import io
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import IO, Callable, Iterator
+
+from app.db import store
+
+MMOL_TO_MG_DL = 18.016  # glucose, 180.16 g/mol
+# Plausible ranges; anything outside is a device or transcription error
+RANGES = {"systolic": (50, 300), "diastolic": (20, 200), "glucose": (10, 1000)}
+MAX_ERROR_SAMPLES = 20
+
+# Accepted column names (lower-cased) for each field
+COLUMNS = {
+    "timestamp": ("timestamp", "created_at", "datetime", "date_time", "time", "date", "measured_at", "device timestamp"),
+    "type": ("vitals_type", "type", "kind", "record type"),
+    "systolic": ("systolic", "sys", "systolic_mmhg", "systolic (mmhg)"),
+    "diastolic": ("diastolic", "dia", "diastolic_mmhg", "diastolic (mmhg)"),
+    "glucose": ("glucose", "sugar", "blood_glucose", "bg", "value", "glucose_mg_dl", "glucose_mmol_l",
+                "historic glucose mg/dl", "historic glucose mmol/l"),
+    "unit": ("unit", "units", "glucose_unit"),
+    "notes": ("notes", "note", "comment", "comments"),
+}
+TYPE_ALIASES = {
+    "blood_pressure": "blood_pressure", "bp": "blood_pressure", "blood pressure": "blood_pressure",
+    "sugar": "sugar", "glucose": "sugar", "blood_glucose": "sugar", "bg": "sugar",
+}
+
+@dataclass
+class ImportReport:
+    rows_read: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    elapsed_s: float = 0.0
+    errors: Counter = field(default_factory=Counter)  # reason -> count
+    error_samples: list = field(default_factory=list)  # (line, reason) for the first few
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows_read / self.elapsed_s if self.elapsed_s else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "rows_read": self.rows_read,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "rows_per_s": round(self.rows_per_s, 1),
+            "errors": dict(self.errors),
+            "error_samples": self.error_samples,
+        }
+
+class InvalidRow(ValueError):
+    pass
+
+def parse_timestamp(value) -> int:
+    """Unix seconds from epoch seconds/milliseconds or an ISO 8601 string (naive = local time)."""
+    if value is None or value == "":
+        raise InvalidRow("missing timestamp")
+    if isinstance(value, (int, float)) or str(value).lstrip("-").replace(".", "", 1).isdigit():
+        ts = float(value)
+        return int(ts / 1000 if ts > 1e11 else ts)
+    text = str(value).strip().replace("Z", "+00:00")
+    for fmt in (None, "%d-%m-%Y %H:%M", "%m/%d/%Y %H:%M", "%d/%m/%Y %H:%M"):
+        try:
+            dt = datetime.fromisoformat(text) if fmt is None else datetime.strptime(text, fmt)
+            return int(dt.timestamp())
+        except ValueError:
+            continue
+    raise InvalidRow("bad timestamp")
+
+def _number(value, name: str) -> float | None:
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise InvalidRow(f"bad {name}") from None
+
+def _check_range(value: float, name: str):
+    lo, hi = RANGES[name]
+    if not lo <= value <= hi:
+        raise InvalidRow(f"{name} out of range")
+
+def _resolve(keys) -> dict[str, str]:
+    """Map our field names to the file's column names."""
+    lower = {str(k).strip().lower(): k for k in keys}
+    found = {}
+    for name, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in lower:
+                found[name] = lower[alias]
+                break
+    return found
+
+def normalise_row(row: dict, cols: dict[str, str], vitals_type: str | None, glucose_unit: str | None,
+                  max_ts: int) -> tuple[str, float, float | None, str | None, int]:
+    """(vitals_type, value_main, value_secondary, notes, created_at) in stored units, or InvalidRow."""
+    get = lambda name: row.get(cols[name]) if name in cols else None
+    created_at = parse_timestamp(get("timestamp"))
+    if created_at > max_ts:
+        raise InvalidRow("timestamp in the future")
+
+    kind = vitals_type
+    if kind is None and get("type") not in (None, ""):
+        kind = TYPE_ALIASES.get(str(get("type")).strip().lower())
+        if kind is None:
+            raise InvalidRow("unknown vitals type")
+    if kind is None:
+        kind = "blood_pressure" if get("systolic") not in (None, "") else "sugar"
+
+    notes = get("notes") or None
+    if kind == "blood_pressure":
+        sys, dia = _number(get("systolic"), "systolic"), _number(get("diastolic"), "diastolic")
+        if sys is None or dia is None:
+            raise InvalidRow("missing blood pressure value")
+        _check_range(sys, "systolic")
+        _check_range(dia, "diastolic")
+        if dia >= sys:
+            raise InvalidRow("diastolic not below systolic")
+        return kind, sys, dia, notes, created_at
+
+    glucose = _number(get("glucose"), "glucose")
+    if glucose is None:
+        raise InvalidRow("missing glucose value")
+    unit = (glucose_unit or get("unit") or "").strip().lower().replace(" ", "")
+    if not unit and "glucose" in cols and "mmol" in str(cols["glucose"]).lower():
+        unit = "mmol/l"
+    if unit.startswith("mmol"):
+        glucose = round(glucose * MMOL_TO_MG_DL, 1)
+    elif unit and not unit.startswith("mg"):
+        raise InvalidRow("unknown glucose unit")
+    _check_range(glucose, "glucose")
+    return kind, glucose, None, notes, created_at
+
+def _open_text(source) -> IO[str]:
+    if isinstance(source, (str, Path)):
+        return Path(source).open("r", encoding="utf-8-sig", newline="")
+    if isinstance(source, io.TextIOBase):
+        return source
+    # Binary file objects (e.g. a Streamlit upload)
+    return io.TextIOWrapper(source, encoding="utf-8-sig", newline="")
+
+def iter_records(source, fmt: str | None = None) -> Iterator[tuple[int, dict]]:
+    """(line number, raw record) pairs, streamed from a CSV or JSONL path or file object."""
+    if fmt is None:
+        name = str(source if isinstance(source, (str, Path)) else getattr(source, "name", ""))
+        fmt = "jsonl" if name.lower().endswith((".jsonl", ".ndjson")) else "csv"
+    f = _open_text(source)
+    try:
+        if fmt == "jsonl":
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if line:
+                    try:
+                        yield line_no, json.loads(line)
+                    except json.JSONDecodeError:
+                        yield line_no, None
+        elif fmt == "csv":
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            raise ValueError(f"unknown format {fmt!r}; expected csv or jsonl")
+    finally:
+        if isinstance(source, (str, Path)):
+            f.close()
+
+def import_vitals(source, username: str, fmt: str | None = None, vitals_type: str | None = None,
+                  glucose_unit: str | None = None, chunk_size: int = 5000,
+                  on_progress: Callable[[ImportReport], None] | None = None) -> ImportReport:
+    """Stream `source` into health_vitals for `username`; returns counts and rows/sec.
+
+    `vitals_type` and `glucose_unit` override what the file says (or leaves out); without
+    them the type comes from a type column or from which value columns are filled, and
+    glucose defaults to mg/dL.
+    """
+    if vitals_type is not None and vitals_type not in ("blood_pressure", "sugar"):
+        raise ValueError(f"unknown vitals type {vitals_type!r}")
+    report = ImportReport()
+    t0 = time.perf_counter()
+    max_ts = int(time.time()) + 86400  # allow for device clocks a little ahead
+    records = iter_records(source, fmt)
+    columns: dict[tuple, dict] = {}  # CSV has one header; JSONL objects may differ per line
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        rows = []
+        for line_no, record in chunk:
+            report.rows_read += 1
+            try:
+                if not isinstance(record, dict):
+                    raise InvalidRow("unreadable record")
+                keys = tuple(record)
+                cols = columns.get(keys)
+                if cols is None:
+                    cols = columns[keys] = _resolve(keys)
+                kind, main, secondary, notes, created_at = normalise_row(record, cols, vitals_type, glucose_unit, max_ts)
+            except InvalidRow as e:
+                report.invalid += 1
+                report.errors[str(e)] += 1
+                if len(report.error_samples) < MAX_ERROR_SAMPLES:
+                    report.error_samples.append((line_no, str(e)))
+                continue
+            rows.append((username, kind, main, secondary, notes, created_at))
+
+        if rows:
+            inserted = store.insert_vitals(rows)
+            report.inserted += inserted
+            report.duplicates += len(rows) - inserted
+        report.elapsed_s = time.perf_counter() - t0
+        if on_progress is not None:
+            on_progress(report)
+
+    report.elapsed_s = time.perf_counter() - t0
+    return report
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("path")
+    ap.add_argument("--user", required=True)
+    ap.add_argument("--type", choices=["blood_pressure", "sugar"], default=None)
+    ap.add_argument("--unit", default=None, help="glucose unit of the file: mg/dL or mmol/L")
+    ap.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    ap.add_argument("--chunk-size", type=int, default=5000)
+    args = ap.parse_args(argv)
+
+    store.init_db()
+    report = import_vitals(args.path, args.user, args.format, args.type, args.unit, args.chunk_size,
+                           on_progress=lambda r: print(f"\r{r.rows_read} rows, {r.rows_per_s:,.0f} rows/s", end="", flush=True))
+    print()
+    print(json.dumps(report.as_dict(), indent=2))
+
+if __name__ == "__main__":
+    main()
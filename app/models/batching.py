@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+@dataclass
+class _Request:
+    prompt: str
+    image: object
+    max_new_tokens: int
+    temperature: float
+    sections: bool = False
+    cancel: threading.Event | None = None
+    future: Future = field(default_factory=Future)
+
+class MicroBatcher:
+    """Collects concurrent `generate` calls for a few milliseconds and runs them as one batch.
+
+    Exposes the same `generate(...)` signature as `MedGemmaClient`, so it can be handed to the
+    `Orchestrator` in place of the client. Other attributes (`generate_stream`, the `supports_*`
+    capability flags) are forwarded to the wrapped client, so streaming and per-session requests
+    behave as with the bare client. Requests with a `session_id` skip the batch: they reuse the
+    session's KV cache, which batched rows do not carry. `sections=True` requests are batched
+    together, under one section controller per batch. A request whose `cancel` is set before its
+    batch starts is dropped (its `generate` raises CancelledError); once running, it finishes
+    with the rest of the batch.
+    """
+
+    def __init__(self, client, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.client = client
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.batches_run = 0
+        self.requests_served = 0
+
+        self._queue: queue.Queue[_Request | None] = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._loop, name="medgemma-batcher", daemon=True)
+        self._worker.start()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def submit(self, prompt: str, image=None, max_new_tokens: int = 512, temperature: float = 0.2,
+               sections: bool = False, cancel: threading.Event | None = None) -> Future:
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        req = _Request(prompt, image, max_new_tokens, temperature, sections, cancel)
+        self._queue.put(req)
+        return req.future
+
+    def generate(self, prompt: str, image=None, max_new_tokens: int = 512, temperature: float = 0.2,
+                 session_id: str | None = None, sections: bool = False, cancel: threading.Event | None = None) -> str:
+        if session_id is not None:
+            extra = {"sections": True} if sections else {}
+            if cancel is not None:
+                extra["cancel"] = cancel
+            return self.client.generate(prompt, image=image, max_new_tokens=max_new_tokens, temperature=temperature,
+                                        session_id=session_id, **extra)
+        return self.submit(prompt, image, max_new_tokens, temperature, sections, cancel).result()
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    @property
+    def avg_batch_size(self) -> float:
+        return self.requests_served / self.batches_run if self.batches_run else 0.0
+
+    def _collect(self, first: _Request) -> tuple[list[_Request], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if req is None:
+                return batch, True
+            batch.append(req)
+        return batch, False
+
+    def _loop(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stop = self._collect(first)
+
+            # Only requests with identical generation params can share a `model.generate` call
+            groups: dict[tuple, list[_Request]] = {}
+            for req in batch:
+                if req.cancel is not None and req.cancel.is_set():
+                    req.future.cancel()
+                    continue
+                groups.setdefault((req.max_new_tokens, req.temperature, req.sections), []).append(req)
+
+            for (max_new_tokens, temperature, sections), reqs in groups.items():
+                try:
+                    answers = self.client.generate_batch(
+                        [r.prompt for r in reqs],
+                        images=[r.image for r in reqs],
+                        max_new_tokens=max_new_tokens,
+                        temperature=temperature,
+                        **({"sections": True} if sections else {}),
+                    )
+                except Exception as e:
+                    for r in reqs:
+                        r.future.set_exception(e)
+                    continue
+                for r, answer in zip(reqs, answers):
+                    r.future.set_result(answer)
+                self.batches_run += 1
+                self.requests_served += len(reqs)
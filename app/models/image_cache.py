@@ -0,0 +1,182 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from app.utils.images import MAX_IMAGE_SIDE, content_hash, decode_image, image_key
+
+def _nbytes(value) -> int:
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, dict):
+        # Tensors by duck typing: torch is only imported once features exist (keeps model-server clients light)
+        return sum(v.numel() * v.element_size() for v in value.values() if hasattr(v, "element_size"))
+    return 0
+
+class ImageCache:
+    """LRU of decoded uploads and processed image features (`pixel_values` etc.), keyed by content hash.
+
+    The memory tier is bounded by `max_bytes`. With `disk_dir` set, feature tensors are also
+    written there as .npy files (bounded by `max_disk_bytes`, oldest removed first) and
+    reloaded memory-mapped after eviction or a restart.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 2**20, disk_dir: str | Path | None = None,
+                 max_disk_bytes: int = 2 * 2**30):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def stats(self) -> dict:
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def load_image(self, data: bytes, max_side: int = MAX_IMAGE_SIDE) -> Image.Image:
+        """Decoded, downscaled RGB image for upload bytes; repeat uploads skip decoding."""
+        key = ("image", content_hash(data), max_side)
+        img = self._get(key)
+        if img is None:
+            img = decode_image(data, max_side)
+            self._put(key, img)
+        return img
+
+    def get_features(self, key: str, variant: str = "") -> dict | None:
+        feats = self._get(("features", key, variant))
+        if feats is None and self.disk_dir is not None:
+            feats = self._load_disk(key, variant)
+            if feats is not None:
+                with self._lock:
+                    self.misses -= 1
+                    self.disk_hits += 1
+                self._put(("features", key, variant), feats)
+        return feats
+
+    def put_features(self, key: str, features: dict, variant: str = ""):
+        self._put(("features", key, variant), features)
+        if self.disk_dir is not None:
+            self._save_disk(key, variant, features)
+
+    def _get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _put(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= _nbytes(old)
+            self._entries[key] = value
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= _nbytes(evicted)
+                self.evictions += 1
+
+    def _disk_prefix(self, key: str, variant: str) -> str:
+        return f"{key}-{content_hash(variant.encode())[:8]}"
+
+    def _save_disk(self, key: str, variant: str, features: dict):
+        import torch
+
+        if not all(isinstance(v, torch.Tensor) and v.dtype != torch.bfloat16 for v in features.values()):
+            return
+        prefix = self._disk_prefix(key, variant)
+        try:
+            for name, tensor in features.items():
+                tmp = self.disk_dir / f"{prefix}.{name}.tmp.npy"
+                np.save(tmp, tensor.detach().cpu().numpy())
+                tmp.replace(self.disk_dir / f"{prefix}.{name}.npy")
+            self._prune_disk()
+        except OSError:
+            pass
+
+    def _load_disk(self, key: str, variant: str) -> dict | None:
+        import torch
+
+        files = list(self.disk_dir.glob(f"{self._disk_prefix(key, variant)}.*.npy"))
+        files = [f for f in files if not f.name.endswith(".tmp.npy")]
+        if not files:
+            return None
+        try:
+            # Copy-on-write mmap: pages are read lazily and the tensor stays writable
+            return {f.name.split(".")[1]: torch.from_numpy(np.load(f, mmap_mode="c")) for f in files}
+        except (OSError, ValueError):
+            return None
+
+    def _prune_disk(self):
+        files = sorted(self.disk_dir.glob("*.npy"), key=lambda f: f.stat().st_mtime)
+        total = sum(f.stat().st_size for f in files)
+        for f in files:
+            if total <= self.max_disk_bytes:
+                break
+            total -= f.stat().st_size
+            f.unlink(missing_ok=True)
+
+class CachedImageProcessor:
+    """Wraps a processor's `image_processor` so single-image calls are served from an ImageCache.
+
+    The multimodal processor still expands image tokens in the text as usual; only the
+    resize/rescale/normalise to `pixel_values` is skipped for images seen before.
+    """
+
+    def __init__(self, image_processor, cache: ImageCache):
+        self.image_processor = image_processor
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.image_processor, name)
+
+    def __call__(self, images, **kwargs):
+        import torch
+        from transformers import BatchFeature
+
+        flat = images
+        while isinstance(flat, (list, tuple)) and len(flat) == 1:
+            flat = flat[0]
+        if not isinstance(flat, Image.Image):
+            return self.image_processor(images, **kwargs)
+
+        key = image_key(flat)
+        variant = repr(sorted(kwargs.items()))
+        feats = self.cache.get_features(key, variant)
+        if feats is None:
+            out = self.image_processor(images, **kwargs)
+            if not all(isinstance(v, torch.Tensor) for v in out.values()):
+                return out
+            feats = dict(out)
+            self.cache.put_features(key, feats, variant)
+        return BatchFeature(dict(feats))
@@ -1,8 +1,52 @@
+import re
+from typing import Iterator
+
+import numpy as np
 import torch
 from transformers import pipeline
 import librosa
+import soundfile as sf
 
 DEFAULT_ASR_ID = "google/medasr"
+SAMPLE_RATE = 16000
+LONG_AUDIO_S = 60.0  # longer recordings are transcribed window by window
+
+def iter_audio_windows(audio_path: str, window_s: float = 30.0, overlap_s: float = 2.0) -> Iterator[np.ndarray]:
+    """Read fixed windows (with overlap) from disk as mono float32 at 16 kHz.
+
+    Only one window is in memory at a time, so peak memory does not depend on clip length.
+    """
+    file_sr = sf.info(audio_path).samplerate
+    blocksize = int(window_s * file_sr)
+    overlap = int(overlap_s * file_sr)
+    for block in sf.blocks(audio_path, blocksize=blocksize, overlap=overlap, dtype="float32", always_2d=True):
+        mono = block.mean(axis=1)
+        if file_sr != SAMPLE_RATE:
+            mono = librosa.resample(mono, orig_sr=file_sr, target_sr=SAMPLE_RATE)
+        yield mono
+
+def has_speech(audio: np.ndarray, threshold_db: float = -45.0, frame_s: float = 0.03, min_ratio: float = 0.02) -> bool:
+    """Energy VAD: true if enough 30 ms frames are louder than `threshold_db` (dBFS RMS)."""
+    frame = int(frame_s * SAMPLE_RATE)
+    n = len(audio) // frame
+    if n == 0:
+        return False
+    rms = np.sqrt(np.mean(audio[: n * frame].reshape(n, frame) ** 2, axis=1))
+    loud = 20 * np.log10(rms + 1e-10) > threshold_db
+    return loud.mean() >= min_ratio
+
+def _norm_word(w: str) -> str:
+    return re.sub(r"[^\w]", "", w.lower())
+
+def stitch_overlap(prev_words: list[str], text: str, max_overlap_words: int = 12) -> str:
+    """Drop the words at the start of `text` that repeat the tail of the previous window."""
+    words = text.split()
+    tail = [_norm_word(w) for w in prev_words[-max_overlap_words:]]
+    head = [_norm_word(w) for w in words[:max_overlap_words]]
+    for k in range(min(len(tail), len(head)), 0, -1):
+        if tail[-k:] == head[:k]:
+            return " ".join(words[k:])
+    return text
 
 class MedASRClient:
     def __init__(self, model_id: str = DEFAULT_ASR_ID):
@@ -10,9 +54,72 @@ class MedASRClient:
         self.device = "mps" if torch.backends.mps.is_available() else ("cuda" if torch.cuda.is_available() else "cpu")
         self.asr = pipeline("automatic-speech-recognition", model=model_id, device=self.device)
 
+    @classmethod
+    def from_pipeline(cls, asr, device: str = "cpu"):
+        """Wrap an existing ASR callable (e.g. a stub pipeline for CPU-only checks)."""
+        client = cls.__new__(cls)
+        client.device = device
+        client.asr = asr
+        return client
+
     def transcribe(self, audio_path: str) -> str:
+        try:
+            duration = sf.info(audio_path).duration
+        except RuntimeError:
+            duration = 0.0  # not readable by soundfile; librosa falls back to audioread below
+        if duration > LONG_AUDIO_S:
+            return self.transcribe_long(audio_path)
+
         # Load audio using librosa to avoid ffmpeg dependency in transformers
         # transformers pipeline handles numpy arrays (float32, 16kHz)
-        audio, sr = librosa.load(audio_path, sr=16000)
+        audio, sr = librosa.load(audio_path, sr=SAMPLE_RATE)
         result = self.asr(audio)
         return (result.get("text") or "").strip()
+
+    def transcribe_batch(self, audio_paths: list[str], batch_size: int = 8) -> list[str]:
+        """Transcribe several clips with one pipeline call; long recordings go through the windowed path."""
+        results: list[str | None] = [None] * len(audio_paths)
+        short_idx, audios = [], []
+        for i, path in enumerate(audio_paths):
+            try:
+                duration = sf.info(path).duration
+            except RuntimeError:
+                duration = 0.0
+            if duration > LONG_AUDIO_S:
+                results[i] = self.transcribe_long(path)
+            else:
+                short_idx.append(i)
+                audios.append(librosa.load(path, sr=SAMPLE_RATE)[0])
+
+        if audios:
+            outputs = self.asr(audios, batch_size=batch_size)
+            for i, out in zip(short_idx, outputs):
+                results[i] = (out.get("text") or "").strip()
+        return results
+
+    def transcribe_stream(
+        self,
+        audio_path: str,
+        window_s: float = 30.0,
+        overlap_s: float = 2.0,
+        vad_threshold_db: float = -45.0,
+    ) -> Iterator[str]:
+        """Yield transcript pieces window by window for long recordings.
+
+        Audio is read in overlapping windows via soundfile, silent windows are skipped by an
+        energy VAD, and words repeated across the overlap are removed before yielding.
+        """
+        prev_words: list[str] = []
+        for window in iter_audio_windows(audio_path, window_s, overlap_s):
+            if not has_speech(window, vad_threshold_db):
+                # Nothing carries over a silent gap
+                prev_words = []
+                continue
+            text = (self.asr(window).get("text") or "").strip()
+            piece = stitch_overlap(prev_words, text) if prev_words else text
+            prev_words = text.split()
+            if piece:
+                yield piece
+
+    def transcribe_long(self, audio_path: str, **stream_kwargs) -> str:
+        return " ".join(self.transcribe_stream(audio_path, **stream_kwargs)).strip()
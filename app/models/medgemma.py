@@ -1,70 +1,366 @@
+import os
+import time
+from threading import Thread
+from typing import Iterator
+
 import torch
-from transformers import AutoProcessor, AutoModelForImageTextToText
+from transformers import AutoProcessor, AutoModelForCausalLM, AutoModelForImageTextToText, DynamicCache, TextIteratorStreamer
+from transformers.generation import BaseStreamer, LogitsProcessorList, StoppingCriteria, StoppingCriteriaList
+
+from app.core import tracing
+from app.core.metrics import log_event
+from app.core.prompts import SYSTEM_STYLE
+from app.models.image_cache import CachedImageProcessor, ImageCache
+from app.models.precision import apply_precision, load_kwargs, resolve_precision
+from app.models.prefix_cache import PrefixCache, SessionKVCache, full_length_cache
+from app.models.section_control import SectionController
+from app.models.speculative import SpeculativeDecoder
 
 DEFAULT_MODEL_ID = "google/medgemma-1.5-4b-it"  # multimodal instruction-tuned
 
+class _FirstTokenTimer(BaseStreamer):
+    """Records when the first generated token arrives (generate() first puts the prompt ids)."""
+
+    def __init__(self):
+        self.puts = 0
+        self.first_token_at = None
+
+    def put(self, value):
+        self.puts += 1
+        if self.puts == 2:
+            self.first_token_at = time.perf_counter()
+
+    def end(self):
+        pass
+
+class _Cancelled(StoppingCriteria):
+    """Stops generation at the next token once `event` is set (the caller abandoned the request)."""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+def _record_generation(sp, prompt_tokens: int, new_tokens: int, t0: float, elapsed: float, first_token_at: float | None):
+    ttft = (first_token_at - t0) if first_token_at else elapsed
+    decode_s = elapsed - ttft
+    sp.set(
+        prompt_tokens=prompt_tokens,
+        new_tokens=new_tokens,
+        ttft_ms=round(ttft * 1000, 3),
+        tokens_per_s=round(new_tokens / elapsed, 2) if elapsed else None,
+        decode_tokens_per_s=round((new_tokens - 1) / decode_s, 2) if decode_s > 0 and new_tokens > 1 else None,
+    )
+
 class MedGemmaClient:
-    def __init__(self, model_id: str = DEFAULT_MODEL_ID, device: str | None = None):
+    supports_session_cache = True  # the Orchestrator passes session_id= for multi-turn KV reuse
+    supports_cancel = True  # generate/generate_stream accept cancel= (a threading.Event)
+    supports_sections = True  # generate/generate_stream accept sections=True (four-section answer control)
+
+    def __init__(self, model_id: str = DEFAULT_MODEL_ID, device: str | None = None, precision: str | None = None,
+                 draft_model_id: str | None = None):
         self.model_id = model_id
         self.device = device or ("mps" if torch.backends.mps.is_available() else "cpu")
+        # auto | fp32 | bf16 | int8 | int4; defaults to MEDGEMMA_PRECISION
+        self.precision = resolve_precision(precision, self.device)
 
         self.processor = AutoProcessor.from_pretrained(model_id)
-        
-        # Using bfloat16 is generally more stable for Gemma models than float16
-        dtype = torch.bfloat16 if self.device != "cpu" else torch.float32
-        
+
         self.model = AutoModelForImageTextToText.from_pretrained(
             model_id,
-            torch_dtype=dtype,
-            device_map=self.device
+            **load_kwargs(self.precision, self.device),
         )
+        self.model = apply_precision(self.model, self.precision)
+        self._init_runtime()
 
-    @torch.inference_mode()
-    def generate(self, prompt: str, image=None, max_new_tokens: int = 512, temperature: float = 0.2) -> str:
+        # Small text-only model sharing the tokenizer, e.g. a Gemma 3 270M/1B checkpoint
+        draft_model_id = draft_model_id or os.environ.get("MEDGEMMA_DRAFT_MODEL")
+        if draft_model_id:
+            draft = AutoModelForCausalLM.from_pretrained(draft_model_id, torch_dtype=self.model.dtype, device_map=self.device)
+            self.enable_speculation(draft.eval())
+
+    def _init_runtime(self):
+        self.speculative: SpeculativeDecoder | None = None
+        # Every prompt from build_user_prompt starts with SYSTEM_STYLE; prefill it once
+        self.prefix_cache = PrefixCache(SYSTEM_STYLE)
+        # A follow-up turn repeats the previous prompt + answer; only the new tail is prefilled
+        self.session_cache = SessionKVCache(int(os.environ.get("MEDGEMMA_SESSION_CACHE_TOKENS", "8192")))
+        # Follow-up questions about the same scan reuse its decoded image and pixel_values
+        self.image_cache = ImageCache(disk_dir=os.environ.get("MEDGEMMA_IMAGE_CACHE_DIR") or None)
+        # sections=True answers get per-section token caps and stop once the last section is done
+        self.section_control = os.environ.get("MEDGEMMA_SECTION_CONTROL", "1") != "0"
+        image_processor = getattr(self.processor, "image_processor", None)
+        if image_processor is not None and not isinstance(image_processor, CachedImageProcessor):
+            self.processor.image_processor = CachedImageProcessor(image_processor, self.image_cache)
+
+    @classmethod
+    def from_components(cls, model, processor, device: str = "cpu", model_id: str | None = None,
+                        precision: str = "fp32", draft_model=None):
+        """Wrap an already-loaded model/processor pair (e.g. a tiny random model for benchmarks)."""
+        client = cls.__new__(cls)
+        client.model_id = model_id or getattr(model.config, "_name_or_path", "") or "in-memory"
+        client.device = device
+        client.precision = resolve_precision(precision, device)
+        client.model = apply_precision(model, client.precision)
+        client.processor = processor
+        client._init_runtime()
+        if draft_model is not None:
+            client.enable_speculation(draft_model)
+        return client
+
+    def enable_speculation(self, draft_model, num_assistant_tokens: int | None = None,
+                           confidence_threshold: float | None = None):
+        """Use `draft_model` for assisted generation on text-only single requests."""
+        self.speculative = SpeculativeDecoder(draft_model, num_assistant_tokens, confidence_threshold)
+
+    @property
+    def tokenizer(self):
+        # AutoProcessor wraps a tokenizer; a bare tokenizer can also act as the processor
+        return getattr(self.processor, "tokenizer", self.processor)
+
+    def _format_prompt(self, prompt: str, has_image: bool) -> str:
         # Construct messages for chat template
         content = []
-        if image is not None:
+        if has_image:
             content.append({"type": "image"})
         content.append({"type": "text", "text": prompt})
-        
+
         messages = [
             {"role": "user", "content": content}
         ]
 
         # Use processor's chat template which handles <image> tokens automatically
-        formatted_prompt = self.processor.apply_chat_template(
-            messages, 
-            add_generation_prompt=True, 
+        return self.processor.apply_chat_template(
+            messages,
+            add_generation_prompt=True,
             tokenize=False
         )
-        
-        print(f"DEBUG: Formatted Prompt: {formatted_prompt}")
 
+    def _prepare_inputs(self, formatted_prompts: list[str], images: list | None) -> dict:
         # Processor handles text and images
-        # Ensure images is a list as some processors expect it
-        images = [image] if image is not None else None
-        
-        inputs = self.processor(
-            text=formatted_prompt,
-            images=images,
-            return_tensors="pt"
-        )
-        # Ensure inputs match the model's device and dtype
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
-        if "pixel_values" in inputs:
-            inputs["pixel_values"] = inputs["pixel_values"].to(self.model.dtype)
+        kwargs = {"text": formatted_prompts if len(formatted_prompts) > 1 else formatted_prompts[0]}
+        if images:
+            # Some processors expect one list of images per sample
+            kwargs["images"] = [[img] for img in images] if len(images) > 1 else images
+        if len(formatted_prompts) > 1:
+            # Decoder-only models must be left-padded so every row ends at the generation point
+            kwargs["padding"] = True
 
+        with tracing.span("generate.processor"):
+            inputs = self.processor(**kwargs, return_tensors="pt")
+        with tracing.span("generate.to_device"):
+            # Ensure inputs match the model's device and dtype
+            inputs = {k: v.to(self.device) for k, v in inputs.items()}
+            if "pixel_values" in inputs:
+                inputs["pixel_values"] = inputs["pixel_values"].to(self.model.dtype)
+        return inputs
+
+    def _generate_ids(self, inputs: dict, max_new_tokens: int, temperature: float, **extra):
         # Use greedy decoding if temperature is 0 or very low for stability
         do_sample = temperature > 0.01
 
-        input_len = inputs["input_ids"].shape[1]
-
-        out = self.model.generate(
+        return self.model.generate(
             **inputs,
             max_new_tokens=max_new_tokens,
             do_sample=do_sample,
             temperature=temperature if do_sample else None,
+            pad_token_id=self.tokenizer.pad_token_id,
+            **extra,
         )
-        # Only decode the newly generated tokens
-        new_tokens = out[0][input_len:]
-        return self.processor.decode(new_tokens, skip_special_tokens=True).strip()
+
+    def _run_generate(self, inputs: dict, max_new_tokens: int, temperature: float, speculate: bool,
+                      streamer=None, **extra):
+        """model.generate, assisted by the draft model when `speculate`; returns (ids, SpeculationStats | None)."""
+        if not speculate:
+            if streamer is not None:
+                extra["streamer"] = streamer
+            return self._generate_ids(inputs, max_new_tokens, temperature, **extra), None
+        spec_kwargs, counter = self.speculative.prepare(streamer)
+        t0 = time.perf_counter()
+        out = self._generate_ids(inputs, max_new_tokens, temperature, **spec_kwargs, **extra)
+        return out, self.speculative.record(counter, out.shape[1] - inputs["input_ids"].shape[1], t0)
+
+    def _single_inputs(self, prompt: str, image, session_id: str | None = None) -> tuple[dict, dict, int]:
+        """Processor inputs, extra generate kwargs (a reusable KV cache) and how many prompt tokens it covers."""
+        with tracing.span("generate.chat_template"):
+            formatted_prompt = self._format_prompt(prompt, image is not None)
+
+        # Ensure images is a list as some processors expect it
+        images = [image] if image is not None else None
+        inputs = self._prepare_inputs([formatted_prompt], images)
+
+        extra = {}
+        reused = 0
+        if image is None:
+            past = None
+            if session_id is not None:
+                with tracing.span("generate.session_cache") as sp:
+                    past, reused = self.session_cache.lookup(self, session_id, inputs["input_ids"])
+                    sp.set(hit=past is not None)
+            if past is None:
+                with tracing.span("generate.prefix_cache") as sp:
+                    past = self.prefix_cache.lookup(self, inputs["input_ids"])
+                    if past is not None and session_id is not None:
+                        # Kept for the session's next turn, which may crop it back past a sliding window
+                        past = full_length_cache(past)
+                    sp.set(hit=past is not None)
+                reused = self.prefix_cache.prefix_tokens if past is not None else 0
+            if past is None and session_id is not None:
+                # An explicit full-length cache object so it can be kept and cropped for the next turn
+                past = DynamicCache()
+            if past is not None:
+                # Only the tokens after the cached prefix get prefilled
+                extra["past_key_values"] = past
+        return inputs, extra, reused
+
+    def prepare_image(self, image):
+        """Run image preprocessing now, so a following generate() finds the pixel_values cached."""
+        with torch.inference_mode():
+            self._prepare_inputs([self._format_prompt("", has_image=True)], [image])
+
+    def _controls(self, extra: dict, input_len: int, max_new_tokens: int, sections: bool, speculate: bool,
+                  cancel=None) -> SectionController | None:
+        """Add the cancel / section stopping criteria to `extra`; returns the section controller, if any."""
+        criteria = [_Cancelled(cancel)] if cancel is not None else []
+        controller = None
+        if sections and self.section_control:
+            controller = SectionController(self.tokenizer, input_len, max_new_tokens)
+            criteria.append(controller.stopping_criteria)
+            # Forcing a heading would fight the draft model's proposals; assisted runs only stop early
+            if not speculate:
+                extra["logits_processor"] = LogitsProcessorList([controller.logits_processor])
+        if criteria:
+            extra["stopping_criteria"] = StoppingCriteriaList(criteria)
+        return controller
+
+    def _report_sections(self, controller: SectionController | None, sp=None, row: int = 0):
+        if controller is None:
+            return
+        report = controller.report(row)
+        if sp is not None:
+            sp.set(**{f"sections_{k}": v for k, v in report.items()})
+        log_event({"type": "section_control", **report})
+
+    def _remember(self, session_id: str | None, out: torch.Tensor, extra: dict):
+        past = extra.get("past_key_values")
+        if session_id is not None and past is not None:
+            self.session_cache.store(self, session_id, out[:1], past)
+
+    @torch.inference_mode()
+    def generate(self, prompt: str, image=None, max_new_tokens: int = 512, temperature: float = 0.2,
+                 session_id: str | None = None, cancel=None, sections: bool = False) -> str:
+        with tracing.span("generate", image=image is not None) as gen_sp:
+            inputs, extra, reused = self._single_inputs(prompt, image, session_id)
+            input_len = inputs["input_ids"].shape[1]
+            gen_sp.set(prefill_tokens=input_len - reused, reused_tokens=reused)
+
+            # Assisted generation is text-only here; image prompts decode normally
+            speculate = self.speculative is not None and image is None
+            controller = self._controls(extra, input_len, max_new_tokens, sections, speculate, cancel)
+            timer = _FirstTokenTimer() if tracing.is_enabled() else None
+            with tracing.span("generate.model", speculative=speculate) as sp, tracing.torch_profile("generate"):
+                t0 = time.perf_counter()
+                out, spec = self._run_generate(inputs, max_new_tokens, temperature, speculate, streamer=timer, **extra)
+                elapsed = time.perf_counter() - t0
+                if spec is not None:
+                    sp.set(acceptance_rate=round(spec.acceptance_rate, 4), tokens_per_step=round(spec.tokens_per_step, 3))
+            self._remember(session_id, out, extra)
+            # Only decode the newly generated tokens
+            new_tokens = out[0][input_len:]
+            if timer is not None:
+                _record_generation(sp, input_len, len(new_tokens), t0, elapsed, timer.first_token_at)
+            self._report_sections(controller, gen_sp)
+
+            with tracing.span("generate.detokenize"):
+                return self.processor.decode(new_tokens, skip_special_tokens=True).strip()
+
+    def generate_stream(
+        self, prompt: str, image=None, max_new_tokens: int = 512, temperature: float = 0.2,
+        session_id: str | None = None, cancel=None, sections: bool = False,
+    ) -> Iterator[str]:
+        """Yield text deltas as they are decoded; generation runs in a worker thread.
+
+        Setting `cancel` (a threading.Event) stops generation after the current token.
+        """
+        with torch.inference_mode():
+            inputs, extra, _ = self._single_inputs(prompt, image, session_id)
+        speculate = self.speculative is not None and image is None
+        controller = self._controls(extra, inputs["input_ids"].shape[1], max_new_tokens, sections, speculate, cancel)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+
+        def _run():
+            try:
+                with torch.inference_mode():
+                    # Runs in this thread so the draft-call counter sees this request only
+                    out, _ = self._run_generate(inputs, max_new_tokens, temperature, speculate, streamer=streamer, **extra)
+                self._remember(session_id, out, extra)
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        worker = Thread(target=_run, name="medgemma-stream", daemon=True)
+        worker.start()
+
+        started = False
+        for delta in streamer:
+            if not started:
+                # Match generate(): no leading whitespace in the answer
+                delta = delta.lstrip()
+                started = bool(delta)
+            if delta:
+                yield delta
+        worker.join()
+        if errors:
+            raise errors[0]
+        self._report_sections(controller)
+
+    @torch.inference_mode()
+    def generate_batch(
+        self,
+        prompts: list[str],
+        images: list | None = None,
+        max_new_tokens: int = 512,
+        temperature: float = 0.2,
+        sections: bool = False,
+    ) -> list[str]:
+        """Generate answers for several prompts with one `model.generate` call per modality.
+
+        `images` is aligned with `prompts` (use None for text-only entries). Text-only and
+        image+text prompts are run as separate padded batches; results keep the input order.
+        With `sections`, one section controller follows every row of the batch.
+        """
+        if images is None:
+            images = [None] * len(prompts)
+        if len(images) != len(prompts):
+            raise ValueError("images must be aligned with prompts")
+
+        results: list[str | None] = [None] * len(prompts)
+        text_idx = [i for i, img in enumerate(images) if img is None]
+        image_idx = [i for i, img in enumerate(images) if img is not None]
+
+        with tracing.span("generate_batch", batch_size=len(prompts)):
+            tokenizer = self.tokenizer
+            prev_side = tokenizer.padding_side
+            tokenizer.padding_side = "left"
+            try:
+                for idx in (text_idx, image_idx):
+                    if not idx:
+                        continue
+                    formatted = [self._format_prompt(prompts[i], images[i] is not None) for i in idx]
+                    batch_images = [images[i] for i in idx] if images[idx[0]] is not None else None
+                    inputs = self._prepare_inputs(formatted, batch_images)
+
+                    # With left padding every row's new tokens start at the same offset
+                    input_len = inputs["input_ids"].shape[1]
+                    extra = {}
+                    controller = self._controls(extra, input_len, max_new_tokens, sections, speculate=False)
+                    out = self._generate_ids(inputs, max_new_tokens, temperature, **extra)
+                    for row, i in enumerate(idx):
+                        results[i] = self.processor.decode(out[row][input_len:], skip_special_tokens=True).strip()
+                        self._report_sections(controller, row=row)
+            finally:
+                tokenizer.padding_side = prev_side
+
+        return results
@@ -0,0 +1,78 @@
+import os
+
+import torch
+from torch import nn
+
+# auto: bf16 on GPU/MPS (more stable than fp16 for Gemma), fp32 on CPU
+PRECISIONS = ("auto", "fp32", "bf16", "int8", "int4")
+DEFAULT_PRECISION = os.environ.get("MEDGEMMA_PRECISION", "auto")
+
+def resolve_precision(precision: str | None, device: str) -> str:
+    precision = (precision or DEFAULT_PRECISION).lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"unknown precision {precision!r}; expected one of {PRECISIONS}")
+    if precision == "auto":
+        return "bf16" if device != "cpu" else "fp32"
+    if precision == "int8" and device != "cpu":
+        raise ValueError("int8 dynamic quantisation runs on CPU only; use bf16 or int4 on GPU")
+    if precision == "int4":
+        try:
+            import bitsandbytes  # noqa: F401
+        except ImportError as e:
+            raise ValueError("int4 needs the bitsandbytes package") from e
+        if not torch.cuda.is_available():
+            raise ValueError("int4 weight-only quantisation needs a CUDA device with bitsandbytes")
+    return precision
+
+def load_kwargs(precision: str, device: str) -> dict:
+    """`from_pretrained` keyword arguments for a resolved precision."""
+    if precision == "bf16":
+        return {"torch_dtype": torch.bfloat16, "device_map": device}
+    if precision == "int4":
+        from transformers import BitsAndBytesConfig
+        return {
+            "quantization_config": BitsAndBytesConfig(
+                load_in_4bit=True, bnb_4bit_quant_type="nf4", bnb_4bit_compute_dtype=torch.bfloat16
+            ),
+            "device_map": device,
+        }
+    # fp32, and int8 which quantises the fp32 weights after loading
+    return {"torch_dtype": torch.float32, "device_map": device}
+
+def apply_precision(model: nn.Module, precision: str) -> nn.Module:
+    """Post-load conversion: bf16 cast, or dynamic int8 quantisation of the Linear layers.
+
+    The output projection (lm_head) stays in full precision: it is one layer but shapes every
+    token's logits, so quantising it costs the most accuracy for the least memory.
+    """
+    if precision == "bf16" and model.dtype != torch.bfloat16:
+        return model.to(torch.bfloat16)
+    if precision == "int8":
+        if model.dtype != torch.float32:
+            model = model.to(torch.float32)
+        linear_names = {
+            name for name, module in model.named_modules()
+            if isinstance(module, nn.Linear) and not name.endswith("lm_head")
+        }
+        return torch.ao.quantization.quantize_dynamic(model, linear_names, dtype=torch.qint8)
+    if precision == "int4" and not getattr(model, "is_loaded_in_4bit", False):
+        raise ValueError("int4 weights are quantised while loading; pass load_kwargs('int4', device) to from_pretrained")
+    return model
+
+def model_memory_bytes(model: nn.Module) -> int:
+    """Bytes held by weights and buffers, including packed quantised weights."""
+    seen, total = set(), 0
+
+    def add(value):
+        nonlocal total
+        if isinstance(value, torch.Tensor):
+            if value.is_quantized or value.data_ptr() not in seen:
+                seen.add(value.data_ptr())
+                total += value.numel() * value.element_size()
+        elif isinstance(value, (tuple, list)):
+            for v in value:
+                add(v)
+
+    for value in model.state_dict().values():
+        add(value)
+    return total
@@ -0,0 +1,183 @@
+import copy
+import threading
+from collections import OrderedDict
+
+import torch
+from transformers import DynamicCache
+
+class PrefixCache:
+    """Past-key-values for the fixed prompt preamble, prefilled once per model/precision/device.
+
+    Every text-only prompt starts with the chat-template-wrapped `SYSTEM_STYLE` block, so its
+    KV cache can be computed once and a copy handed to each `generate` call; only the
+    question-specific suffix is then prefilled. Changing `prefix_text` invalidates the entry.
+    """
+
+    def __init__(self, prefix_text: str | None = None):
+        self.prefix_text = prefix_text
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0  # prompts that do not start with the preamble
+
+        self._key = None
+        self._ids = None
+        self._kv = None
+        self._lock = threading.Lock()
+
+    @property
+    def prefix_tokens(self) -> int:
+        return 0 if self._ids is None else int(self._ids.shape[1])
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "prefix_tokens": self.prefix_tokens,
+        }
+
+    def invalidate(self):
+        with self._lock:
+            self._key = self._ids = self._kv = None
+
+    def lookup(self, client, input_ids: torch.Tensor):
+        """Return a private copy of the preamble cache if `input_ids` (1 x L) starts with it, else None."""
+        if not self.prefix_text or input_ids.shape[0] != 1:
+            return None
+
+        with self._lock:
+            key = (client.model_id, getattr(client, "precision", str(client.model.dtype)), str(client.device), self.prefix_text)
+            if key != self._key:
+                self._build(client, key)
+                self.misses += 1
+                cold = True
+            else:
+                cold = False
+
+            n = self.prefix_tokens
+            if n == 0 or input_ids.shape[1] <= n or not torch.equal(input_ids[0, :n], self._ids[0].to(input_ids.device)):
+                if not cold:
+                    self.bypasses += 1
+                return None
+            if not cold:
+                self.hits += 1
+            # generate() appends to the cache in place, so every request gets its own copy
+            return copy.deepcopy(self._kv)
+
+    @torch.inference_mode()
+    def _build(self, client, key):
+        # The chat template trims message text, so locate the stripped preamble in the wrapped prompt
+        core = self.prefix_text.strip()
+        wrapped = client._format_prompt(core, has_image=False)
+        prefix_str = wrapped[: wrapped.index(core) + len(core)]
+
+        ids = client._prepare_inputs([prefix_str], None)["input_ids"]
+        # Drop the last token: it may merge with the question text when the full prompt is tokenised
+        ids = ids[:, :-1]
+        out = client.model(input_ids=ids, use_cache=True)
+
+        self._key = key
+        self._ids = ids
+        self._kv = out.past_key_values
+
+def full_length_cache(past) -> DynamicCache | None:
+    """A copy of `past` with every layer, sliding-window ones included, as a full-length layer;
+    None if a sliding-window layer has already dropped early positions."""
+    n = past.get_seq_length()
+    full = DynamicCache()
+    for i, layer in enumerate(past.layers):
+        if layer.keys is None or layer.keys.shape[-2] != n:
+            return None
+        full.update(layer.keys, layer.values, i)
+    return full
+
+def _complete(kv) -> bool:
+    """Every layer still holds every position, so the cache can be cropped back to any prefix."""
+    n = kv.get_seq_length()
+    return all(layer.keys is not None and layer.keys.shape[-2] == n for layer in kv.layers)
+
+class SessionKVCache:
+    """Per-conversation KV cache, so a follow-up turn only prefills what changed since the last one.
+
+    After each text-only generation the session's cache (prompt + answer) is kept with its
+    token ids. The next prompt repeats the preamble and earlier turns verbatim, so a copy of
+    the cache is cropped to the longest common token prefix and only the rest is prefilled.
+    Entries are LRU-evicted past `max_tokens` in total. Session caches keep full-length
+    layers, sliding-window ones included (see `full_length_cache`): a sliding-window layer
+    (Gemma 3: 1024 tokens) drops the early positions a crop would need, while the attention
+    masks still apply the window to a full-length layer. Caches that have lost positions are
+    not kept.
+    """
+
+    def __init__(self, max_tokens: int = 8192):
+        self.max_tokens = max_tokens
+        self.reused_tokens = 0
+        self.prefilled_tokens = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()  # session_id -> (model key, ids, kv)
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.reused_tokens + self.prefilled_tokens
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "sessions": len(self._entries),
+                "reused_tokens": self.reused_tokens,
+                "prefilled_tokens": self.prefilled_tokens,
+                "reuse_rate": self.reused_tokens / total if total else 0.0,
+            }
+
+    @staticmethod
+    def _model_key(client) -> tuple:
+        return (client.model_id, getattr(client, "precision", str(client.model.dtype)), str(client.device))
+
+    def lookup(self, client, session_id: str, input_ids: torch.Tensor) -> tuple[object | None, int]:
+        """(private cache cropped to the shared prefix, reused length), or (None, 0)."""
+        n_new = int(input_ids.shape[1])
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                self._entries.move_to_end(session_id)
+
+        common = 0
+        if entry is not None and entry[0] == self._model_key(client) and input_ids.shape[0] == 1:
+            _, ids, kv = entry
+            n = min(ids.shape[1], n_new - 1)  # leave at least one token to prefill
+            if n > 0:
+                same = (ids[0, :n] == input_ids[0, :n].to(ids.device)).int()
+                common = int(same.cumprod(0).sum())
+        past = None
+        if common:
+            past = copy.deepcopy(kv)
+            if past.get_seq_length() > common:
+                past.crop(common - past.get_seq_length())
+
+        with self._lock:
+            if past is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            self.reused_tokens += common
+            self.prefilled_tokens += n_new - common
+        return past, common
+
+    def store(self, client, session_id: str, ids: torch.Tensor, kv):
+        """Keep `kv` (covering `ids`, 1 x L) for the session's next turn; the caller gives up `kv`."""
+        if not _complete(kv):
+            return
+        with self._lock:
+            self._entries.pop(session_id, None)
+            self._entries[session_id] = (self._model_key(client), ids[:, : kv.get_seq_length()].detach(), kv)
+            total = sum(e[1].shape[1] for e in self._entries.values())
+            while total > self.max_tokens and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                total -= evicted[1].shape[1]
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._entries.pop(session_id, None)
@@ -0,0 +1,145 @@
+import re
+
+import torch
+from transformers.generation import LogitsProcessor, StoppingCriteria
+
+# The answer headings SYSTEM_STYLE asks for, in order
+SECTION_TITLES = (
+    "Plain-language summary",
+    "Questions to ask a doctor",
+    "Red flags (when to seek urgent care)",
+    "What this is based on",
+)
+MAX_SECTION_TOKENS = 192
+MAX_FINAL_TOKENS = 160
+RESERVE_TOKENS = 48  # budget held back for each section still to come
+GRACE_TOKENS = 24  # past a cap, how long to wait for a sentence end before forcing the next heading
+HEADING_LOOKBACK = 24  # tokens before a section's start that are re-decoded so its heading stays visible
+DECODE_WINDOW = 48  # later in a section only this many recent tokens are re-decoded per step
+
+def _heading_pattern(title: str) -> re.Pattern:
+    short = re.escape(title.split(" (")[0])
+    # At a line start (optionally bulleted / bold / "#"), or right after a "2)" or "2." number
+    return re.compile(rf"(?:^[ \t#>*_-]*(?:\d[.)][ \t]*)?|\d[.)][ \t]*)[*_]*[ \t]*{short}", re.IGNORECASE | re.MULTILINE)
+
+_HEADINGS = [_heading_pattern(t) for t in SECTION_TITLES]
+_HEADING_TAIL = re.compile(r"[*_: \t]*(?:\([^)\n]*\))?[*_: \t]*")  # closing bold, colon, "(...)" after a title
+_PARAGRAPH_END = re.compile(r"\S[ \t]*\n[ \t]*\n")
+_SENTENCE_END = (".", "!", "?", ":", "\n")
+
+class _Row:
+    def __init__(self):
+        self.section = 0  # headings seen so far; 0 = still before the first
+        self.section_start = 0  # generated-token index where the current section began
+        self.ids: list[int] = []  # generated tokens so far
+        self.forced: list[int] = []  # heading tokens still to be forced
+        self.forced_headings = 0
+        self.stop: str | None = None  # why the controller ended this row
+
+class _StopWhenDone(StoppingCriteria):
+    def __init__(self, controller: "SectionController"):
+        self.controller = controller
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.controller.update(input_ids)
+
+class _ForceHeadings(LogitsProcessor):
+    def __init__(self, controller: "SectionController"):
+        self.controller = controller
+
+    def __call__(self, input_ids, scores):
+        for i, row in enumerate(self.controller.rows):
+            if row.forced:
+                scores[i, :] = float("-inf")
+                scores[i, row.forced[0]] = 0.0
+        return scores
+
+class SectionController:
+    """Follows the four-section answer format while it is generated, per batch row.
+
+    Pass `stopping_criteria` (and, outside assisted generation, `logits_processor`) to
+    model.generate. A section running past `max_section_tokens`, or one that would leave too
+    little budget for the sections still missing, gets the next heading forced in at the next
+    sentence end. Generation stops once the final section has a paragraph of content or
+    `max_final_tokens` tokens, instead of running on to EOS or `max_new_tokens`.
+    """
+
+    def __init__(self, tokenizer, prompt_len: int, max_new_tokens: int, max_section_tokens: int = MAX_SECTION_TOKENS,
+                 max_final_tokens: int = MAX_FINAL_TOKENS):
+        self.tokenizer = tokenizer
+        self.prompt_len = prompt_len
+        self.max_new_tokens = max_new_tokens
+        self.max_section_tokens = max_section_tokens
+        self.max_final_tokens = max_final_tokens
+        self.rows: list[_Row] = []
+        self.seen = 0  # generated positions already processed (rows advance together)
+        self._heading_ids = [
+            tokenizer.encode(f"\n\n{i + 1}) **{title}**\n", add_special_tokens=False) for i, title in enumerate(SECTION_TITLES)
+        ]
+        self.stopping_criteria = _StopWhenDone(self)
+        self.logits_processor = _ForceHeadings(self)
+
+    def update(self, input_ids: torch.Tensor) -> torch.Tensor:
+        """Process the newly generated tokens of each row; True where the row is finished."""
+        if not self.rows:
+            self.rows = [_Row() for _ in range(input_ids.shape[0])]
+        # Assisted generation may add several tokens per step
+        new = input_ids[:, self.prompt_len + self.seen:].tolist()
+        self.seen = input_ids.shape[1] - self.prompt_len
+        done = [self._update(row, toks) for row, toks in zip(self.rows, new)]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    def _update(self, row: _Row, new: list[int]) -> bool:
+        if row.stop is not None or not new:
+            return row.stop is not None
+        row.ids += new
+        for tok in new:
+            if row.forced and row.forced[0] == tok:
+                row.forced.pop(0)
+
+        n = len(row.ids)
+        start = max(0, min(row.section_start - HEADING_LOOKBACK, n - DECODE_WINDOW))
+        text = self.tokenizer.decode(row.ids[start:], skip_special_tokens=True)
+        # A window starting mid-line must not look like a line start to the heading patterns
+        search_text = "\0" + text if start else text
+        # The model may skip a heading; take the furthest one present
+        for k in range(len(SECTION_TITLES) - 1, row.section - 1, -1):
+            if _HEADINGS[k].search(search_text):
+                row.section, row.section_start = k + 1, n
+                break
+        in_section = n - row.section_start
+
+        if row.section == len(SECTION_TITLES):
+            m = _HEADINGS[-1].search(search_text)
+            if m:
+                body = search_text[m.end():]
+                body = body[_HEADING_TAIL.match(body).end():]
+            else:
+                body = text.partition("\n")[2]  # heading out of the window; skip the partial first line
+            if _PARAGRAPH_END.search(body):
+                row.stop = "final_section_done"
+            elif in_section >= self.max_final_tokens:
+                row.stop = "final_section_cap"
+            return row.stop is not None
+
+        if not row.forced:
+            reserve = (len(SECTION_TITLES) - row.section) * RESERVE_TOKENS
+            remaining = self.max_new_tokens - n
+            if in_section >= self.max_section_tokens or remaining <= reserve:
+                at_boundary = text.rstrip(" \t").endswith(_SENTENCE_END)
+                if (at_boundary or in_section >= self.max_section_tokens + GRACE_TOKENS
+                        or remaining <= reserve - GRACE_TOKENS):
+                    row.forced = list(self._heading_ids[row.section])
+                    row.forced_headings += 1
+        return False
+
+    def report(self, row: int = 0) -> dict:
+        """Sections reached, headings forced, why it stopped and the token budget it left unspent."""
+        r = self.rows[row] if row < len(self.rows) else _Row()
+        return {
+            "sections": r.section,
+            "forced_headings": r.forced_headings,
+            "stop": r.stop,
+            "new_tokens": len(r.ids),
+            "tokens_saved": self.max_new_tokens - len(r.ids) if r.stop else 0,
+        }
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+
+from transformers.generation import BaseStreamer
+
+from app.core.metrics import log_event
+
+@dataclass
+class SpeculationStats:
+    new_tokens: int
+    target_steps: int  # forward passes of the large model
+    draft_tokens: int  # tokens proposed by the draft model
+    elapsed_s: float
+
+    @property
+    def accepted(self) -> int:
+        # Every target step emits one token of its own on top of the accepted draft tokens
+        return max(0, self.new_tokens - self.target_steps)
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted / self.draft_tokens if self.draft_tokens else 0.0
+
+    @property
+    def tokens_per_step(self) -> float:
+        """Tokens per large-model forward pass; plain decoding is 1.0, so this bounds the speed-up."""
+        return self.new_tokens / self.target_steps if self.target_steps else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            **asdict(self),
+            "accepted": self.accepted,
+            "acceptance_rate": round(self.acceptance_rate, 4),
+            "tokens_per_step": round(self.tokens_per_step, 3),
+            "tokens_per_s": round(self.new_tokens / self.elapsed_s, 2) if self.elapsed_s else None,
+        }
+
+class _StepCounter(BaseStreamer):
+    """Counts target-model steps: assisted generation puts each step's accepted tokens at once."""
+
+    def __init__(self, inner: BaseStreamer | None = None):
+        self.inner = inner
+        self.puts = 0
+
+    def put(self, value):
+        self.puts += 1
+        if self.inner is not None:
+            self.inner.put(value)
+
+    def end(self):
+        if self.inner is not None:
+            self.inner.end()
+
+class SpeculativeDecoder:
+    """Assisted generation with a small draft model that shares the target's tokenizer.
+
+    The draft proposes a few tokens, the target verifies them in one forward pass and keeps the
+    longest agreeing prefix, so greedy outputs are identical to plain decoding. Only single,
+    text-only requests are eligible; image prompts and batches decode normally.
+    """
+
+    def __init__(self, draft_model, num_assistant_tokens: int | None = None,
+                 confidence_threshold: float | None = None, history: int = 1000):
+        self.draft_model = draft_model
+        cfg = draft_model.generation_config
+        if num_assistant_tokens is not None:
+            # A fixed draft length instead of the transformers heuristic that adapts it per step
+            cfg.num_assistant_tokens = num_assistant_tokens
+            cfg.num_assistant_tokens_schedule = "constant"
+        if confidence_threshold is not None:
+            # The draft stops proposing once its top token probability drops below this
+            cfg.assistant_confidence_threshold = confidence_threshold
+        self.recent: deque = deque(maxlen=history)
+        self._draft_calls = threading.local()
+        self._lock = threading.Lock()
+        self._totals = {"requests": 0, "new_tokens": 0, "target_steps": 0, "draft_tokens": 0}
+        # Draft forward passes are counted per thread, so concurrent requests do not mix counts
+        draft_model.register_forward_hook(self._count_draft)
+
+    def _count_draft(self, module, args, output):
+        self._draft_calls.n = getattr(self._draft_calls, "n", 0) + 1
+
+    def prepare(self, streamer: BaseStreamer | None = None) -> tuple[dict, _StepCounter]:
+        """generate() kwargs for one request, plus the step counter wrapping `streamer`."""
+        self._draft_calls.n = 0
+        counter = _StepCounter(streamer)
+        return {"assistant_model": self.draft_model, "streamer": counter}, counter
+
+    def record(self, counter: _StepCounter, new_tokens: int, t0: float) -> SpeculationStats:
+        stats = SpeculationStats(
+            new_tokens=new_tokens,
+            target_steps=max(0, counter.puts - 1),  # the first put is the prompt
+            draft_tokens=getattr(self._draft_calls, "n", 0),
+            elapsed_s=time.perf_counter() - t0,
+        )
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["new_tokens"] += stats.new_tokens
+            self._totals["target_steps"] += stats.target_steps
+            self._totals["draft_tokens"] += stats.draft_tokens
+        self.recent.append(stats)
+        log_event({"type": "speculative", **stats.as_dict()})
+        return stats
+
+    def stats(self) -> dict:
+        with self._lock:
+            t = dict(self._totals)
+        accepted = max(0, t["new_tokens"] - t["target_steps"])
+        return {
+            **t,
+            "acceptance_rate": accepted / t["draft_tokens"] if t["draft_tokens"] else 0.0,
+            "tokens_per_step": t["new_tokens"] / t["target_steps"] if t["target_steps"] else 0.0,
+        }
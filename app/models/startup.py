@@ -0,0 +1,119 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+from PIL import Image
+
+from app.core.prompts import build_user_prompt
+
+WARMUP_STEPS = ("text", "image", "audio")
+
+@dataclass
+class StartupReport:
+    load_s: dict[str, float] = field(default_factory=dict)
+    warmup_s: dict[str, float] = field(default_factory=dict)
+    errors: dict[str, str] = field(default_factory=dict)
+    total_s: float = 0.0
+
+def warmup_medgemma(client, steps=WARMUP_STEPS) -> dict[str, float]:
+    """Run tiny generations so kernel selection, processor setup and the prefix cache happen now."""
+    timings = {}
+    if "text" in steps:
+        t0 = time.perf_counter()
+        client.generate(build_user_prompt("Warm-up request.", None), max_new_tokens=4, temperature=0.0)
+        timings["medgemma_text"] = time.perf_counter() - t0
+    if "image" in steps:
+        t0 = time.perf_counter()
+        client.generate(build_user_prompt("Warm-up request.", None), image=Image.new("RGB", (896, 896)),
+                        max_new_tokens=4, temperature=0.0)
+        timings["medgemma_image"] = time.perf_counter() - t0
+    return timings
+
+def warmup_medasr(client, steps=WARMUP_STEPS) -> dict[str, float]:
+    from app.models.medasr import SAMPLE_RATE
+
+    timings = {}
+    if "audio" in steps:
+        t0 = time.perf_counter()
+        noise = (np.random.default_rng(0).standard_normal(SAMPLE_RATE) * 0.01).astype(np.float32)
+        client.asr(noise)
+        timings["medasr_audio"] = time.perf_counter() - t0
+    return timings
+
+class ModelStartup:
+    """Loads models in parallel threads, warms them up and exposes a readiness flag.
+
+    `loaders` maps a name to a zero-arg constructor; `warmups` maps the same name to a
+    function(model, steps) -> {step: seconds}. Call `start()` early (e.g. before the login
+    screen renders) and `wait()` where the models are first needed.
+    """
+
+    def __init__(
+        self,
+        loaders: dict[str, Callable[[], object]],
+        warmups: dict[str, Callable] | None = None,
+        steps: tuple[str, ...] = WARMUP_STEPS,
+    ):
+        self.loaders = loaders
+        self.warmups = warmups or {}
+        self.steps = steps
+        self.models: dict[str, object] = {}
+        self.report = StartupReport()
+        self._ready = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> "ModelStartup":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-startup", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout: float | None = None) -> dict[str, object]:
+        self.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError("models are still loading")
+        if self.report.errors:
+            raise RuntimeError(f"model startup failed: {self.report.errors}")
+        return self.models
+
+    def _load_one(self, name: str):
+        try:
+            t0 = time.perf_counter()
+            model = self.loaders[name]()
+            self.report.load_s[name] = time.perf_counter() - t0
+            if name in self.warmups and self.steps:
+                self.report.warmup_s.update(self.warmups[name](model, self.steps))
+            self.models[name] = model
+        except Exception as e:
+            self.report.errors[name] = repr(e)
+
+    def _run(self):
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=self._load_one, args=(name,), name=f"load-{name}") for name in self.loaders]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.report.total_s = time.perf_counter() - t0
+        self._ready.set()
+
+def build_orchestrator(models: dict[str, object] | None = None, server_url: str | None = None, response_cache=None):
+    """The Orchestrator the UI chats through: in-process `models` (from ModelStartup.wait()),
+    or thin clients of the model server at `server_url`."""
+    from app.core.orchestrator import Orchestrator
+
+    if server_url:
+        from app.server.client import ModelServerClient, RemoteMedGemmaClient, RemoteMedASRClient
+
+        # Models live in the model server (python -m app.server.model_server); replicas stay light
+        server = ModelServerClient(server_url)
+        return Orchestrator(RemoteMedGemmaClient(server), RemoteMedASRClient(server), response_cache=response_cache)
+    # Chats stream per request (session KV reuse, section control, cancellation), so the client is
+    # used directly; merging concurrent requests is the model server's job (--batch)
+    return Orchestrator(models["medgemma"], models.get("medasr"), response_cache=response_cache)
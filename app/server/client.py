@@ -0,0 +1,182 @@
+import http.client
+import json
+import socket
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+from urllib.parse import urlparse
+
+from app.models.image_cache import ImageCache
+from app.server.protocol import encode_bytes, encode_image_payload
+from app.server.scheduler import ServerBusy
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class ModelServerClient:
+    """HTTP client for app.server.model_server; `url` is http://host:port or unix:///path."""
+
+    def __init__(self, url: str, timeout_s: float = 600.0, queue_timeout_s: float | None = None):
+        self.url = url
+        self.timeout_s = timeout_s
+        self.queue_timeout_s = queue_timeout_s  # server drops requests still queued after this long
+        self._parsed = urlparse(url)
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self._parsed.scheme == "unix":
+            return _UnixHTTPConnection(self._parsed.path, self.timeout_s)
+        return http.client.HTTPConnection(self._parsed.hostname, self._parsed.port, timeout=self.timeout_s)
+
+    def _request(self, method: str, path: str, body: dict | None = None,
+                 conn: http.client.HTTPConnection | None = None) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        if body is not None and self.queue_timeout_s:
+            body = {"timeout_s": self.queue_timeout_s, **body}
+        conn = conn or self._connection()
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        conn.request(method, path, body=data, headers={"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        if resp.status != 200:
+            try:
+                err = json.loads(resp.read() or b"{}")
+            finally:
+                conn.close()
+            if resp.status == 503:
+                raise ServerBusy(err.get("message") or "model server is busy", float(err.get("retry_after_s") or 1.0))
+            raise RuntimeError(f"model server error {resp.status}: {err.get('message') or err.get('error')}")
+        return conn, resp
+
+    def call(self, path: str, body: dict, cancel: threading.Event | None = None) -> dict:
+        """Setting `cancel` drops the connection, so the server cancels the job, and raises CancelledError."""
+        if cancel is not None and cancel.is_set():
+            raise CancelledError()
+        conn = self._connection()
+        try:
+            with _shutdown_on(conn, cancel):
+                _, resp = self._request("POST", path, body, conn)
+                return json.loads(resp.read())
+        except (OSError, http.client.HTTPException, ValueError):
+            if cancel is not None and cancel.is_set():
+                raise CancelledError() from None
+            raise
+        finally:
+            conn.close()
+
+    def stream(self, path: str, body: dict, cancel: threading.Event | None = None) -> Iterator[dict]:
+        """NDJSON events of a streaming call. Setting `cancel` drops the connection, which makes the
+        server cancel the job, whether it is still queued or already generating."""
+        if cancel is not None and cancel.is_set():
+            return
+        conn = self._connection()
+        try:
+            with _shutdown_on(conn, cancel):
+                _, resp = self._request("POST", path, body, conn)
+                for line in resp:
+                    if cancel is not None and cancel.is_set():
+                        break
+                    if line.strip():
+                        yield json.loads(line)
+        except (OSError, http.client.HTTPException):
+            if cancel is None or not cancel.is_set():
+                raise
+        finally:
+            conn.close()
+
+    def health(self) -> dict:
+        conn, resp = self._request("GET", "/health")
+        try:
+            return json.loads(resp.read())
+        finally:
+            conn.close()
+
+@contextmanager
+def _shutdown_on(conn: http.client.HTTPConnection, cancel: threading.Event | None):
+    """Shut `conn` down if `cancel` is set while the block runs."""
+    if cancel is None:
+        yield
+        return
+    finished = threading.Event()
+    threading.Thread(target=_close_on_cancel, args=(conn, cancel, finished), daemon=True).start()
+    try:
+        yield
+    finally:
+        finished.set()
+
+def _close_on_cancel(conn: http.client.HTTPConnection, cancel: threading.Event, finished: threading.Event):
+    # Shutting the socket down also wakes a read blocked on a job that is queued or prefilling
+    while not finished.is_set():
+        if cancel.wait(0.1):
+            sock = conn.sock
+            if sock is not None and not finished.is_set():
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            return
+
+class RemoteMedGemmaClient:
+    """Drop-in for MedGemmaClient that runs generation on the model server."""
+
+    accepts_priority = True  # the Orchestrator passes priority= from the guardrail result
+    supports_cancel = True  # generate/generate_stream accept cancel=; the server drops the job
+    # Sent along to the server, which applies them when its model supports them
+    supports_session_cache = True
+    supports_sections = True
+
+    def __init__(self, server: ModelServerClient | str):
+        self.server = server if isinstance(server, ModelServerClient) else ModelServerClient(server)
+        self.model_id = f"remote:{self.server.url}"
+        # Uploads are still decoded here; the server caches the processed pixel_values
+        self.image_cache = ImageCache()
+
+    def _body(self, prompt: str, image, max_new_tokens: int, temperature: float, priority: str,
+              session_id: str | None = None, sections: bool = False) -> dict:
+        return {
+            "prompt": prompt,
+            "image": encode_image_payload(image),
+            "max_new_tokens": max_new_tokens,
+            "temperature": temperature,
+            "priority": priority,
+            "session_id": session_id,
+            "sections": sections,
+        }
+
+    def generate(self, prompt: str, image=None, max_new_tokens: int = 512, temperature: float = 0.2,
+                 priority: str = "routine", session_id: str | None = None, sections: bool = False,
+                 cancel: threading.Event | None = None) -> str:
+        body = self._body(prompt, image, max_new_tokens, temperature, priority, session_id, sections)
+        return self.server.call("/generate", body, cancel)["result"]
+
+    def generate_stream(self, prompt: str, image=None, max_new_tokens: int = 512, temperature: float = 0.2,
+                        priority: str = "routine", cancel: threading.Event | None = None,
+                        session_id: str | None = None, sections: bool = False) -> Iterator[str]:
+        body = self._body(prompt, image, max_new_tokens, temperature, priority, session_id, sections)
+        for event in self.server.stream("/generate_stream", body, cancel):
+            if "error" in event:
+                raise RuntimeError(f"model server error: {event['error']}")
+            if "delta" in event:
+                yield event["delta"]
+
+    def generate_batch(self, prompts: list[str], images: list | None = None, max_new_tokens: int = 512,
+                       temperature: float = 0.2, sections: bool = False) -> list[str]:
+        # Sent concurrently; the server's workers (and its MicroBatcher, if enabled) do the batching
+        images = images or [None] * len(prompts)
+        with ThreadPoolExecutor(max_workers=max(1, len(prompts))) as pool:
+            return list(pool.map(lambda a: self.generate(a[0], a[1], max_new_tokens, temperature, sections=sections),
+                                 zip(prompts, images)))
+
+class RemoteMedASRClient:
+    def __init__(self, server: ModelServerClient | str):
+        self.server = server if isinstance(server, ModelServerClient) else ModelServerClient(server)
+
+    def transcribe(self, audio_path: str) -> str:
+        path = Path(audio_path)
+        return self.server.call("/transcribe", {"audio": encode_bytes(path.read_bytes()), "suffix": path.suffix})["result"]
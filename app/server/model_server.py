@@ -0,0 +1,329 @@
+"""Standalone inference service owning MedGemma/MedASR, so UI replicas share one copy of the models.
+
+Requests go through a bounded priority queue (urgent first) served by N worker threads; a
+full queue answers 503 "busy" with Retry-After instead of piling up work. A client that
+disconnects cancels its request: still queued, it is skipped; running, it stops at the next token.
+
+  python -m app.server.model_server --port 8765 --workers 2 --max-queue 32
+  python -m app.server.model_server --socket /tmp/medgemma.sock --batch
+  MEDGEMMA_SERVER_URL=http://127.0.0.1:8765 streamlit run app/ui/streamlit_app.py
+"""
+import argparse
+import json
+import os
+import queue
+import select
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from concurrent.futures import wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from app.server.protocol import DEFAULT_PORT, decode_bytes, decode_image_payload
+from app.server.scheduler import Job, PriorityJobQueue, ServerBusy
+
+POLL_S = 0.1  # how often a waiting handler checks whether its client disconnected
+
+class ModelServer:
+    def __init__(self, medgemma, medasr=None, workers: int = 2, max_queue: int = 32,
+                 host: str = "127.0.0.1", port: int = DEFAULT_PORT, socket_path: str | None = None,
+                 retry_after_s: float = 1.0):
+        self.medgemma = medgemma
+        self.medasr = medasr
+        self.workers = workers
+        self.queue = PriorityJobQueue(max_queue, retry_after_s)
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._httpd = None
+
+    @property
+    def url(self) -> str:
+        if self.socket_path:
+            return f"unix://{self.socket_path}"
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "ModelServer":
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"model-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+        handler = _make_handler(self)
+        if self.socket_path:
+            Path(self.socket_path).unlink(missing_ok=True)
+            self._httpd = _UnixHTTPServer(self.socket_path, handler)
+        else:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), handler)
+            self.port = self._httpd.server_address[1]  # resolves port=0
+        threading.Thread(target=self._httpd.serve_forever, name="model-server-http", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        self.queue.close()
+        for t in self._threads:
+            t.join()
+        if self.socket_path:
+            Path(self.socket_path).unlink(missing_ok=True)
+
+    def submit(self, kind: str, payload: dict, priority: str = "routine", timeout_s: float | None = None) -> Job:
+        if kind == "transcribe" and self.medasr is None:
+            raise ValueError("this server has no ASR model")
+        job = self.queue.make_job(kind, payload, priority, timeout_s, stream=(kind == "generate_stream"))
+        self.queue.put(job)
+        return job
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queued": len(self.queue),
+            "queued_by_priority": self.queue.depth_by_priority(),
+            "max_queue": self.queue.max_size,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.queue.rejected,
+            "displaced": self.queue.displaced,
+        }
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            if job.deadline is not None and time.monotonic() > job.deadline:
+                job.fail(ServerBusy("request waited too long in the queue", self.queue.retry_after_s))
+                continue
+            if job.cancel.is_set():
+                with self._lock:
+                    self.cancelled += 1
+                job.fail(RuntimeError("request cancelled by the client"))
+                continue
+            job.started_at = time.monotonic()
+            with self._lock:
+                self.in_flight += 1
+            try:
+                result = self._run(job)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                job.fail(e)
+            else:
+                with self._lock:
+                    if job.cancel.is_set():
+                        self.cancelled += 1
+                    else:
+                        self.completed += 1
+                job.future.set_result(result)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+    def _options(self, p: dict) -> dict:
+        """The per-request features a generate payload asks for that the served model supports."""
+        options = {}
+        if p.get("session_id") is not None and getattr(self.medgemma, "supports_session_cache", False):
+            options["session_id"] = p["session_id"]
+        if p.get("sections") and getattr(self.medgemma, "supports_sections", False):
+            options["sections"] = True
+        return options
+
+    def _run(self, job: Job):
+        p = job.payload
+        extra = self._options(p)
+        if job.kind in ("generate", "generate_stream") and getattr(self.medgemma, "supports_cancel", False):
+            extra["cancel"] = job.cancel
+        if job.kind == "generate":
+            return self.medgemma.generate(prompt=p["prompt"], image=decode_image_payload(p.get("image")),
+                                          max_new_tokens=p["max_new_tokens"], temperature=p["temperature"], **extra)
+        if job.kind == "generate_stream":
+            parts = []
+            job.events.put(("started", None))
+            for delta in self.medgemma.generate_stream(prompt=p["prompt"], image=decode_image_payload(p.get("image")),
+                                                       max_new_tokens=p["max_new_tokens"], temperature=p["temperature"],
+                                                       **extra):
+                if job.cancel.is_set():
+                    break
+                parts.append(delta)
+                job.events.put(("delta", delta))
+            job.events.put(("done", None))
+            return "".join(parts)
+        if job.kind == "transcribe":
+            with tempfile.NamedTemporaryFile(suffix=p.get("suffix") or ".wav", delete=False) as tmp:
+                tmp.write(decode_bytes(p["audio"]))
+            try:
+                return self.medasr.transcribe(tmp.name)
+            finally:
+                os.unlink(tmp.name)
+        raise ValueError(f"unknown job kind {job.kind!r}")
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        conn, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        return conn, ("unix", 0)
+
+def _make_handler(server: ModelServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: dict, headers: dict | None = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_error(self, exc: Exception):
+            if isinstance(exc, ServerBusy):
+                self._send_json(503, {"error": "busy", "message": str(exc), "retry_after_s": exc.retry_after_s},
+                                {"Retry-After": str(max(1, round(exc.retry_after_s)))})
+            elif isinstance(exc, (ValueError, KeyError)):
+                self._send_json(400, {"error": "bad_request", "message": str(exc)})
+            else:
+                self._send_json(500, {"error": "internal", "message": f"{type(exc).__name__}: {exc}"})
+
+        def _client_gone(self) -> bool:
+            """The client closed its connection: the socket reads as EOF."""
+            try:
+                readable, _, _ = select.select([self.connection], [], [], 0)
+                return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+            except (OSError, ValueError):
+                return True
+
+        def _next_event(self, job: Job):
+            """The job's next stream event; None (with the job cancelled) if the client went away first."""
+            while True:
+                try:
+                    return job.events.get(timeout=POLL_S)
+                except queue.Empty:
+                    if self._client_gone():
+                        job.cancel.set()
+                        return None
+
+        def _write_chunk(self, event: dict):
+            data = (json.dumps(event) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"ok": True, **server.stats()})
+            else:
+                self._send_json(404, {"error": "not_found"})
+
+        def do_POST(self):
+            kind = self.path.strip("/")
+            if kind not in ("generate", "generate_stream", "transcribe"):
+                self._send_json(404, {"error": "not_found"})
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                job = server.submit(kind, body, body.get("priority") or "routine", body.get("timeout_s"))
+            except Exception as e:
+                self._send_error(e)
+                return
+
+            if kind != "generate_stream":
+                while not wait([job.future], timeout=POLL_S).done:
+                    if self._client_gone():
+                        job.cancel.set()  # a queued job is skipped; a running one stops if the model takes cancel=
+                        return
+                try:
+                    result = job.future.result()
+                except Exception as e:
+                    self._send_error(e)
+                    return
+                self._send_json(200, {
+                    "result": result,
+                    "queue_s": round(job.started_at - job.enqueued_at, 6),
+                    "run_s": round(time.monotonic() - job.started_at, 6),
+                })
+                return
+
+            # Hold the response until the job starts, so queue rejections still get a 503
+            item = self._next_event(job)
+            if item is None:
+                return
+            event, value = item
+            if event == "error":
+                self._send_error(value)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self._write_chunk({"queue_s": round(job.started_at - job.enqueued_at, 6)})
+            try:
+                while True:
+                    item = self._next_event(job)
+                    if item is None:
+                        return
+                    event, value = item
+                    if event == "delta":
+                        self._write_chunk({"delta": value})
+                    elif event == "done":
+                        self._write_chunk({"done": True})
+                        break
+                    else:
+                        self._write_chunk({"error": f"{type(value).__name__}: {value}"})
+                        break
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError, socket.timeout):
+                job.cancel.set()  # the client went away: stop generating for it
+
+    return Handler
+
+def main(argv=None):
+    from app.models.medasr import MedASRClient
+    from app.models.batching import MicroBatcher
+    from app.models.medgemma import MedGemmaClient
+    from app.models.startup import ModelStartup, warmup_medasr, warmup_medgemma
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--socket", default=None, help="serve on a Unix socket instead of TCP")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--max-queue", type=int, default=32)
+    ap.add_argument("--no-asr", action="store_true")
+    ap.add_argument("--batch", action="store_true", help="merge concurrent generate calls with MicroBatcher")
+    args = ap.parse_args(argv)
+
+    loaders = {"medgemma": MedGemmaClient}
+    if not args.no_asr:
+        loaders["medasr"] = MedASRClient
+    models = ModelStartup(loaders, {"medgemma": warmup_medgemma, "medasr": warmup_medasr}).wait()
+    medgemma = MicroBatcher(models["medgemma"]) if args.batch else models["medgemma"]
+
+    server = ModelServer(medgemma, models.get("medasr"), workers=args.workers, max_queue=args.max_queue,
+                         host=args.host, port=args.port, socket_path=args.socket).start()
+    print(f"model server listening on {server.url} ({args.workers} workers, queue {args.max_queue})", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
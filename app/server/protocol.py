@@ -0,0 +1,37 @@
+"""JSON wire format shared by the model server and its client."""
+import base64
+import os
+
+from PIL import Image
+
+from app.utils.images import HASH_ATTR, image_key
+
+# http://host:port or unix:///path/to/socket; unset means models are loaded in-process
+SERVER_URL = os.environ.get("MEDGEMMA_SERVER_URL") or None
+DEFAULT_PORT = 8765
+
+def encode_image_payload(image: Image.Image | None) -> dict | None:
+    # Raw pixels rather than PNG: the server is local, so bandwidth is cheaper than re-encoding
+    if image is None:
+        return None
+    image = image if image.mode == "RGB" else image.convert("RGB")
+    return {
+        "size": list(image.size),
+        "data": base64.b64encode(image.tobytes()).decode("ascii"),
+        "hash": image_key(image),
+    }
+
+def decode_image_payload(payload: dict | None) -> Image.Image | None:
+    if not payload:
+        return None
+    image = Image.frombytes("RGB", tuple(payload["size"]), base64.b64decode(payload["data"]))
+    if payload.get("hash"):
+        # Lets the server's image cache skip re-hashing the pixels
+        setattr(image, HASH_ATTR, payload["hash"])
+    return image
+
+def encode_bytes(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+def decode_bytes(data: str) -> bytes:
+    return base64.b64decode(data)
@@ -0,0 +1,110 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+# Lower rank is served first; urgent comes from the guardrail result
+PRIORITIES = {"urgent": 0, "routine": 1, "background": 2}
+
+class ServerBusy(RuntimeError):
+    """The model server cannot take the request now (queue full or waited past its deadline)."""
+
+    def __init__(self, message: str = "model server is busy", retry_after_s: float = 1.0):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+@dataclass(order=True)
+class Job:
+    rank: int
+    seq: int
+    kind: str = field(compare=False)  # generate | generate_stream | transcribe
+    payload: dict = field(compare=False)
+    deadline: float | None = field(compare=False, default=None)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+    started_at: float | None = field(compare=False, default=None)
+    future: Future = field(compare=False, default_factory=Future)
+    # generate_stream jobs push ("delta", text) events here, then ("done", None) or ("error", exc)
+    events: queue.Queue | None = field(compare=False, default=None)
+    # Set when the client goes away: a queued job is skipped, a running stream stops at the next token
+    cancel: threading.Event = field(compare=False, default_factory=threading.Event)
+
+    def fail(self, exc: Exception):
+        if self.events is not None:
+            self.events.put(("error", exc))
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+class PriorityJobQueue:
+    """Bounded priority queue of jobs.
+
+    When full, a new job displaces the newest job of a strictly lower priority (which fails
+    with ServerBusy); if there is none, the new job itself is rejected with ServerBusy. So a
+    backlog of routine requests never blocks an urgent one.
+    """
+
+    def __init__(self, max_size: int = 32, retry_after_s: float = 1.0):
+        self.max_size = max_size
+        self.retry_after_s = retry_after_s
+        self.rejected = 0
+        self.displaced = 0
+        self._heap: list[Job] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def make_job(self, kind: str, payload: dict, priority: str = "routine", timeout_s: float | None = None,
+                 stream: bool = False) -> Job:
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority {priority!r}; expected one of {list(PRIORITIES)}")
+        return Job(
+            rank=PRIORITIES[priority],
+            seq=next(self._seq),
+            kind=kind,
+            payload=payload,
+            deadline=time.monotonic() + timeout_s if timeout_s else None,
+            events=queue.Queue() if stream else None,
+        )
+
+    def put(self, job: Job):
+        with self._cond:
+            if self._closed:
+                raise ServerBusy("model server is shutting down", self.retry_after_s)
+            if len(self._heap) >= self.max_size:
+                worst = max(self._heap)
+                if worst.rank <= job.rank:
+                    self.rejected += 1
+                    raise ServerBusy(f"model server is busy ({len(self._heap)} requests queued)", self.retry_after_s)
+                self._heap.remove(worst)
+                heapq.heapify(self._heap)
+                self.displaced += 1
+                worst.fail(ServerBusy("displaced by a higher-priority request", self.retry_after_s))
+            heapq.heappush(self._heap, job)
+            self._cond.notify()
+
+    def get(self) -> Job | None:
+        """Next job by priority, then arrival; None once the queue is closed and drained."""
+        with self._cond:
+            while not self._heap and not self._closed:
+                self._cond.wait()
+            if not self._heap:
+                return None
+            return heapq.heappop(self._heap)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def depth_by_priority(self) -> dict[str, int]:
+        names = {rank: name for name, rank in PRIORITIES.items()}
+        with self._cond:
+            depth = {name: 0 for name in PRIORITIES}
+            for job in self._heap:
+                depth[names[job.rank]] += 1
+            return depth
@@ -1,19 +1,29 @@
+# Only light modules are imported here so the login screen renders without the ML stack
+# (torch, transformers, librosa) or pandas/plotly; pages import what they need on first use.
+# eval/bench_startup.py checks this.
+import asyncio
+import os
+import sqlite3
 import tempfile
+import threading
+import time
 import streamlit as st
-import pandas as pd
-from PIL import Image
-import plotly.express as px
 from datetime import datetime
 
-from app.models.medgemma import MedGemmaClient
-from app.models.medasr import MedASRClient
-from app.core.orchestrator import Orchestrator
+from app.server.protocol import SERVER_URL
 from app.db.store import (
-    init_db, create_user, verify_user, create_session, 
+    init_db, create_user, verify_user, create_session, new_session_id,
     get_user_sessions, add_message, get_session_messages,
-    add_vital, get_vitals_history
+    load_user_history, search_messages
 )
-from app.core.vitals_analyzer import analyze_vitals
+from app.db.vitals_import import import_vitals
+
+HISTORY_PAGE_SIZE = 20
+CHART_RANGES = {"7 days": 7, "30 days": 30, "90 days": 90, "1 year": 365, "All": None}
+CHART_MODES = {"Range (min/mean/max)": "buckets", "Readings (downsampled)": "lttb"}
+# Comma-separated subset of text,image,audio; "none" disables the warm-up pass
+WARMUP_STEPS = tuple(x.strip() for x in os.environ.get("MEDGEMMA_WARMUP", "text,image,audio").split(",")
+                     if x.strip() and x.strip() != "none")
 
 st.set_page_config(page_title="MedGemma-Copilot Pro", layout="wide", page_icon="🩺")
 
@@ -49,11 +59,40 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+def _load_medgemma():
+    from app.models.medgemma import MedGemmaClient
+    return MedGemmaClient()
+
+def _load_medasr():
+    from app.models.medasr import MedASRClient
+    return MedASRClient()
+
+@st.cache_resource
+def model_startup():
+    # Started right after the login screen is drawn, so loading and warm-up overlap with signing in;
+    # torch/transformers are imported in the loader threads, not on the script thread
+    from app.models.startup import ModelStartup, warmup_medgemma, warmup_medasr
+    return ModelStartup(
+        loaders={"medgemma": _load_medgemma, "medasr": _load_medasr},
+        warmups={"medgemma": warmup_medgemma, "medasr": warmup_medasr},
+        steps=WARMUP_STEPS,
+    ).start()
+
 @st.cache_resource
 def load_models():
-    medgemma = MedGemmaClient()
-    medasr = MedASRClient()
-    return Orchestrator(medgemma, medasr)
+    from app.core.response_cache import ResponseCache, CACHE_DB_PATH
+    from app.models.startup import build_orchestrator
+
+    response_cache = ResponseCache(db_path=CACHE_DB_PATH)
+    if SERVER_URL:
+        return build_orchestrator(server_url=SERVER_URL, response_cache=response_cache)
+    return build_orchestrator(model_startup().wait(), response_cache=response_cache)
+
+@st.cache_resource
+def vitals_analytics():
+    from app.core.vitals_analytics import VitalsAnalytics
+    # Shared across sessions: each user's series is loaded once, then updated on every save
+    return VitalsAnalytics()
 
 def login_screen():
     st.markdown("<div class='main-header'>🩺 MedGemma Copilot Pro</div>", unsafe_allow_html=True)
@@ -79,11 +118,17 @@ def login_screen():
                 st.error("Username already taken")
 
 def main_app():
-    orch = load_models()
+    startup = None if SERVER_URL else model_startup()
     user = st.session_state["user"]
     
     with st.sidebar:
         st.title(f"Hi, {user} 👋")
+        if startup is not None and startup.ready:
+            st.caption(f"Models ready in {startup.report.total_s:.1f}s (warm-up: {sum(startup.report.warmup_s.values()):.1f}s)")
+        elif startup is not None:
+            st.caption("Models are loading in the background...")
+        else:
+            st.caption(f"Models served by {SERVER_URL}")
         if st.button("Logout"):
             del st.session_state["user"]
             st.rerun()
@@ -91,14 +136,21 @@ def main_app():
         st.divider()
         menu = st.radio("Navigation", ["Chat & Analysis", "BP & Sugar Tracking", "Visit History"])
 
+    # Only the chat needs the models; tracking and history pages never wait for them
     if menu == "Chat & Analysis":
-        render_chat_page(orch, user)
+        if startup is not None and not startup.ready:
+            with st.spinner("Loading and warming up models..."):
+                startup.wait()
+        render_chat_page(load_models(), user)
     elif menu == "BP & Sugar Tracking":
         render_vitals_page(user)
     elif menu == "Visit History":
         render_history_page(user)
 
 def render_chat_page(orch, user):
+    from app.core.orchestrator import NoQuestion, StageTimeout
+    from app.server.scheduler import ServerBusy
+
     st.markdown("### 🤖 Medical Chat & Scan Analysis")
     
     # Session handling
@@ -120,6 +172,7 @@ def render_chat_page(orch, user):
         curr_sid = st.session_state["current_session"]
         
         # Display history
+        messages = []
         if curr_sid:
             messages = get_session_messages(curr_sid)
             for role, content, img in messages:
@@ -131,7 +184,6 @@ def render_chat_page(orch, user):
         # Input Section
         with st.expander("Inputs (Report / Scans / Voice)", expanded=not curr_sid):
             up_img = st.file_uploader("Upload X-ray / Scan", type=["png", "jpg", "jpeg"])
-            img = Image.open(up_img).convert("RGB") if up_img else None
             pasted = st.text_area("Paste report text", height=100)
             
             st.write("---")
@@ -139,31 +191,69 @@ def render_chat_page(orch, user):
             
         user_q = st.text_input("Type your question...", placeholder="e.g. Explain my X-ray results")
         
-        if audio_data:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-                tmp.write(audio_data.read())
-                tmp_path = tmp.name
-            with st.spinner("Transcribing voice..."):
-                v_q = orch.transcribe_if_audio(tmp_path)
-                if v_q: user_q = v_q
-
         if st.button("Send", type="primary"):
-            if not user_q:
+            if not user_q and not audio_data:
                 st.warning("Please provide a question or voice input.")
             else:
-                if not curr_sid:
-                    curr_sid = create_session(user, user_q[:30])
-                    st.session_state["current_session"] = curr_sid
-                
-                add_message(curr_sid, "user", user_q)
-                
-                with st.spinner("Analyzing with MedGemma..."):
-                    ans = orch.chat(user_id=user, user_question=user_q, pasted_text=pasted, image=img)
-                    add_message(curr_sid, "assistant", ans)
+                # A new session's row is written with its first message, once the question is known to be valid
+                created = [bool(curr_sid)]
+                create_lock = threading.Lock()
+                curr_sid = curr_sid or new_session_id(user)
+
+                def persist(role, content):
+                    with create_lock:
+                        if not created[0]:
+                            create_session(user, content[:30], curr_sid)
+                            created[0] = True
+                    # Waits for the commit (off the event loop), so a failed write fails this request
+                    add_message(curr_sid, role, content).result()
+
+                # Earlier turns go into the prompt (token-budgeted) so follow-ups have context
+                history = [(role, content) for role, content, _ in messages]
+                audio_path = None
+                if audio_data:
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
+                        tmp.write(audio_data.read())
+                        audio_path = tmp.name
+
+                # Transcription, image decode and DB writes overlap; the answer streams into a bubble
+                bubble = st.empty()
+                shown = []
+
+                def show(delta):
+                    shown.append(delta)
+                    bubble.markdown(f"<div class='chat-bubble bot-bubble'><b>Assistant:</b><br>{''.join(shown)}</div>", unsafe_allow_html=True)
+
+                try:
+                    asyncio.run(orch.achat(
+                        user_id=user, user_question=user_q or None, pasted_text=pasted,
+                        image=up_img.getvalue() if up_img else None, audio_path=audio_path,
+                        session_id=str(curr_sid), history=history, on_delta=show, persist=persist,
+                    ))
+                except ServerBusy as e:
+                    st.warning(f"The model server is busy right now; please try again in {e.retry_after_s:.0f}s.")
+                    return
+                except StageTimeout as e:
+                    st.warning(f"That took too long ({e.stage}); please try again.")
+                    return
+                except NoQuestion:
+                    st.warning("Couldn't make out the voice question; please type it instead.")
+                    return
+                except sqlite3.Error as e:
+                    st.error(f"Could not save this conversation: {e}")
+                    return
+                finally:
+                    if created[0]:
+                        st.session_state["current_session"] = curr_sid
+                    if audio_path:
+                        os.unlink(audio_path)
                 st.rerun()
 
 def render_vitals_page(user):
+    from app.core.vitals_analytics import DAY_S
+
     st.markdown("### 📊 Health Tracking (Blood Pressure & Sugar)")
+    analytics = vitals_analytics()
     
     col_input, col_viz = st.columns([1, 2])
     
@@ -174,59 +264,135 @@ def render_vitals_page(user):
             dia = st.number_input("Diastolic (bottom #)", value=80)
             note = st.text_input("Notes (e.g. after lunch)")
             if st.button("Save BP"):
-                add_vital(user, "blood_pressure", sys, dia, note)
-                st.success("Blood pressure recorded!")
+                try:
+                    analytics.add_vital(user, "blood_pressure", sys, dia, note).result()
+                except sqlite3.Error as e:
+                    st.error(f"Could not save the reading: {e}")
+                else:
+                    st.success("Blood pressure recorded!")
         else:
             glu = st.number_input("Glucose level (mg/dL)", value=100)
             note = st.text_input("Notes (e.g. fasting)")
             if st.button("Save Sugar"):
-                add_vital(user, "sugar", glu, None, note)
-                st.success("Sugar level recorded!")
+                try:
+                    analytics.add_vital(user, "sugar", glu, None, note).result()
+                except sqlite3.Error as e:
+                    st.error(f"Could not save the reading: {e}")
+                else:
+                    st.success("Sugar level recorded!")
+
+        st.write("---")
+        export = st.file_uploader("Import device export (CSV / JSONL)", type=["csv", "jsonl", "ndjson"])
+        unit = st.selectbox("Glucose unit in file", ["As in file (default mg/dL)", "mg/dL", "mmol/L"])
+        if export and st.button("Import readings"):
+            with st.spinner("Importing..."):
+                report = import_vitals(export, user, glucose_unit=None if unit.startswith("As") else unit)
+            # Imported rows bypass the in-memory series; reload them on the next view
+            analytics.invalidate(user)
+            st.success(f"Imported {report.inserted} readings ({report.duplicates} duplicates skipped, "
+                       f"{report.invalid} invalid) at {report.rows_per_s:,.0f} rows/s.")
+            if report.errors:
+                st.caption("Skipped: " + ", ".join(f"{reason} ({n})" for reason, n in report.errors.most_common()))
 
     with col_viz:
         st.markdown("#### Trends & Analysis")
-        data_bp = get_vitals_history(user, "blood_pressure")
-        data_sugar = get_vitals_history(user, "sugar")
-        
+        col_range, col_mode = st.columns(2)
+        days = CHART_RANGES[col_range.selectbox("Range", list(CHART_RANGES), index=1)]
+        mode = CHART_MODES[col_mode.selectbox("Chart", list(CHART_MODES))]
+        start = int(time.time()) - days * DAY_S if days else None
         tab_bp, tab_sugar = st.tabs(["BP History", "Sugar History"])
         
         with tab_bp:
-            if data_bp:
-                df_bp = pd.DataFrame(data_bp, columns=["Systolic", "Diastolic", "Notes", "Timestamp"])
-                df_bp['Date'] = pd.to_datetime(df_bp['Timestamp'], unit='s')
-                fig = px.line(df_bp, x="Date", y=["Systolic", "Diastolic"], title="Blood Pressure Trends")
-                st.plotly_chart(fig, use_container_width=True)
-                st.info(analyze_vitals(data_bp, "blood_pressure"))
-            else:
-                st.write("No BP data yet.")
+            render_vitals_tab(analytics, user, "blood_pressure", {"main": "Systolic", "secondary": "Diastolic"},
+                              "Blood Pressure Trends", "No BP data yet.", start, mode)
                 
         with tab_sugar:
-            if data_sugar:
-                df_s = pd.DataFrame(data_sugar, columns=["Glucose", "Extra", "Notes", "Timestamp"])
-                df_s['Date'] = pd.to_datetime(df_s['Timestamp'], unit='s')
-                fig = px.line(df_s, x="Date", y="Glucose", title="Blood Sugar Trends")
-                st.plotly_chart(fig, use_container_width=True)
-                st.info(analyze_vitals(data_sugar, "sugar"))
-            else:
-                st.write("No Sugar data yet.")
+            render_vitals_tab(analytics, user, "sugar", {"main": "Glucose"}, "Blood Sugar Trends", "No Sugar data yet.",
+                              start, mode)
+
+def render_vitals_tab(analytics, user, vitals_type, columns, title, empty_text, start, mode):
+    import pandas as pd
+    import plotly.express as px
+    from app.core.vitals_analytics import DAY_S
+    from app.core.vitals_query import vitals_chart
+
+    # At most CHART_MAX_POINTS points per chart, however long the history
+    df = vitals_chart(user, vitals_type, start=start, method=mode)
+    if df.empty:
+        st.write(empty_text if analytics.summary(user, vitals_type).count == 0 else "No readings in this range.")
+        return
+    df["Date"] = pd.to_datetime(df["created_at"], unit="s")
+    fig = px.line(df.rename(columns=columns), x="Date", y=list(columns.values()), title=title)
+    if mode == "buckets":
+        for col, label in columns.items():
+            # Shaded min-max band behind each mean line
+            fig.add_scatter(x=df["Date"], y=df[f"{col}_max"], mode="lines", line_width=0, showlegend=False, hoverinfo="skip")
+            fig.add_scatter(x=df["Date"], y=df[f"{col}_min"], mode="lines", line_width=0, fill="tonexty",
+                            name=f"{label} range", hoverinfo="skip")
+    st.plotly_chart(fig, use_container_width=True)
+
+    # The last 30 days up to now (window_s would count back from the latest reading, however old)
+    month = analytics.summary(user, vitals_type, start=int(time.time()) - 30 * DAY_S)
+    mean = "/".join(f"{m:.0f}" for m in month.mean if m is not None)
+    c1, c2, c3 = st.columns(3)
+    c1.metric("30-day average", mean or "no readings")
+    slope = month.slope_per_week[0]
+    c2.metric("Trend", month.trend, f"{slope:+.1f}/week" if slope is not None else None, delta_color="inverse")
+    c3.metric("Out of range (30 days)", f"{month.high_count + month.low_count} of {month.count}")
+    st.info(analytics.advice(user, vitals_type))
+
+def render_search_results(user, query):
+    # Cursor stack per query, so a new search starts again at the best matches
+    cursors = st.session_state.setdefault(f"search_cursors_{user}_{query}", [None])
+    hits, next_cursor = search_messages(user, query, limit=HISTORY_PAGE_SIZE, cursor=cursors[-1])
+    if not hits and len(cursors) == 1:
+        st.write("No matching messages.")
+        return
+
+    for _, sid, title, role, snippet, created_at in hits:
+        when = datetime.fromtimestamp(created_at).strftime("%Y-%m-%d %H:%M")
+        st.markdown(f"**{title}** · {when}  \n**{role.upper()}**: {snippet}")
+
+    col_prev, col_next = st.columns(2)
+    if len(cursors) > 1 and col_prev.button("← Better matches"):
+        cursors.pop()
+        st.rerun()
+    if next_cursor and col_next.button("More matches →"):
+        cursors.append(next_cursor)
+        st.rerun()
 
 def render_history_page(user):
     st.markdown("### 📁 Full Interaction Archive")
-    sessions = get_user_sessions(user)
-    if not sessions:
+    query = st.text_input("Search your history", placeholder='e.g. cholesterol, "chest x-ray", palpit*').strip()
+    if query:
+        render_search_results(user, query)
+        return
+    # A page of sessions and their messages comes back from one query (no per-session lookups)
+    cursors = st.session_state.setdefault(f"history_cursors_{user}", [None])
+    sessions, next_cursor = load_user_history(user, limit=HISTORY_PAGE_SIZE, cursor=cursors[-1])
+    if not sessions and len(cursors) == 1:
         st.write("No history found.")
         return
-        
-    for sid, title in sessions:
+
+    for sid, title, _, msgs in sessions:
         with st.expander(f"{title} ({sid.split('_')[-1]})"):
-            msgs = get_session_messages(sid)
             for role, content, _ in msgs:
                 st.markdown(f"**{role.upper()}**: {content}")
 
+    col_newer, col_older = st.columns(2)
+    if len(cursors) > 1 and col_newer.button("← Newer"):
+        cursors.pop()
+        st.rerun()
+    if next_cursor and col_older.button("Older →"):
+        cursors.append(next_cursor)
+        st.rerun()
+
 def main():
     init_db()
     if "user" not in st.session_state:
         login_screen()
+        if not SERVER_URL:
+            model_startup()
     else:
         main_app()
 
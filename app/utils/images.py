@@ -0,0 +1,33 @@
+# app/utils/images.py
+import hashlib
+import io
+
+from PIL import Image
+
+MAX_IMAGE_SIDE = 1536  # MedGemma sees 896x896; anything much larger only costs decode/resize time
+# Stored as an instance attribute, not in `image.info`, so derived images (resize, crop...) do not inherit it
+HASH_ATTR = "_content_hash"
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def image_key(image: Image.Image) -> str:
+    """Content hash of a PIL image: the upload hash set by `decode_image`, else a hash of the pixels."""
+    key = getattr(image, HASH_ATTR, None)
+    if key is None:
+        key = content_hash(f"{image.mode}{image.size}".encode() + image.tobytes())
+        setattr(image, HASH_ATTR, key)
+    return key
+
+def decode_image(data: bytes, max_side: int = MAX_IMAGE_SIDE) -> Image.Image:
+    """Decode an upload to RGB, downscaling so the longer side is at most `max_side`."""
+    img = Image.open(io.BytesIO(data))
+    if max_side and max(img.size) > max_side:
+        # JPEG can decode straight to a reduced scale (1/2, 1/4, 1/8) that still covers the target size
+        scale = max_side / max(img.size)
+        img.draft("RGB", (round(img.width * scale), round(img.height * scale)))
+    img = img.convert("RGB")
+    if max_side and max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.Resampling.BICUBIC)
+    setattr(img, HASH_ATTR, f"{content_hash(data)}-{max_side}")
+    return img
@@ -1 +1,28 @@
 # app/utils/io.py
+import json
+from pathlib import Path
+from typing import Iterable, Iterator
+
+def read_jsonl(path: str | Path) -> Iterator[dict]:
+    """Yield one dict per non-empty line of a JSONL file."""
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def write_jsonl(path: str | Path, rows: Iterable[dict]):
+    with Path(path).open("w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+def read_json(path: str | Path):
+    with Path(path).open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_json(path: str | Path, data, indent: int = 2):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+        f.write("\n")
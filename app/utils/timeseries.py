@@ -0,0 +1,47 @@
+import numpy as np
+
+# Bucket widths (seconds) charts step through: 1/5/15 min, 1/3/6/12 h, 1/2/3 days, 1 week, 30 days
+NICE_BUCKETS_S = (60, 300, 900, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400, 2 * 86400, 3 * 86400, 7 * 86400, 30 * 86400)
+
+def bucket_seconds(span_s: float, max_points: int) -> int:
+    """Smallest nice bucket width that splits `span_s` into at most `max_points` buckets."""
+    need = span_s / max(1, max_points)
+    for width in NICE_BUCKETS_S:
+        if width >= need:
+            return width
+    return int(np.ceil(need / NICE_BUCKETS_S[-1])) * NICE_BUCKETS_S[-1]
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of `n_out` points chosen by Largest-Triangle-Three-Buckets (x sorted ascending).
+
+    Keeps the first and last point and, per bucket, the point forming the largest triangle
+    with the previously kept point and the next bucket's mean, so spikes survive.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][: max(n_out, 0)], dtype=np.int64)
+    x = np.asarray(x, dtype=float)
+    x = x - x[0]  # keeps the cumulative sums of unix timestamps precise
+    y = np.asarray(y, dtype=float)
+    # Bucket edges over the interior points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Per-bucket means via cumulative sums, for the "next bucket" corner of each triangle
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    counts = edges[1:] - edges[:-1]
+    mean_x = (cx[edges[1:]] - cx[edges[:-1]]) / counts
+    mean_y = (cy[edges[1:]] - cy[edges[:-1]]) / counts
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        area = np.abs((x[a] - mean_x[b]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y[b] - y[a]))
+        a = lo + int(np.argmax(area))
+        out[b + 1] = a
+    return out
@@ -0,0 +1,216 @@
+# eval/bench_achat.py
+"""End-to-end latency of a voice + scan question: sequential chat pipeline vs Orchestrator.achat.
+
+Uses a fake ASR (sleeps --asr-ms), a fake model whose image preprocessing sleeps --image-ms
+and whose decode runs at --per-token-ms, and a persist callback that sleeps --db-ms per write.
+"sequential" runs transcribe -> image -> save question -> chat_stream -> save answer;
+achat overlaps transcription with image prep and the DB writes/metrics with the rest.
+Also checks that a guardrail refusal and an abandoned request (the asyncio task cancelled
+mid-stream, on the tiny model) stop generation instead of letting it run to the end, and
+that through the model server an abandoned request stops the server-side job too, whether it
+is streaming or still queued.
+
+  PYTHONPATH=. python eval/bench_achat.py --asr-ms 400 --image-ms 300 --db-ms 20
+"""
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import CancelledError
+
+from PIL import Image
+
+from app.core.orchestrator import Orchestrator
+from app.server.client import RemoteMedGemmaClient
+from app.server.model_server import ModelServer
+from eval.fake_model import FakeMedGemmaClient
+from eval.tiny_model import build_tiny_client
+
+class FakeASR:
+    def __init__(self, delay_s: float, text: str):
+        self.delay_s = delay_s
+        self.text = text
+
+    def transcribe(self, audio_path: str) -> str:
+        time.sleep(self.delay_s)
+        return self.text
+
+class SlowImageModel(FakeMedGemmaClient):
+    supports_cancel = True
+
+    def __init__(self, image_s: float, **kwargs):
+        super().__init__(**kwargs)
+        self.image_s = image_s
+        self.tokens_out = 0
+
+    def prepare_image(self, image):
+        time.sleep(self.image_s)
+
+    def generate_stream(self, prompt, image=None, max_new_tokens=512, temperature=0.2, cancel=None):
+        for tok in super().generate_stream(prompt, image, max_new_tokens, temperature):
+            if cancel is not None and cancel.is_set():
+                return
+            self.tokens_out += 1
+            yield tok
+
+    def generate(self, prompt, image=None, max_new_tokens=512, temperature=0.2, cancel=None):
+        return "".join(self.generate_stream(prompt, image, max_new_tokens, temperature, cancel)).strip()
+
+class CountingStream:
+    """Wraps a client so the bench sees how many deltas generation produced."""
+
+    def __init__(self, client):
+        self.client = client
+        self.deltas = 0
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def generate_stream(self, *args, **kwargs):
+        for delta in self.client.generate_stream(*args, **kwargs):
+            self.deltas += 1
+            yield delta
+
+async def abandon_after(orch: Orchestrator, question: str, deltas: int | None = None, delay_s: float = 0.0):
+    """Cancel an achat task after it streamed `deltas` deltas, or after `delay_s`."""
+    seen, n = asyncio.Event(), [0]
+
+    def on_delta(delta):
+        n[0] += 1
+        if deltas is not None and n[0] >= deltas:
+            seen.set()
+
+    task = asyncio.create_task(orch.achat("bench", user_question=question, on_delta=on_delta))
+    if deltas is not None:
+        await seen.wait()
+    else:
+        await asyncio.sleep(delay_s)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+def check_server_cancel(per_token_ms: float) -> bool:
+    """Abandon a streaming and a queued request sent through a one-worker model server."""
+    model = SlowImageModel(0, prefill_s=0.05, per_token_s=per_token_ms / 1000)
+    server = ModelServer(model, workers=1, port=0).start()
+    remote = RemoteMedGemmaClient(server.url)
+    orch = Orchestrator(remote)
+    question = "What does a high LDL cholesterol mean?"
+    full_tokens = len(model._tokens(orch._build_prompt(question, None, None, None)[0], 512))
+    try:
+        asyncio.run(abandon_after(orch, question, deltas=5))
+        time.sleep(0.3)
+        streamed = model.tokens_out
+        time.sleep(0.3)
+        stream_ok = streamed < full_tokens // 4 and model.tokens_out == streamed
+
+        # Keep the only worker busy, then abandon a request while it waits in the queue
+        busy = threading.Thread(target=lambda: "".join(remote.generate_stream("occupy the worker")))
+        busy.start()
+        time.sleep(0.1)
+        calls = model.calls
+        asyncio.run(abandon_after(orch, question, delay_s=0.2))
+        busy.join()
+        time.sleep(0.3)
+        queued_ok = model.calls == calls
+
+        # Non-streaming generate: cancelling the caller's event stops the server-side job too
+        stop = threading.Event()
+        threading.Timer(0.2, stop.set).start()
+        model.tokens_out = 0
+        try:
+            remote.generate(question, cancel=stop)
+            raised = False
+        except CancelledError:
+            raised = True
+        time.sleep(0.3)
+        generate_ok = raised and model.tokens_out < full_tokens // 2
+        cancelled = server.stats().get("cancelled", 0)
+    finally:
+        orch.close()
+        server.stop()
+    print(f"model server: abandoned stream stopped the job after {streamed}/{full_tokens} tokens: {stream_ok}; "
+          f"abandoned queued request never ran: {queued_ok}; cancelled generate() stopped after "
+          f"{model.tokens_out} tokens: {generate_ok} (cancelled {cancelled})")
+    return stream_ok and queued_ok and generate_ok and cancelled == 3
+
+def sequential(orch: Orchestrator, image, persist, question: str) -> float:
+    t0 = time.perf_counter()
+    q = orch.transcribe_if_audio("question.wav") or question
+    orch.medgemma.prepare_image(image)
+    persist("user", q)
+    answer = "".join(orch.chat_stream(user_id="bench", user_question=q, pasted_text=None, image=image))
+    persist("assistant", answer)
+    return time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--asr-ms", type=float, default=400)
+    ap.add_argument("--image-ms", type=float, default=300)
+    ap.add_argument("--db-ms", type=float, default=20)
+    ap.add_argument("--prefill-ms", type=float, default=150)
+    ap.add_argument("--per-token-ms", type=float, default=2)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    question = "What does this scan show about my lungs?"
+    image = Image.new("RGB", (64, 64), "gray")
+    model = SlowImageModel(args.image_ms / 1000, prefill_s=args.prefill_ms / 1000, per_token_s=args.per_token_ms / 1000)
+    orch = Orchestrator(model, FakeASR(args.asr_ms / 1000, question))
+    persist = lambda role, content: time.sleep(args.db_ms / 1000)
+
+    seq = min(sequential(orch, image, persist, question) for _ in range(args.repeat))
+    results = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        result = asyncio.run(orch.achat("bench", image=image, audio_path="question.wav", persist=persist))
+        results.append((time.perf_counter() - t0, result))
+    conc, result = min(results, key=lambda r: r[0])
+    gen_s = result.timings["generate"]
+    print(f"stages (achat): {result.timings}")
+    print(f"sequential: {seq * 1000:7.1f} ms")
+    print(f"achat:      {conc * 1000:7.1f} ms   x{seq / conc:.2f}  "
+          f"(floor: slowest of ASR/image + generation = {(max(args.asr_ms, args.image_ms) / 1000 + gen_s) * 1000:.0f} ms)")
+    same = result.answer == "".join(orch.chat_stream(user_id="bench", user_question=question, pasted_text=None, image=image)).strip()
+
+    # Refusal: generation started optimistically must stop, not run to the end; the refusal is saved as the reply
+    model.tokens_out = 0
+    saved = []
+    refusal_q = "What dose of morphine should I take?"
+    t0 = time.perf_counter()
+    refused = asyncio.run(orch.achat("bench", user_question=refusal_q, persist=lambda role, content: saved.append((role, content))))
+    refused_s = time.perf_counter() - t0
+    time.sleep(args.prefill_ms / 1000 + 0.05)
+    print(f"\nrefusal: {refused_s * 1000:.1f} ms, refused={refused.refused}, tokens generated after refusal: {model.tokens_out}, "
+          f"saved roles: {[role for role, _ in saved]}")
+    refusal_ok = (refused.refused and model.tokens_out == 0
+                  and saved == [("user", refusal_q), ("assistant", refused.answer)])
+
+    orch.close()
+
+    # Abandoned request on the tiny model: cancel the task after a few deltas
+    tiny = CountingStream(build_tiny_client())
+    orch_tiny = Orchestrator(tiny)
+    t0 = time.perf_counter()
+    full = asyncio.run(orch_tiny.achat("bench", user_question="w1 w2 w3 w4"))
+    full_s, full_deltas = time.perf_counter() - t0, tiny.deltas
+
+    tiny.deltas = 0
+    t0 = time.perf_counter()
+    asyncio.run(abandon_after(orch_tiny, "w1 w2 w3 w4", deltas=5))
+    orch_tiny.close()  # wait for the generation thread to notice
+    abandon_s, abandon_deltas = time.perf_counter() - t0, tiny.deltas
+    print(f"tiny model, full answer: {full_deltas} deltas in {full_s * 1000:.0f} ms; "
+          f"abandoned: generation stopped after {abandon_deltas} deltas, {abandon_s * 1000:.0f} ms")
+    abandon_ok = abandon_deltas < max(10, full_deltas // 4)
+    server_ok = check_server_cancel(args.per_token_ms * 5)
+
+    print(f"\nsame answer as chat_stream: {same}; refusal cancels generation: {refusal_ok}; "
+          f"abandon cancels generation: {abandon_ok}; and on the model server: {server_ok}")
+    if not (same and refusal_ok and abandon_ok and server_ok and conc < seq):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
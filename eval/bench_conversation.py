@@ -0,0 +1,80 @@
+# eval/bench_conversation.py
+"""Prompt and prefill size per turn of a long chat: full history vs token-budgeted history + session KV cache.
+
+"naive" puts every earlier turn verbatim into the prompt and prefills it from scratch each turn.
+"managed" renders history with ConversationContext (budget --budget tokens) and passes a
+session_id, so MedGemmaClient reuses the previous turn's KV cache for the unchanged prefix.
+Greedy answers of the managed run are checked against the same prompts without the session cache.
+The tiny model has sliding-window layers (--sliding-window tokens, every layer but the last,
+like Gemma 3's 1024-token window) smaller than the cached conversation, so reuse has to crop
+back past the window.
+
+  PYTHONPATH=. python eval/bench_conversation.py --turns 24 --budget 256
+"""
+import argparse
+import random
+import time
+
+from app.core.conversation import ConversationContext, token_counter
+from app.core.prompts import build_user_prompt
+from eval.tiny_model import build_tiny_client, random_prompt
+
+def run(client, context: ConversationContext, questions: list[str], max_new_tokens: int, session_id: str | None):
+    history, rows = [], []
+    for q in questions:
+        block, stats = context.render(session_id or "bench", history) if history else (None, {"history_tokens": 0})
+        prompt = build_user_prompt(q, None, block)
+        before = client.session_cache.stats()
+        t0 = time.perf_counter()
+        answer = client.generate(prompt, max_new_tokens=max_new_tokens, temperature=0.0, session_id=session_id)
+        elapsed = time.perf_counter() - t0
+        after = client.session_cache.stats()
+
+        prompt_tokens = client._prepare_inputs([client._format_prompt(prompt, False)], None)["input_ids"].shape[1]
+        reused = after["reused_tokens"] - before["reused_tokens"]
+        rows.append({"prompt": prompt_tokens, "prefill": prompt_tokens - reused, "history": stats["history_tokens"],
+                     "ms": elapsed * 1000, "answer": answer})
+        history += [("user", q), ("assistant", answer)]
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--turns", type=int, default=24)
+    ap.add_argument("--budget", type=int, default=256)
+    ap.add_argument("--max-new-tokens", type=int, default=24)
+    ap.add_argument("--hidden-size", type=int, default=128)
+    ap.add_argument("--layers", type=int, default=4)
+    ap.add_argument("--sliding-window", type=int, default=64)
+    args = ap.parse_args()
+
+    client = build_tiny_client(hidden_size=args.hidden_size, num_layers=args.layers, sliding_window=args.sliding_window)
+    client.prefix_cache.prefix_text = None  # isolate the effect of history handling
+    rng = random.Random(0)
+    questions = [random_prompt(rng, 6, 20) for _ in range(args.turns)]
+    count = token_counter(client)
+
+    naive = run(client, ConversationContext(count, budget_tokens=10**9), questions, args.max_new_tokens, None)
+    context = ConversationContext(count, budget_tokens=args.budget)
+    managed = run(client, context, questions, args.max_new_tokens, "s1")
+    # Same managed prompts, prefilled from scratch: the KV reuse must not change greedy answers
+    check = run(client, ConversationContext(count, budget_tokens=args.budget), questions, args.max_new_tokens, None)
+
+    print(f"{'turn':>4s} | {'naive prompt':>12s} {'ms':>7s} | {'managed prompt':>14s} {'history':>7s} {'prefill':>7s} {'ms':>7s}")
+    for i, (n, m) in enumerate(zip(naive, managed), 1):
+        print(f"{i:4d} | {n['prompt']:12d} {n['ms']:7.1f} | {m['prompt']:14d} {m['history']:7d} {m['prefill']:7d} {m['ms']:7.1f}")
+
+    total = lambda rows, k: sum(r[k] for r in rows)
+    print(f"\ntotal prefill tokens: naive {total(naive, 'prefill')}, managed {total(managed, 'prefill')}")
+    print(f"max prompt tokens   : naive {max(r['prompt'] for r in naive)}, managed {max(r['prompt'] for r in managed)}")
+    print(f"total time          : naive {total(naive, 'ms'):.0f} ms, managed {total(managed, 'ms'):.0f} ms")
+    print(f"session cache: {client.session_cache.stats()}")
+    print(f"turns tokenised: {context.tokenised_turns} for {2 * (args.turns - 1)} history turns")
+    mismatches = sum(m["answer"] != c["answer"] for m, c in zip(managed, check))
+    longest = max(m["prompt"] for m in managed)
+    print(f"answer mismatches with vs without KV reuse: {mismatches} "
+          f"(sliding window {args.sliding_window}, longest prompt {longest} tokens)")
+    if mismatches or (longest > args.sliding_window and client.session_cache.hits == 0):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
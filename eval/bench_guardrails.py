@@ -0,0 +1,111 @@
+# eval/bench_guardrails.py
+"""Per-pattern re.search baseline vs the combined GuardrailEngine over large pasted reports.
+
+First checks that scan() fires exactly the rules a per-pattern re.search fires, on phrases
+where rules overlap or nest inside each other ("severe bleeding" / "bleeding").
+
+Usage: PYTHONPATH=. python eval/bench_guardrails.py
+"""
+import random
+import re
+import time
+
+from app.core.guardrails import GuardrailEngine, Rule, UNSAFE_PATTERNS, URGENT_SYMPTOMS
+
+VOCAB = ("patient presents with mild cough fever resolved labs within normal limits ldl cholesterol "
+         "hemoglobin a1c follow up imaging unremarkable no acute findings recommended").split()
+
+def synthetic_report(n_chars: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words, size = [], 0
+    while size < n_chars:
+        w = rng.choice(VOCAB)
+        words.append(w)
+        size += len(w) + 1
+    return " ".join(words)
+
+def synthetic_rules(n: int, seed: int = 1) -> list[Rule]:
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    rules = []
+    for i in range(n):
+        kws = ["".join(rng.choice(letters) for _ in range(rng.randint(6, 12))) for _ in range(3)]
+        rules.append(Rule(f"extra_{i}", rng.choice(["unsafe", "urgent"]), r"\b(" + "|".join(kws) + r")\b"))
+    return rules
+
+def baseline(patterns: list[str], text: str):
+    # The original run_guardrails: lowercase, then one re.search per pattern
+    t = text.lower()
+    return [p for p in patterns if re.search(p, t)]
+
+# Extra rules overlapping the defaults: nested keywords, shared prefixes, regex rules over keyword spans
+OVERLAP_RULES = [
+    Rule("u_bleed", "unsafe", r"\b(bleeding)\b"),
+    Rule("u_chest", "urgent", r"\b(chest)\b"),
+    Rule("kw_pain", "urgent", keywords=("pain", "chest pain radiating", "severe")),
+    Rule("kw_kill", "unsafe", keywords=("kill", "kill myself now")),
+    Rule("r_breath", "urgent", r"short\w* of breath"),
+    Rule("r_dose", "unsafe", r"\d+\s*mg\b"),
+]
+OVERLAP_TEXTS = [
+    "I have severe bleeding",
+    "SEVERE BLEEDING since this morning",
+    "Chest pain radiating to my left arm",
+    "shortness of breath after taking 500 mg",
+    "sometimes I want to kill myself now",
+    "he passed out and was unconscious, chest pain too",
+    "mild cough, labs within normal limits",
+]
+
+def rule_pattern(rule: Rule) -> str:
+    return rule.pattern or r"\b(" + "|".join(re.escape(k) for k in rule.keywords) + r")\b"
+
+def check_overlaps() -> bool:
+    rules = GuardrailEngine.default().rules + OVERLAP_RULES
+    engine = GuardrailEngine(rules)
+    ok = True
+    for text in OVERLAP_TEXTS:
+        got = {m.rule_id for m in engine.scan(text)}
+        want = {r.rule_id for r in rules if re.search(rule_pattern(r), text.lower())}
+        ok &= got == want
+        if got != want:
+            print(f"  MISMATCH {text!r}: scan {sorted(got)} vs re.search {sorted(want)}")
+    ok &= not engine.check("I have severe bleeding").allowed
+    print(f"overlapping/nested rules fire exactly as per-pattern re.search ({len(OVERLAP_TEXTS)} texts): {ok}")
+    return ok
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+def main():
+    if not check_overlaps():
+        raise SystemExit(1)
+
+    default_rules = GuardrailEngine.default().rules
+    base_patterns = UNSAFE_PATTERNS + URGENT_SYMPTOMS
+
+    print("scaling with report size (default rules + 1000 extra):")
+    extra = synthetic_rules(1000)
+    engine = GuardrailEngine(default_rules + extra)
+    patterns = base_patterns + [r.pattern for r in extra]
+    for n_chars in (10_000, 100_000, 1_000_000):
+        text = synthetic_report(n_chars)
+        print(f"  {n_chars:>9,} chars: baseline {timed(lambda: baseline(patterns, text), repeat=1):9.1f} ms   "
+              f"engine {timed(lambda: engine.scan(text)):8.1f} ms")
+
+    print("scaling with rule count (100k-char report):")
+    text = synthetic_report(100_000)
+    for n_rules in (10, 100, 1000, 5000):
+        extra = synthetic_rules(n_rules)
+        engine = GuardrailEngine(default_rules + extra)
+        patterns = base_patterns + [r.pattern for r in extra]
+        print(f"  {n_rules:>5} rules: baseline {timed(lambda: baseline(patterns, text), repeat=1):9.1f} ms   "
+              f"engine {timed(lambda: engine.scan(text)):8.1f} ms")
+
+if __name__ == "__main__":
+    main()
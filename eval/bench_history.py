@@ -0,0 +1,83 @@
+# eval/bench_history.py
+"""Synthetic chat-history benchmark: N+1 history loading without indexes vs indexed + single-query loading.
+
+Usage: PYTHONPATH=. python eval/bench_history.py --users 10000 --messages 1000000
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import app.db.store as store
+
+def populate(users: int, messages: int, sessions_per_user: int, seed: int = 0):
+    rng = random.Random(seed)
+    n_sessions = users * sessions_per_user
+    per_session = max(1, messages // n_sessions)
+    now = int(time.time())
+    with store._write() as conn:
+        conn.executemany("INSERT INTO users (username, password) VALUES (?, ?)", ((f"user{u}", "pw") for u in range(users)))
+        conn.executemany(
+            "INSERT INTO chat_sessions (session_id, username, title, created_at) VALUES (?, ?, ?, ?)",
+            ((f"user{u}_{s}", f"user{u}", f"Session {s}", now - rng.randrange(10**7))
+             for u in range(users) for s in range(sessions_per_user))
+        )
+        # Interleave sessions so one session's messages are scattered across the table, as in real use
+        def rows():
+            for i in range(per_session):
+                for sid in range(n_sessions):
+                    u, s = divmod(sid, sessions_per_user)
+                    yield (f"user{u}_{s}", "user" if i % 2 == 0 else "assistant", "lorem ipsum " * 8, None, now + i)
+        conn.executemany(
+            "INSERT INTO messages (session_id, role, content, image_path, created_at) VALUES (?, ?, ?, ?, ?)", rows()
+        )
+    return n_sessions * per_session
+
+def n_plus_one(username):
+    return [(sid, title, store.get_session_messages(sid)) for sid, title in store.get_user_sessions(username)]
+
+def timed(label, fn, usernames):
+    t0 = time.perf_counter()
+    for u in usernames:
+        fn(u)
+    per_user = (time.perf_counter() - t0) / len(usernames) * 1000
+    print(f"  {label:38s}: {per_user:9.3f} ms/user")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=10_000)
+    ap.add_argument("--messages", type=int, default=1_000_000)
+    ap.add_argument("--sessions-per-user", type=int, default=5)
+    ap.add_argument("--sample", type=int, default=20, help="users timed per measurement")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store.DB_PATH = Path(tmp) / "history.db"
+        store.init_db()
+        with store._write() as conn:
+            # Start from the pre-migration schema (no secondary indexes)
+            conn.execute("DROP INDEX IF EXISTS idx_sessions_user_created")
+            conn.execute("DROP INDEX IF EXISTS idx_messages_session_created")
+            conn.execute("PRAGMA user_version=0")
+
+        t0 = time.perf_counter()
+        n = populate(args.users, args.messages, args.sessions_per_user)
+        print(f"populated {args.users} users / {n} messages in {time.perf_counter() - t0:.1f}s")
+
+        sample = [f"user{u}" for u in random.Random(1).sample(range(args.users), min(args.sample, args.users))]
+
+        print("before (no indexes):")
+        timed("get_user_sessions + N x messages", n_plus_one, sample)
+
+        t0 = time.perf_counter()
+        store.init_db()
+        print(f"migration (index build): {time.perf_counter() - t0:.2f}s")
+
+        print("after (indexes):")
+        timed("get_user_sessions + N x messages", n_plus_one, sample)
+        timed("load_user_history (one query)", lambda u: store.load_user_history(u, limit=20), sample)
+        timed("get_user_sessions_page (20)", lambda u: store.get_user_sessions_page(u, limit=20), sample)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# eval/bench_image_cache.py
+"""Scan upload preprocessing: decode + processor on every request vs the content-hashed image cache.
+
+Uses a Gemma3 image processor and a multimodal processor around the tiny tokenizer, so no
+model download is needed. Checks that cached inputs are identical to freshly processed ones
+and that the on-disk tier survives a new cache instance.
+"""
+import io
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import Gemma3ImageProcessorPil, Gemma3Processor
+
+from app.models.image_cache import CachedImageProcessor, ImageCache
+from eval.tiny_model import build_tiny_tokenizer
+
+PROMPT = "w1 w2 <start_of_image> w3"
+REPEATS = 20
+
+def fake_xray(width: int = 4000, height: int = 3000, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    base = np.linspace(0, 255, width, dtype=np.float32)[None, :] * np.ones((height, 1), dtype=np.float32)
+    noise = rng.normal(0, 20, (height // 8, width // 8)).repeat(8, 0).repeat(8, 1)
+    img = Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8)).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+def build_processor(image_seq_length: int = 16) -> Gemma3Processor:
+    image_tokens = ["<start_of_image>", "<image_soft_token>", "<end_of_image>"]
+    tok = build_tiny_tokenizer()
+    tok.add_special_tokens({"additional_special_tokens": image_tokens})
+    for name, token in zip(("boi", "image", "eoi"), image_tokens):
+        setattr(tok, f"{name}_token", token)
+        setattr(tok, f"{name}_token_id", tok.convert_tokens_to_ids(token))
+    return Gemma3Processor(image_processor=Gemma3ImageProcessorPil(), tokenizer=tok, image_seq_length=image_seq_length)
+
+def timed(fn, n: int = REPEATS) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n
+
+def main():
+    warnings.filterwarnings("ignore")
+    data = fake_xray()
+    print(f"upload: 4000x3000 JPEG, {len(data) / 2**20:.1f} MiB, {REPEATS} repeat questions")
+
+    plain = build_processor()
+
+    def legacy():
+        img = Image.open(io.BytesIO(data)).convert("RGB")
+        return plain(text=PROMPT, images=[img], return_tensors="pt")
+
+    cache = ImageCache()
+    cached = build_processor()
+    cached.image_processor = CachedImageProcessor(cached.image_processor, cache)
+
+    def with_cache():
+        img = cache.load_image(data)
+        return cached(text=PROMPT, images=[img], return_tensors="pt")
+
+    t_legacy = timed(legacy)
+    t0 = time.perf_counter()
+    first = with_cache()
+    t_first = time.perf_counter() - t0
+    t_cached = timed(with_cache)
+    print(f"decode+process every request : {t_legacy * 1000:8.2f} ms")
+    print(f"cache, first request         : {t_first * 1000:8.2f} ms   (downscaled decode)")
+    print(f"cache, repeat requests       : {t_cached * 1000:8.2f} ms   x{t_legacy / t_cached:.0f}")
+    print(f"cache stats: {cache.stats()}")
+
+    # Cached inputs must be exactly what the processor produces for the same decoded image
+    img = cache.load_image(data)
+    fresh = plain(text=PROMPT, images=[img], return_tensors="pt")
+    again = with_cache()
+    same = all(torch.equal(fresh[k], again[k]) and torch.equal(first[k], again[k]) for k in fresh)
+    print(f"cached inputs identical to fresh processing: {same}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ImageCache(disk_dir=tmp).put_features("scan", dict(fresh), "v")
+        reloaded = ImageCache(disk_dir=tmp)
+        feats = reloaded.get_features("scan", "v")
+        disk_ok = feats is not None and torch.equal(feats["pixel_values"], fresh["pixel_values"])
+        print(f"disk tier reload (mmap): {disk_ok}, stats {reloaded.stats()}")
+
+    small = ImageCache(max_bytes=12 * 2**20)
+    for seed in range(4):
+        small.load_image(fake_xray(1600, 1200, seed))
+    print(f"bounded LRU (12 MiB, 4 x 5.3 MiB images): {small.stats()}")
+
+    if not (same and disk_ok and t_cached < t_legacy):
+        raise SystemExit("image cache check FAILED")
+
+if __name__ == "__main__":
+    main()
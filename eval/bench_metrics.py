@@ -0,0 +1,99 @@
+# eval/bench_metrics.py
+"""log_event throughput: the original open/write/close-per-event logger vs the buffered background writer.
+
+Also checks that flush() returns only once every logged event is in the file, and that a
+process exiting right after logging (no explicit flush) still leaves all its events on disk.
+
+Usage: PYTHONPATH=. python eval/bench_metrics.py --events 20000
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import app.core.metrics as metrics
+
+def legacy_log_event(event: dict):
+    event = dict(event)
+    event["ts"] = time.time()
+    with metrics.LOG_PATH.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+def sample_event(rng: random.Random) -> dict:
+    if rng.random() < 0.1:
+        return {"type": "refusal", "reason": "unsafe_request"}
+    return {"type": "chat", "urgent": rng.random() < 0.05, "sections_ok": rng.random() < 0.9,
+            "groundedness_proxy": 1.0, "cached": False, "generation_s": rng.lognormvariate(1.5, 0.4)}
+
+def run(label, log_fn, events, threads, flush=None):
+    per_thread = events // threads
+    worst = [0.0] * threads
+
+    def worker(i):
+        rng = random.Random(i)
+        for _ in range(per_thread):
+            t0 = time.perf_counter()
+            log_fn(sample_event(rng))
+            worst[i] = max(worst[i], time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    caller = time.perf_counter() - t0
+    if flush:
+        flush()
+    total = time.perf_counter() - t0
+    n = per_thread * threads
+    lines = sum(1 for _ in metrics.LOG_PATH.open())
+    print(f"{label:8s}: caller-side {n / caller:10.0f} ev/s   incl. flush {n / total:10.0f} ev/s   "
+          f"worst call {max(worst) * 1000:6.2f} ms   lines={lines}")
+    return n / caller
+
+SHUTDOWN_CODE = """
+import sys
+from pathlib import Path
+import app.core.metrics as metrics
+metrics.LOG_PATH = Path(sys.argv[1])
+for i in range(int(sys.argv[2])):
+    metrics.log_event({"type": "chat", "i": i})
+"""
+
+def check_shutdown(path: Path, events: int) -> bool:
+    """Log from a fresh interpreter that exits at once; the atexit handler must write everything."""
+    env = {**os.environ, "PYTHONPATH": str(Path(__file__).resolve().parents[1])}
+    subprocess.run([sys.executable, "-c", SHUTDOWN_CODE, str(path), str(events)], check=True, env=env)
+    lines = sum(1 for _ in path.open()) if path.exists() else 0
+    print(f"exit without flush: {lines}/{events} events on disk")
+    return lines == events
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=20000)
+    ap.add_argument("--threads", type=int, default=4)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics.LOG_PATH = Path(tmp) / "legacy.jsonl"
+        before = run("before", legacy_log_event, args.events, args.threads)
+        metrics.LOG_PATH = Path(tmp) / "buffered.jsonl"
+        after = run("after", metrics.log_event, args.events, args.threads, flush=metrics.flush_metrics)
+        n = args.events // args.threads * args.threads
+        ok = sum(1 for _ in metrics.LOG_PATH.open()) == n
+        ok &= check_shutdown(Path(tmp) / "shutdown.jsonl", args.events)
+    print(f"caller-side speed-up x{after / before:.1f}")
+    print(json.dumps(metrics.get_metrics_summary(), indent=2))
+    print(f"all events on disk after flush() and at exit: {ok}")
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# eval/bench_metrics_archive.py
+"""Metrics log analytics: json.loads per line over the whole log vs the incremental columnar archive.
+
+Writes a synthetic metrics_log.jsonl of --mb megabytes in log_event's format (chat, refusal,
+section_control, achat events over --days days, a few out of timestamp order and a few
+corrupt lines), then:
+  * baseline: re-read the whole file, json.loads each line, hourly refusal/urgent/sections/
+    groundedness rates in a dict;
+  * archive: MetricsArchive.update() (mmap chunks, fast-path parser, NumPy columns), then
+    hourly/daily rates from the columns; peak RSS of both is tracked.
+Then appends 1% more events and times the incremental update, times a one-day query through
+the hourly index, and checks resume across MetricsLogger rotation, an interrupted update and
+compaction of rotated logs.
+
+  PYTHONPATH=. python eval/bench_metrics_archive.py --mb 1024
+"""
+import argparse
+import json
+import math
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import app.core.metrics_archive as ma
+from app.core.metrics import MetricsLogger
+from eval.bench_vitals_import import peak_rss_during
+
+def events(rng, n: int, t0: float, span_s: float):
+    for i in range(n):
+        ts = t0 + span_s * i / n + (rng.uniform(-0.05, 0) if rng.random() < 0.01 else 0)  # racing threads
+        r = rng.random()
+        if r < 0.08:
+            e = {"type": "refusal", "reason": "unsafe_request"}
+        elif r < 0.7:
+            e = {"type": "chat", "urgent": rng.random() < 0.05, "sections_ok": rng.random() < 0.9,
+                 "groundedness_proxy": float(rng.random() < 0.8), "cached": rng.random() < 0.1,
+                 "generation_s": rng.lognormvariate(1.5, 0.4), "ttft_s": rng.lognormvariate(-1.5, 0.3),
+                 "history_tokens": rng.randrange(2000)}
+            if rng.random() < 0.02:
+                e["groundedness_proxy"] = None
+        elif r < 0.9:
+            e = {"type": "section_control", "sections": 4, "forced_headings": rng.randrange(2),
+                 "stop": "final_section_done", "new_tokens": rng.randrange(200, 650), "tokens_saved": rng.randrange(300)}
+        else:
+            e = {"type": "achat", "stages": {"transcribe": rng.random(), "generate": rng.random() * 5},
+                 "audio": True, "image": False}
+        e["ts"] = ts
+        yield e
+
+def write_log(path: Path, mb: int, days: float, seed: int = 0, start: float | None = None) -> int:
+    """Append ~mb megabytes of events; returns how many (corrupt lines are not counted)."""
+    rng = random.Random(seed)
+    est = int(mb * 2**20 / 230)
+    t0 = start if start is not None else time.time() - days * 86400
+    n = 0
+    with path.open("a", encoding="utf-8") as f:
+        batch = []
+        for e in events(rng, est, t0, days * 86400):
+            batch.append(json.dumps(e, ensure_ascii=False) + "\n")
+            n += 1
+            if rng.random() < 1e-5:
+                batch.append('{"type": "chat", "urgent": tr\n')  # torn write
+            if len(batch) >= 10000:
+                f.write("".join(batch))
+                batch = []
+        f.write("".join(batch))
+    return n
+
+def baseline(path: Path) -> dict:
+    """Hourly totals the way the log is analysed today: json.loads on every line."""
+    hours: dict[int, list] = {}
+    with path.open("rb") as f:
+        for line in f:
+            try:
+                e = json.loads(line)
+            except ValueError:
+                continue
+            kind = e.get("type")
+            if kind not in ("chat", "refusal"):
+                continue
+            h = hours.setdefault(math.floor(e["ts"] / 3600), [0, 0, 0, 0, 0, 0.0])
+            h[0] += 1
+            if kind == "chat":
+                h[1] += 1
+                h[3] += bool(e.get("urgent"))
+                h[4] += bool(e.get("sections_ok"))
+                h[5] += float(e.get("groundedness_proxy") or 0.0)
+            else:
+                h[2] += 1
+    return hours
+
+def same_rates(rows: list[dict], hours: dict) -> bool:
+    if len(rows) != len(hours):
+        return False
+    for r in rows:
+        requests, chats, refusals, urgent, sections_ok, grounded = hours[r["start"] // 3600]
+        rate = lambda n, d: n / d if d else 0.0
+        if (r["requests"] != requests or not math.isclose(r["refusal_rate"], rate(refusals, requests))
+                or not math.isclose(r["urgent_rate"], rate(urgent, chats))
+                or not math.isclose(r["sections_ok_rate"], rate(sections_ok, chats))
+                or not math.isclose(r["groundedness_mean"], rate(grounded, chats), abs_tol=1e-9)):
+            return False
+    return True
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - t0, out
+
+def check_rotation(tmp: Path, rounds: int = 6, per_round: int = 4000) -> bool:
+    """Events logged through a rotating MetricsLogger, updates in between (one interrupted), then compaction."""
+    log_path = tmp / "rot" / "metrics_log.jsonl"
+    log_path.parent.mkdir()
+    logger = MetricsLogger(log_path, max_bytes=256 * 2**10, backups=100)
+    archive = ma.MetricsArchive(tmp / "rot_archive", log_path)
+    rng = random.Random(3)
+    logged = 0
+    t0 = time.time() - 2 * 86400
+    for k in range(rounds):
+        for e in events(rng, per_round, t0 + k * 3600 * 4, 3600 * 4):
+            logger.log(e)
+            logged += 1
+        logger.flush()
+        if k == 2:
+            # Interrupted update: stop after the first chunk, then let the next update redo the rest
+            def interrupt(report):
+                raise KeyboardInterrupt
+
+            chunk, ma.CHUNK_BYTES = ma.CHUNK_BYTES, 64 * 2**10
+            try:
+                archive.update(on_progress=interrupt)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                ma.CHUNK_BYTES = chunk
+        else:
+            archive.update()
+    rotated = len(list(log_path.parent.glob("metrics_log.*.jsonl")))
+    ok = archive.rows == logged
+    # Raw drill-down through the byte-offset index, for a range spanning rotated files
+    cols = archive.read()
+    start, end = float(cols["ts"][logged // 3]), float(cols["ts"][logged // 2])
+    raw = list(archive.raw_events(start, end))
+    ok &= len(raw) == int(((cols["ts"] >= start) & (cols["ts"] < end)).sum())
+    before = archive.window_rates("hour")
+    removed = archive.compact(keep_raw_s=0)
+    ok &= archive.rows == logged and archive.window_rates("hour") == before and len(removed) == rotated
+    print(f"rotation: {logged} events through {rotated} rotated files, {rounds} updates (one interrupted): "
+          f"archived {archive.rows}; compaction removed {len(removed)} files, rates unchanged; "
+          f"raw drill-down {len(raw)} events -> {ok}")
+    return ok
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mb", type=int, default=1024)
+    ap.add_argument("--days", type=float, default=60)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        log = tmp / "metrics_log.jsonl"
+        t0 = time.perf_counter()
+        n = write_log(log, args.mb, args.days)
+        size_mb = log.stat().st_size / 2**20
+        print(f"wrote {n:,} events ({size_mb:,.0f} MB) in {time.perf_counter() - t0:.0f}s")
+
+        (base_s, hours), base_rss = peak_rss_during(lambda: timed(lambda: baseline(log)))
+        archive = ma.MetricsArchive(tmp / "archive", log)
+        report, rss = peak_rss_during(archive.update)
+        hourly_s, hourly = timed(lambda: archive.window_rates("hour"))
+        daily_s, daily = timed(lambda: archive.window_rates("day"))
+        col_mb = sum(p.stat().st_size for p in (tmp / "archive").glob("*.bin")) / 2**20
+        print(f"\nbaseline (json.loads per line): {base_s:6.1f}s  {size_mb / base_s:6.0f} MB/s  peak RSS +{base_rss:.0f} MB")
+        print(f"archive update:                 {report.elapsed_s:6.1f}s  {report.mb_per_s:6.0f} MB/s  peak RSS +{rss:.0f} MB"
+              f"  x{base_s / report.elapsed_s:.1f}")
+        print(f"  {report.events:,} events, {report.bad_lines} bad lines; columns {col_mb:.0f} MB "
+              f"({col_mb / size_mb:.1%} of the log)")
+        print(f"rates from columns: {len(hourly)} hours in {hourly_s * 1000:.0f} ms, {len(daily)} days in {daily_s * 1000:.0f} ms")
+
+        # Incremental: 1% more events, continuing the timeline
+        added = write_log(log, max(1, args.mb // 100), args.days / 100, seed=1, start=time.time())
+        inc = archive.update()
+        print(f"incremental update: {inc.events:,} new events ({inc.bytes_read / 2**20:.1f} MB) in {inc.elapsed_s * 1000:.0f} ms")
+
+        day_start = time.time() - 3 * 86400
+        day_s, day = timed(lambda: archive.window_rates("hour", start=day_start, end=day_start + 86400))
+        print(f"one day of hourly rates via the index: {len(day)} hours in {day_s * 1000:.1f} ms "
+              f"(all {len(hourly)} hours: {hourly_s * 1000:.0f} ms)")
+
+        hours_after = baseline(log)
+        ok = (same_rates(hourly, hours) and same_rates(archive.window_rates("hour"), hours_after)
+              and report.events + inc.events == n + added and report.bad_lines > 0)
+        day_hours = {h: v for h, v in hours_after.items() if day_start <= h * 3600 and (h + 1) * 3600 <= day_start + 86400}
+        ok &= same_rates(day[1:-1], day_hours)
+        print(f"rates identical to json.loads: {ok}")
+
+        ok &= check_rotation(tmp)
+        ok &= rss < 64
+        print(f"\nall checks passed (incl. peak RSS under 64 MB): {ok}")
+        if not ok:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
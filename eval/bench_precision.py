@@ -0,0 +1,116 @@
+# eval/bench_precision.py
+"""Memory / latency / accuracy report for each MedGemmaClient precision mode on CPU.
+
+Accuracy is measured against the fp32 baseline on a fixed prompt set: top-1 agreement and
+KL divergence of the teacher-forced next-token distributions, plus the share of greedy
+generations that match the baseline exactly.
+
+  PYTHONPATH=. python eval/bench_precision.py                       # tiny random Gemma3 model
+  PYTHONPATH=. python eval/bench_precision.py --model-id google/medgemma-1.5-4b-it --new-tokens 16
+"""
+import argparse
+import random
+import time
+import warnings
+
+import torch
+
+from app.core.prompts import build_user_prompt
+from app.models.medgemma import MedGemmaClient
+from app.models.precision import model_memory_bytes
+from eval.tiny_model import build_tiny_model, build_tiny_tokenizer, random_prompt
+
+QUESTIONS = [
+    "What does a fasting glucose of 130 mg/dL mean?",
+    "My report says mild cardiomegaly. What should I ask my doctor?",
+    "Explain what an elevated ALT on a liver panel can indicate.",
+    "What is the difference between systolic and diastolic blood pressure?",
+    "The radiologist noted a small pleural effusion. What is that?",
+    "What does HbA1c measure?",
+    "My TSH is slightly high. What follow-up questions are reasonable?",
+    "What does 'no acute cardiopulmonary process' mean on a chest X-ray?",
+]
+
+def build_client(precision: str, model_id: str | None, hidden_size: int, num_layers: int) -> MedGemmaClient:
+    if model_id:
+        return MedGemmaClient(model_id, device="cpu", precision=precision)
+    tok = build_tiny_tokenizer()
+    model = build_tiny_model(len(tok), hidden_size=hidden_size, num_layers=num_layers)
+    return MedGemmaClient.from_components(model, tok, device="cpu", model_id="tiny-random-gemma3", precision=precision)
+
+def prompt_set(model_id: str | None, n: int) -> list[str]:
+    if model_id:
+        return [build_user_prompt(q, None) for q in QUESTIONS[:n]]
+    rng = random.Random(0)
+    return [random_prompt(rng, 16, 48) for _ in range(n)]
+
+@torch.inference_mode()
+def next_token_logprobs(client: MedGemmaClient, prompts: list[str]) -> list[torch.Tensor]:
+    out = []
+    for p in prompts:
+        inputs = client._prepare_inputs([client._format_prompt(p, False)], None)
+        logits = client.model(**inputs).logits[0].float()
+        out.append(torch.log_softmax(logits, dim=-1))
+    return out
+
+def measure(client: MedGemmaClient, prompts: list[str], new_tokens: int) -> dict:
+    client.prefix_cache.prefix_text = None  # compare raw model cost, not cache effects
+    client.generate(prompts[0], max_new_tokens=2, temperature=0.0)  # warm-up
+
+    t0 = time.perf_counter()
+    logprobs = next_token_logprobs(client, prompts)
+    prefill_s = (time.perf_counter() - t0) / len(prompts)
+
+    t0 = time.perf_counter()
+    answers = [client.generate(p, max_new_tokens=new_tokens, temperature=0.0) for p in prompts]
+    gen_s = time.perf_counter() - t0
+    return {
+        "memory_mib": model_memory_bytes(client.model) / 2**20,
+        "prefill_ms": prefill_s * 1000,
+        "tokens_per_s": len(prompts) * new_tokens / gen_s,
+        "logprobs": logprobs,
+        "answers": answers,
+    }
+
+def agreement(base: dict, other: dict) -> dict:
+    top1, kl, n = 0, 0.0, 0
+    for b, o in zip(base["logprobs"], other["logprobs"]):
+        top1 += (b.argmax(-1) == o.argmax(-1)).sum().item()
+        kl += torch.nn.functional.kl_div(o, b, log_target=True, reduction="sum").item()
+        n += b.shape[0]
+    exact = sum(a == b for a, b in zip(base["answers"], other["answers"])) / len(base["answers"])
+    return {"top1": top1 / n, "kl": kl / n, "exact": exact}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--model-id", default=None, help="real checkpoint instead of the tiny random model")
+    ap.add_argument("--modes", default="fp32,bf16,int8,int4")
+    ap.add_argument("--prompts", type=int, default=8)
+    ap.add_argument("--new-tokens", type=int, default=32)
+    ap.add_argument("--hidden-size", type=int, default=512)
+    ap.add_argument("--layers", type=int, default=4)
+    args = ap.parse_args()
+    warnings.filterwarnings("ignore")
+    torch.manual_seed(0)
+
+    prompts = prompt_set(args.model_id, args.prompts)
+    modes = [m.strip() for m in args.modes.split(",")]
+    if "fp32" not in modes:
+        modes.insert(0, "fp32")
+
+    results = {}
+    for mode in modes:
+        try:
+            results[mode] = measure(build_client(mode, args.model_id, args.hidden_size, args.layers), prompts, args.new_tokens)
+        except ValueError as e:
+            print(f"{mode}: skipped ({e})")
+
+    base = results["fp32"]
+    print(f"{'mode':6s} {'memory MiB':>11s} {'prefill ms':>11s} {'tok/s':>8s} {'top-1 agree':>12s} {'KL':>9s} {'exact gen':>10s}")
+    for mode, r in results.items():
+        a = agreement(base, r)
+        print(f"{mode:6s} {r['memory_mib']:11.1f} {r['prefill_ms']:11.2f} {r['tokens_per_s']:8.1f} "
+              f"{a['top1']:12.1%} {a['kl']:9.5f} {a['exact']:10.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# eval/bench_search.py
+"""History search: the FTS5 index (search_messages) vs a LIKE scan, on a synthetic million-message DB.
+
+Builds a schema-version-2 DB (before the search migration) with --messages messages spread
+over --users users, plus one heavy user with --heavy-messages, then runs init_db to apply the
+migration (backfilling the index) and times it. Each query is timed for a typical and the
+heavy user as:
+  * like: the scan the history page would need without the index, scoped to the user
+    (username index, then `content LIKE '%word%' OR title LIKE ...` per word);
+  * fts: first page (20 rows) of search_messages, ranked with snippets.
+Checks that planted marker words are found exactly, that FTS and LIKE agree on single-word
+queries, and reports the write cost the index triggers add to message inserts.
+
+  PYTHONPATH=. python eval/bench_search.py --messages 1000000
+"""
+import argparse
+import random
+import re
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import app.db.store as store
+
+TERMS = [
+    "headache", "fever", "cough", "insulin", "glucose", "cholesterol", "opacity", "fracture", "rash", "nausea",
+    "dizziness", "wheezing", "palpitations", "metformin", "ibuprofen", "hemoglobin", "creatinine", "thyroid",
+    "biopsy", "ultrasound", "lesion", "nodule", "migraine", "asthma", "allergy", "insomnia", "swelling",
+]
+FILLER = [f"w{i}" for i in range(2000)]
+TITLES = ["Chest X-ray", "Blood tests", "Lab report", "Skin photo", "Follow-up", "Medication question"]
+QUERIES = ["fracture", "glucose insulin", "palpit*", '"thyroid nodule"', "opacity lesion biopsy"]
+INSERT_SQL = "INSERT INTO messages (session_id, role, content, image_path, created_at) VALUES (?, ?, ?, ?, ?)"
+
+def message(rng) -> str:
+    words = rng.choices(FILLER, k=rng.randint(8, 40))
+    for _ in range(rng.choice((0, 1, 1, 2, 3))):
+        words.insert(rng.randrange(len(words) + 1), rng.choice(TERMS))
+    return " ".join(words)
+
+def build(messages: int, users: int, heavy_messages: int, seed: int = 0) -> dict:
+    """Old-schema DB with the given volume; returns the planted marker message ids per user."""
+    rng = random.Random(seed)
+    store.MIGRATIONS, migrations = store.MIGRATIONS[:2], store.MIGRATIONS
+    try:
+        store.init_db()
+    finally:
+        store.MIGRATIONS = migrations
+    per_session = 50
+    plan = [(f"user{u:04d}", messages // users) for u in range(users)] + [("heavy", heavy_messages)]
+    markers: dict[str, set[int]] = {}
+    with store._write() as conn:
+        next_id = 1
+        for username, n in plan:
+            conn.execute("INSERT INTO users (username, password) VALUES (?, 'pw')", (username,))
+            rows = []
+            for k in range(0, n, per_session):
+                sid = f"{username}_{k}"
+                conn.execute("INSERT INTO chat_sessions VALUES (?, ?, ?, ?)", (sid, username, rng.choice(TITLES), k))
+                for j in range(min(per_session, n - k)):
+                    text = message(rng)
+                    if rng.random() < 0.001:
+                        text += f" zzmarker{username}"
+                        markers.setdefault(username, set()).add(next_id)
+                    rows.append((sid, "user" if j % 2 == 0 else "assistant", text, None, k * 1000 + j))
+                    next_id += 1
+            conn.executemany(INSERT_SQL, rows)
+    return markers
+
+def like_search(username: str, query: str) -> list[int]:
+    words = [w.strip('"*') for w in query.split()]
+    where = " AND ".join("(m.content LIKE ? OR s.title LIKE ?)" for _ in words)
+    params = [username] + [p for w in words for p in (f"%{w}%", f"%{w}%")]
+    with store._read() as conn:
+        return [r[0] for r in conn.execute(
+            f"SELECT m.id FROM chat_sessions s JOIN messages m ON m.session_id = s.session_id "
+            f"WHERE s.username = ? AND {where}", params
+        )]
+
+def all_pages(username: str, query: str) -> list[int]:
+    ids, cursor = [], None
+    while True:
+        rows, cursor = store.search_messages(username, query, limit=200, cursor=cursor)
+        ids += [r[0] for r in rows]
+        if cursor is None:
+            return ids
+
+def timed(fn, repeat: int) -> tuple[float, object]:
+    times, out = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), out
+
+def insert_rate(rows: int) -> float:
+    rng = random.Random(1)
+    sid = "user0000_0"
+    batch = [(sid, "user", message(rng), None, 10**9 + i) for i in range(rows)]
+    t0 = time.perf_counter()
+    with store._write() as conn:
+        for i in range(0, rows, 256):  # write-behind batch size
+            conn.executemany(INSERT_SQL, batch[i:i + 256])
+    return rows / (time.perf_counter() - t0)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--messages", type=int, default=1_000_000)
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--heavy-messages", type=int, default=50_000)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store.DB_PATH = Path(tmp) / "search.db"
+        t0 = time.perf_counter()
+        markers = build(args.messages, args.users, args.heavy_messages)
+        total = args.messages // args.users * args.users + args.heavy_messages
+        print(f"built {total:,} messages for {args.users + 1} users in {time.perf_counter() - t0:.1f}s")
+        before = insert_rate(20_000)
+
+        t0 = time.perf_counter()
+        store.init_db()
+        migrate_s = time.perf_counter() - t0
+        print(f"search migration (index backfill): {migrate_s:.1f}s; DB {store.DB_PATH.stat().st_size / 1e6:.0f} MB")
+
+        typical = "user0001"
+        print(f"\n{'query':24s} {'user':8s} {'like ms':>9s} {'fts p1 ms':>10s} {'speedup':>8s} {'hits':>6s}")
+        speedups = {typical: [], "heavy": []}
+        for query in QUERIES:
+            for username in (typical, "heavy"):
+                like_s, like_ids = timed(lambda: like_search(username, query), args.repeat)
+                fts_s, (rows, _) = timed(lambda: store.search_messages(username, query), args.repeat)
+                speedups[username].append(like_s / fts_s)
+                print(f"{query:24s} {username:8s} {like_s * 1000:9.2f} {fts_s * 1000:10.2f} "
+                      f"x{like_s / fts_s:7.1f} {len(like_ids):6d}")
+
+        ok = True
+        for username in (typical, "heavy"):
+            want = markers.get(username, set())
+            got = set(all_pages(username, f"zzmarker{username}"))
+            ok &= got == want and set(like_search(username, f"zzmarker{username}")) == want
+            # Vocabulary words have no shared stems, so stemmed FTS hits equal exact word matches
+            for term in ("fracture", "glucose"):
+                fts_ids = set(all_pages(username, f'"{term}"'))
+                with store._read() as conn:
+                    exact = {
+                        mid for mid, content, title in conn.execute(
+                            "SELECT m.id, m.content, s.title FROM chat_sessions s JOIN messages m ON m.session_id = s.session_id "
+                            "WHERE s.username = ?", (username,))
+                        if re.search(rf"\b{term}\b", content, re.IGNORECASE) or re.search(rf"\b{term}\b", title, re.IGNORECASE)
+                    }
+                ok &= fts_ids == exact
+        other = store.search_messages("user0002", "zzmarkerheavy")[0]
+        ok &= not other
+
+        after = insert_rate(20_000)
+        print(f"\nmessage inserts (executemany, 256 per batch): {before:,.0f} rows/s without the index, "
+              f"{after:,.0f} rows/s with the triggers")
+        print("\nmedian LIKE/FTS time: " + ", ".join(
+            f"{u} ({n:,} messages) x{statistics.median(v):.1f}"
+            for (u, v), n in zip(speedups.items(), (args.messages // args.users, args.heavy_messages))))
+        print(f"results match exact word search and stay within the user: {ok}")
+        if not ok:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
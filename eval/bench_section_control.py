@@ -0,0 +1,157 @@
+# eval/bench_section_control.py
+"""Decode length and section pass rate with and without the section controller.
+
+"scripted": synthetic four-section answers with the failure modes seen in practice (a
+preamble, one section rambling for hundreds of tokens, a closing paragraph or disclaimer
+after "What this is based on") are decoded token by token, once plain (up to the 650-token
+budget) and once through SectionController exactly as model.generate drives it (logits
+processor, then stopping criteria). Reports mean decode tokens, has_required_sections pass
+rate, stop reasons and the controller's per-token overhead.
+
+"tiny model": MedGemmaClient.generate on a tiny random Gemma3 with sections=False vs True,
+checking that the stopping criteria and forced headings are wired into model.generate.
+
+  PYTHONPATH=. python eval/bench_section_control.py --answers 400
+"""
+import argparse
+import random
+import time
+from collections import Counter
+
+import torch
+
+from app.core.metrics import has_required_sections
+from app.core.prompts import build_user_prompt
+from app.models.medgemma import MedGemmaClient
+from app.models.section_control import SECTION_TITLES, SectionController
+from eval.tiny_model import build_tiny_model, build_tiny_tokenizer
+
+MAX_NEW_TOKENS = 650
+# Words of the headings the scripted answers and the controller write, for the word-level tokenizer
+HEADING_WORDS = sorted({
+    w for i, t in enumerate(SECTION_TITLES)
+    for heading in (f"{i + 1}) **{t}**", f"{i + 1}) **{t.split(' (')[0]}**", f"**{t.split(' (')[0]}**")
+    for w in heading.split()
+} | {"\n", ".", "-"})
+
+def words(rng, n: int, bullets: bool = False) -> list[str]:
+    out = []
+    while len(out) < n:
+        out += [f"w{rng.randrange(256)}" for _ in range(rng.randint(6, 18))] + ["."]
+        out += ["\n", "-"] if bullets else []
+    return out[:n] + ["."]
+
+def scripted_answer(rng) -> tuple[list[str], list[int]]:
+    """Tokens of one answer and, per token, which section (0 = preamble, 5 = after the last) it belongs to."""
+    tokens, section = [], []
+    add = lambda toks, k: (tokens.extend(toks), section.extend([k] * len(toks)))
+    if rng.random() < 0.3:
+        add(words(rng, rng.randint(10, 25)) + ["\n", "\n"], 0)
+    ramble = rng.randrange(4) if rng.random() < 0.15 else None
+    for k, title in enumerate(SECTION_TITLES):
+        short = title.split(" (")[0]
+        heading = f"{k + 1}) **{short}**" if rng.random() < 0.5 else f"**{short}**"
+        add(heading.split() + ["\n"], k + 1)
+        body = rng.randint(250, 450) if k == ramble else int(rng.lognormvariate(4.1, 0.45))
+        add(words(rng, body, bullets=k in (1, 2)) + ["\n", "\n"], k + 1)
+    if rng.random() < 0.65:
+        # Closing paragraph(s) the prompt never asked for
+        for _ in range(rng.randint(1, 3)):
+            add(words(rng, rng.randint(30, 120)) + ["\n", "\n"], 5)
+    return tokens, section
+
+def decode_plain(ids: list[int]) -> list[int]:
+    return ids[:MAX_NEW_TOKENS]
+
+def decode_controlled(tok, ids: list[int], section_of: list[int], heading_ids: set[int]) -> tuple[list[int], dict, float]:
+    """Drive the controller as model.generate does: the processor forces, then the criteria see the token."""
+    ctl = SectionController(tok, prompt_len=1, max_new_tokens=MAX_NEW_TOKENS)
+    out = [tok.bos_token_id]
+    pos, overhead = 0, 0.0
+    scores = torch.zeros(1, len(tok))
+    while len(out) - 1 < MAX_NEW_TOKENS and pos < len(ids):
+        ids_t, step_scores = torch.tensor([out]), scores.clone()
+        t0 = time.perf_counter()
+        forced = ctl.logits_processor(ids_t, step_scores)
+        overhead += time.perf_counter() - t0
+        if ctl.rows and ctl.rows[0].forced:
+            out.append(int(forced[0].argmax()))
+        else:
+            out.append(ids[pos])
+            pos += 1
+        ids_t = torch.tensor([out])
+        t0 = time.perf_counter()
+        done = bool(ctl.update(ids_t)[0])
+        overhead += time.perf_counter() - t0
+        row = ctl.rows[0]
+        if not row.forced and pos < len(ids) and row.section > section_of[pos]:
+            # A heading was forced: the "model" carries on with that section's body
+            while pos < len(ids) and (section_of[pos] < row.section or ids[pos] in heading_ids):
+                pos += 1
+        if done:
+            break
+    return out[1:], ctl.report(), overhead
+
+def scripted(tok, answers: int, seed: int):
+    rng = random.Random(seed)
+    vocab = tok.get_vocab()
+    heading_ids = {vocab[w] for w in HEADING_WORDS if w not in ("\n", ".", "-")}
+    rows = []
+    for _ in range(answers):
+        words_, section_of = scripted_answer(rng)
+        ids = [vocab[w] for w in words_]
+        plain = decode_plain(ids)
+        controlled, report, overhead = decode_controlled(tok, ids, section_of, heading_ids)
+        rows.append({
+            "plain": len(plain), "plain_ok": has_required_sections(tok.decode(plain)),
+            "ctl": len(controlled), "ctl_ok": has_required_sections(tok.decode(controlled)),
+            "stop": report["stop"] or ("budget" if len(controlled) >= MAX_NEW_TOKENS else "eos"),
+            "forced": report["forced_headings"], "overhead_s": overhead,
+        })
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--answers", type=int, default=400)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    tok = build_tiny_tokenizer(extra_words=HEADING_WORDS)
+
+    rows = scripted(tok, args.answers, args.seed)
+    mean = lambda key: sum(r[key] for r in rows) / len(rows)
+    plain, ctl = mean("plain"), mean("ctl")
+    print(f"scripted answers: {len(rows)}")
+    print(f"  plain:      {plain:6.1f} decode tokens/answer   sections ok {mean('plain_ok'):.1%}")
+    print(f"  controlled: {ctl:6.1f} decode tokens/answer   sections ok {mean('ctl_ok'):.1%}   "
+          f"-{1 - ctl / plain:.1%} tokens")
+    print(f"  stop reasons: {dict(Counter(r['stop'] for r in rows))}; headings forced in "
+          f"{sum(r['forced'] > 0 for r in rows)} answers")
+    print(f"  controller overhead: {sum(r['overhead_s'] for r in rows) / sum(r['ctl'] for r in rows) * 1e6:.0f} us/token")
+    scripted_ok = mean("ctl_ok") >= mean("plain_ok") and ctl < plain
+
+    # The real generate() path on a tiny random model (greedy), which never writes headings itself
+    model = build_tiny_model(len(tok))
+    client = MedGemmaClient.from_components(model, tok, device="cpu", model_id="tiny-random-gemma3")
+    prompt = build_user_prompt("w1 w2 w3 w4", None)
+    input_len = client._prepare_inputs([client._format_prompt(prompt, False)], None)["input_ids"].shape[1]
+    n_tokens = lambda text: len(tok.encode(text, add_special_tokens=False))
+    t0 = time.perf_counter()
+    off = client.generate(prompt, max_new_tokens=MAX_NEW_TOKENS, temperature=0.0)
+    t_off = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    on = client.generate(prompt, max_new_tokens=MAX_NEW_TOKENS, temperature=0.0, sections=True)
+    t_on = time.perf_counter() - t0
+    streamed = "".join(client.generate_stream(prompt, max_new_tokens=MAX_NEW_TOKENS, temperature=0.0, sections=True))
+    print(f"\ntiny model ({input_len} prompt tokens), greedy:")
+    print(f"  sections=False: {n_tokens(off):4d} tokens {t_off * 1000:7.0f} ms  sections ok {has_required_sections(off)}")
+    print(f"  sections=True:  {n_tokens(on):4d} tokens {t_on * 1000:7.0f} ms  sections ok {has_required_sections(on)}  "
+          f"stream matches: {streamed.strip() == on}")
+    tiny_ok = has_required_sections(on) and n_tokens(on) <= n_tokens(off) and streamed.strip() == on
+
+    print(f"\ncontroller keeps sections and shortens decode: scripted {scripted_ok}, tiny model {tiny_ok}")
+    if not (scripted_ok and tiny_ok):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# eval/bench_startup.py
+"""Cold-start cost of the Streamlit entry point: what the login screen imports, and how long it takes.
+
+Each measurement runs in a fresh interpreter (like a new replica) under `python -X importtime`:
+  * "before": the module-level imports streamlit_app.py had before lazy loading
+    (model clients, orchestrator, model-server client, pandas/plotly, vitals analytics);
+  * "after": the module-level imports streamlit_app.py has now, read from its source;
+  * "pages": after + what the tracking and history pages import, exercised on a temp DB.
+Reports total import time, the slowest packages (by their modules' self time) and whether torch,
+transformers or librosa were loaded. With Streamlit installed it also times the first
+render of the login screen (AppTest, fresh process) and how much of it is Streamlit itself.
+
+  PYTHONPATH=. python eval/bench_startup.py --repeat 3
+"""
+import argparse
+import ast
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+APP = Path(__file__).resolve().parents[1] / "app" / "ui" / "streamlit_app.py"
+HEAVY = ("torch", "transformers", "librosa")
+BEFORE_IMPORTS = [
+    "streamlit", "pandas", "plotly.express", "app.models.medgemma", "app.models.medasr", "app.models.batching",
+    "app.models.startup", "app.core.orchestrator", "app.core.response_cache", "app.server.client",
+    "app.server.protocol", "app.server.scheduler", "app.db.store", "app.core.vitals_analytics",
+    "app.core.vitals_query", "app.db.vitals_import",
+]
+PAGES_CODE = """
+import tempfile, time
+from pathlib import Path
+import app.db.store as store
+store.DB_PATH = Path(tempfile.mkdtemp()) / "startup.db"
+store.init_db()
+store.create_user("u", "pw")
+sid = store.create_session("u", "t")
+store.add_message(sid, "user", "hello")
+from app.core.vitals_analytics import VitalsAnalytics
+from app.core.vitals_query import vitals_chart
+analytics = VitalsAnalytics()
+analytics.add_vital("u", "sugar", 110.0, None, None)
+store.flush_writes()
+vitals_chart("u", "sugar")
+analytics.summary("u", "sugar")
+store.load_user_history("u", limit=20)
+"""
+
+def installed(module: str) -> bool:
+    try:
+        return importlib.util.find_spec(module.split(".")[0]) is not None
+    except (ImportError, ValueError):
+        return False
+
+def app_imports() -> list[str]:
+    """Modules streamlit_app.py imports at module level (function-level imports are lazy)."""
+    mods = []
+    for node in ast.parse(APP.read_text()).body:
+        if isinstance(node, ast.Import):
+            mods += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            mods.append(node.module)
+    return list(dict.fromkeys(mods))
+
+def measure(modules: list[str], extra_code: str = "") -> dict:
+    """Import `modules` in a fresh interpreter; wall time, -X importtime totals and heavy modules loaded."""
+    code = "".join(f"import {m}\n" for m in modules) + extra_code + (
+        f"import sys, json\nprint(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))\n"
+    )
+    env = {**os.environ, "PYTHONPATH": str(APP.parents[2])}
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env)
+    wall = time.perf_counter() - t0
+    if proc.returncode:
+        raise RuntimeError(proc.stderr[-2000:])
+    packages: dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        # Self times add up to the total without double counting nested imports
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    return {"wall_s": wall, "import_s": sum(packages.values()) / 1e6, "packages": packages,
+            "heavy": json.loads(proc.stdout.strip().splitlines()[-1])}
+
+def best(fn, repeat: int) -> dict:
+    return min((fn() for _ in range(repeat)), key=lambda r: r["wall_s"])
+
+def first_render(repeat: int) -> tuple[float, float] | None:
+    """(first login render incl. interpreter start, `import streamlit` alone), fresh process each time."""
+    if not installed("streamlit"):
+        return None
+    code = ("import time; t0 = time.perf_counter()\n"
+            "from streamlit.testing.v1 import AppTest\n"
+            f"at = AppTest.from_file({str(APP)!r}, default_timeout=120).run()\n"
+            "assert not at.exception, at.exception\n")
+    env = {**os.environ, "PYTHONPATH": str(APP.parents[2]), "MEDGEMMA_WARMUP": "none"}
+    runs, bare = [], []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, env=env)
+        runs.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import streamlit"], check=True, env=env)
+        bare.append(time.perf_counter() - t0)
+    return min(runs), min(bare)
+
+def show(label: str, r: dict):
+    top = sorted(r["packages"].items(), key=lambda kv: -kv[1])[:6]
+    print(f"{label:8s} wall {r['wall_s'] * 1000:7.0f} ms  imports {r['import_s'] * 1000:7.0f} ms  "
+          f"ML stack loaded: {', '.join(r['heavy']) or 'none'}")
+    print(f"{'':8s} slowest: " + ", ".join(f"{name} {us / 1000:.0f} ms" for name, us in top))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    missing = sorted({m.split(".")[0] for m in BEFORE_IMPORTS + app_imports() if not installed(m)})
+    if missing:
+        print(f"not installed here, left out of both sides: {', '.join(missing)}")
+    usable = lambda mods: [m for m in mods if installed(m)]
+
+    before = best(lambda: measure(usable(BEFORE_IMPORTS)), args.repeat)
+    after = best(lambda: measure(usable(app_imports())), args.repeat)
+    pages = best(lambda: measure(usable(app_imports()), PAGES_CODE), args.repeat)
+    show("before", before)
+    show("after", after)
+    show("pages", pages)
+    print(f"login-screen imports: {before['import_s'] * 1000:.0f} -> {after['import_s'] * 1000:.0f} ms "
+          f"(x{before['import_s'] / max(after['import_s'], 1e-6):.0f} less)")
+
+    render = first_render(args.repeat)
+    if render is None:
+        print("streamlit not installed: first-render timing skipped")
+    else:
+        total, bare = render
+        print(f"first login render (fresh process): {total * 1000:.0f} ms, of which `import streamlit` "
+              f"{bare * 1000:.0f} ms ({bare / total:.0%})")
+
+    ok = not after["heavy"] and not pages["heavy"]
+    print(f"login, tracking and history pages run without torch/transformers/librosa: {ok}")
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# eval/bench_store.py
+"""N threads doing mixed reads/writes against the store: connect-per-call baseline vs pooled engine.
+
+Also checks that a queued write that fails is reported through its own Future and never
+raised in a later, unrelated read, and that its done-callbacks can take a lock a concurrent
+reader holds, or read the store, without deadlocking the writer.
+
+Usage: PYTHONPATH=. python eval/bench_store.py --threads 8 --ops 500
+"""
+import argparse
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import app.db.store as store
+
+# --- Baseline: the original connect/commit-per-call implementation ---
+def legacy_add_message(session_id, role, content, image_path=None):
+    with sqlite3.connect(store.DB_PATH) as conn:
+        conn.execute(
+            "INSERT INTO messages (session_id, role, content, image_path, created_at) VALUES (?, ?, ?, ?, ?)",
+            (session_id, role, content, image_path, int(time.time()))
+        )
+        conn.commit()
+
+def legacy_get_session_messages(session_id):
+    with sqlite3.connect(store.DB_PATH) as conn:
+        cur = conn.execute("SELECT role, content, image_path FROM messages WHERE session_id=? ORDER BY created_at ASC", (session_id,))
+        return cur.fetchall()
+
+def legacy_add_vital(username, vitals_type, v1, v2=None, notes=None):
+    with sqlite3.connect(store.DB_PATH) as conn:
+        conn.execute(
+            "INSERT INTO health_vitals (username, vitals_type, value_main, value_secondary, notes, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (username, vitals_type, v1, v2, notes, int(time.time()))
+        )
+        conn.commit()
+
+def legacy_get_vitals_history(username, vitals_type):
+    with sqlite3.connect(store.DB_PATH) as conn:
+        cur = conn.execute(
+            "SELECT value_main, value_secondary, notes, created_at FROM health_vitals WHERE username=? AND vitals_type=? ORDER BY created_at ASC",
+            (username, vitals_type)
+        )
+        return cur.fetchall()
+
+LEGACY = (legacy_add_message, legacy_get_session_messages, legacy_add_vital, legacy_get_vitals_history)
+POOLED = (store.add_message, store.get_session_messages, store.add_vital, store.get_vitals_history)
+
+def run(label, api, threads, ops, write_ratio, db_path, legacy=False):
+    add_message, get_session_messages, add_vital, get_vitals_history = api
+    store.DB_PATH = db_path
+    store.init_db()
+    for u in range(threads):
+        store.create_user(f"user{u}", "pw")
+        with store._write() as conn:
+            conn.execute("INSERT INTO chat_sessions VALUES (?, ?, ?, ?)", (f"s{u}", f"user{u}", "t", 0))
+    if legacy:
+        # Undo the engine's WAL switch so the baseline runs with the original rollback journal
+        store._get_engine()[0].close()
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+
+    def worker(u):
+        rng = random.Random(u)
+        for _ in range(ops):
+            r = rng.random()
+            if r < write_ratio / 2:
+                add_message(f"s{u}", "user", "hello " * 20)
+            elif r < write_ratio:
+                add_vital(f"user{u}", "sugar", rng.uniform(70, 200))
+            elif r < (1 + write_ratio) / 2:
+                get_session_messages(f"s{u}")
+            else:
+                get_vitals_history(f"user{u}", "sugar")
+
+    t0 = time.perf_counter()
+    ts = [threading.Thread(target=worker, args=(u,)) for u in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    store.flush_writes()
+    elapsed = time.perf_counter() - t0
+    total = threads * ops
+    print(f"{label:8s}: {total} ops in {elapsed:6.2f}s -> {total / elapsed:9.0f} ops/sec")
+    return total / elapsed
+
+def check_write_errors(db_path: Path) -> bool:
+    store.DB_PATH = db_path
+    store.init_db()
+    good = store.add_message("s1", "user", "hello")
+    bad = store.add_message("s1", "user", None)  # content is NOT NULL
+    other = store.add_vital("user1", "sugar", 110.0)
+    rows = store.get_session_messages("s1")  # another request's read: must not raise bad's error
+    store.flush_writes()
+    ok = (len(rows) == 1 and good.result() is None and other.result() is None
+          and isinstance(bad.exception(), sqlite3.IntegrityError))
+    print(f"failed queued write reported to its own Future, other reads/writes unaffected: {ok}")
+    return ok
+
+def check_callback_reads(db_path: Path) -> bool:
+    """A failed write's callback needs a lock that a reader holds while the read flushes the queue,
+    and another callback reads the store itself; neither may hang."""
+    store.DB_PATH = db_path
+    store.init_db()
+    lock = threading.Lock()
+    callback_read = threading.Event()
+
+    def scenario():
+        with lock:
+            bad = store.add_message("s2", "user", None)
+            bad.add_done_callback(lambda f: lock.acquire() and lock.release())
+            bad.add_done_callback(lambda f: store.get_session_messages("s2") is not None and callback_read.set())
+            store.get_session_messages("s2")  # flushes while holding the lock
+        bad.exception()
+
+    t = threading.Thread(target=scenario, daemon=True)
+    t.start()
+    t.join(5)
+    ok = not t.is_alive() and callback_read.wait(5)
+    print(f"failed write callbacks that lock or read do not deadlock a concurrent reader: {ok}")
+    return ok
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--ops", type=int, default=500)
+    ap.add_argument("--write-ratio", type=float, default=0.5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = run("before", LEGACY, args.threads, args.ops, args.write_ratio, Path(tmp) / "legacy.db", legacy=True)
+        after = run("after", POOLED, args.threads, args.ops, args.write_ratio, Path(tmp) / "pooled.db")
+        ok = check_write_errors(Path(tmp) / "errors.db")
+        ok &= check_callback_reads(Path(tmp) / "callbacks.db")
+    print(f"speed-up x{after / before:.2f}")
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# eval/bench_tracing.py
+"""Tracing overhead (disabled vs enabled) on the full chat pipeline with the tiny model, plus a span summary.
+
+Also checks that chat, chat_stream and achat each export exactly one trace per request, with
+the guardrails, prompt and generation spans (including those run on achat's pool threads)
+nested under its "chat" root.
+
+Usage: PYTHONPATH=. python eval/bench_tracing.py --requests 10
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import app.core.metrics as metrics
+from app.core import tracing
+from app.core.orchestrator import Orchestrator
+from app.utils.io import read_jsonl
+from eval.tiny_model import build_tiny_client, random_prompt
+
+def run(orch, questions) -> float:
+    t0 = time.perf_counter()
+    for q in questions:
+        orch.chat(user_id="bench", user_question=q, pasted_text=None, image=None)
+    return (time.perf_counter() - t0) / len(questions) * 1000
+
+def check_roots(orch, questions, path: Path) -> bool:
+    tracing.enable(path=path)
+    for q in questions:
+        orch.chat(user_id="bench", user_question=q, pasted_text=None, image=None)
+        "".join(orch.chat_stream(user_id="bench", user_question=q, pasted_text=None, image=None))
+        asyncio.run(orch.achat("bench", q))
+    tracing.flush()
+    records = list(read_jsonl(path))
+    ok = len(records) == 3 * len(questions)
+    for r in records:
+        names = {s["name"] for s in r["spans"]}
+        ok &= r["name"] == "chat" and {"guardrails", "build_prompt", "post_check"} <= names
+        ok &= any(n.startswith("generate") for n in names)
+    print(f"one trace per request for chat/chat_stream/achat ({len(records)} traces): {ok}")
+    return ok
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=10)
+    args = ap.parse_args()
+
+    rng = random.Random(0)
+    questions = [random_prompt(rng) for _ in range(args.requests)]
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics.LOG_PATH = Path(tmp) / "metrics.jsonl"
+        orch = Orchestrator(build_tiny_client())
+        run(orch, questions[:3])  # warm-up
+
+        tracing.disable()
+        off = run(orch, questions)
+        tracing.enable(path=Path(tmp) / "traces.jsonl")
+        on = run(orch, questions)
+        tracing.flush()
+        summary = tracing.format_summary(tracing.summarize_file(Path(tmp) / "traces.jsonl"))
+
+        tracing.enable(path=Path(tmp) / "micro.jsonl")
+        t0 = time.perf_counter()
+        for _ in range(100_000):
+            with tracing.span("x"):
+                pass
+        tracing.disable()
+        t1 = time.perf_counter()
+        for _ in range(100_000):
+            with tracing.span("x"):
+                pass
+        noop_us = (time.perf_counter() - t1) / 100_000 * 1e6
+        live_us = (t1 - t0) / 100_000 * 1e6
+
+        print(f"chat latency: tracing off {off:7.2f} ms   tracing on {on:7.2f} ms")
+        print(f"per-span cost: disabled {noop_us:.3f} us   enabled {live_us:.3f} us")
+        print(summary)
+        tracing.flush()
+
+        ok = check_roots(orch, questions[:3], Path(tmp) / "roots.jsonl")
+        orch.close()
+        tracing.disable()
+        if not ok:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
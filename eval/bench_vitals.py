@@ -0,0 +1,195 @@
+# eval/bench_vitals.py
+"""Vitals page cost for users with 100k+ readings: original analyzer vs VitalsAnalytics.
+
+"before" is one render of the original page: both full histories fetched, DataFrames built,
+and analyze_vitals sorting each history. "after" loads each series once, then serves
+summaries over several windows, 7-day rolling means and advice from memory, with add_vital
+updating the series in place. Window stats are checked against a direct pandas/NumPy
+recomputation, and the incrementally updated state against a fresh load from the database.
+A reading whose insert fails while another series is loading must not hang either thread and
+must not stay in the series.
+
+Usage: PYTHONPATH=. python eval/bench_vitals.py --readings 120000
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import app.db.store as store
+from app.core.vitals_analytics import DAY_S, THRESHOLDS, VitalsAnalytics, WEEK_S
+
+# --- Baseline: the original analyzer (sort the full history, average the last 5 in Python) ---
+def legacy_analyze_vitals(history, vitals_type):
+    if not history:
+        return "No data available yet to provide suggestions."
+    history = sorted(history, key=lambda x: x[3])
+    recent_entries = history[-5:]
+    if vitals_type == "blood_pressure":
+        systolic_avg = sum(e[0] for e in recent_entries) / len(recent_entries)
+        diastolic_avg = sum(e[1] for e in recent_entries) / len(recent_entries)
+        return f"{int(systolic_avg)}/{int(diastolic_avg)}"
+    return f"{int(sum(e[0] for e in recent_entries) / len(recent_entries))}"
+
+def legacy_render(user):
+    data_bp = store.get_vitals_history(user, "blood_pressure")
+    data_sugar = store.get_vitals_history(user, "sugar")
+    df_bp = pd.DataFrame(data_bp, columns=["Systolic", "Diastolic", "Notes", "Timestamp"])
+    df_bp["Date"] = pd.to_datetime(df_bp["Timestamp"], unit="s")
+    df_s = pd.DataFrame(data_sugar, columns=["Glucose", "Extra", "Notes", "Timestamp"])
+    df_s["Date"] = pd.to_datetime(df_s["Timestamp"], unit="s")
+    return legacy_analyze_vitals(data_bp, "blood_pressure"), legacy_analyze_vitals(data_sugar, "sugar")
+
+def new_render(analytics, user):
+    out = []
+    for vtype in ("blood_pressure", "sugar"):
+        df = analytics.frame(user, vtype, rolling_s=7 * DAY_S)
+        df["Date"] = pd.to_datetime(df["created_at"], unit="s")
+        out.append((analytics.summary(user, vtype, window_s=30 * DAY_S), analytics.advice(user, vtype)))
+    return out
+
+def seed(user: str, n: int, rng: np.random.Generator, now: int):
+    # Readings every ~15 minutes going back from `now`, with a slow drift and a daily cycle
+    ts = np.sort(now - rng.integers(0, n * 900, n))
+    days = (ts - ts[0]) / DAY_S
+    daily = np.sin((ts % DAY_S) / DAY_S * 2 * np.pi)
+    sys = 125 + 0.01 * days + 8 * daily + rng.normal(0, 12, n)
+    dia = 80 + 0.005 * days + 5 * daily + rng.normal(0, 8, n)
+    glu = 120 + 25 * daily + rng.normal(0, 35, n)
+    with store._write() as conn:
+        conn.executemany(
+            "INSERT INTO health_vitals (username, vitals_type, value_main, value_secondary, notes, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(user, "blood_pressure", float(a), float(b), None, int(t)) for a, b, t in zip(sys, dia, ts)]
+            + [(user, "sugar", float(g), None, None, int(t)) for g, t in zip(glu, ts)],
+        )
+
+def reference(rows, vitals_type, start, end):
+    """Direct recomputation of one window from the raw rows."""
+    df = pd.DataFrame(rows, columns=["v1", "v2", "notes", "ts"]).sort_values("ts", kind="stable")
+    df = df[(df.ts >= start) & (df.ts <= end)]
+    lim = THRESHOLDS[vitals_type]
+    high = (df.v1 > lim["high"][0]) | ((df.v2 > lim["high"][1]) if lim["high"][1] else False)
+    low = (df.v1 < lim["low"][0]) | ((df.v2 < lim["low"][1]) if lim["low"][1] else False)
+    bad = (high | low).to_numpy()
+    return {
+        "count": len(df),
+        "mean": df.v1.mean(),
+        "std": df.v1.std(ddof=0),
+        "slope": np.polyfit(df.ts / DAY_S, df.v1, 1)[0] * 7,
+        "high": int(high.sum()),
+        "low": int(low.sum()),
+        "bad": bad,
+    }
+
+def check_windows(analytics, user, rng, trials: int = 40) -> int:
+    failures = 0
+    for vtype in ("blood_pressure", "sugar"):
+        rows = store.get_vitals_history(user, vtype)
+        ts = np.array([r[3] for r in rows])
+        for _ in range(trials):
+            a, b = sorted(rng.choice(ts, 2, replace=False))
+            s = analytics.summary(user, vtype, start=int(a), end=int(b))
+            ref = reference(rows, vtype, a, b)
+            ok = (s.count == ref["count"] and np.isclose(s.mean[0], ref["mean"]) and np.isclose(s.std[0], ref["std"])
+                  and np.isclose(s.slope_per_week[0], ref["slope"], rtol=1e-5, atol=1e-6)
+                  and s.high_count == ref["high"] and s.low_count == ref["low"])
+            failures += not ok
+    return failures
+
+def check_failed_write(analytics, user) -> bool:
+    before = analytics.summary(user, "sugar").count
+    settled = threading.Event()
+
+    def scenario():
+        bad = analytics.add_vital(user, "sugar", None)  # value_main is NOT NULL
+        bad.add_done_callback(lambda f: settled.set())  # runs after the analytics callback
+        analytics.invalidate(user, "blood_pressure")
+        analytics.summary(user, "blood_pressure")  # loads from the store under the analytics lock
+        settled.wait()
+
+    t = threading.Thread(target=scenario, daemon=True)
+    t.start()
+    t.join(10)
+    ok = not t.is_alive() and analytics.summary(user, "sugar").count == before
+    print(f"failed add_vital during a concurrent series load: no hang, reading dropped from the series: {ok}")
+    return ok
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--readings", type=int, default=120_000)
+    ap.add_argument("--renders", type=int, default=5)
+    ap.add_argument("--adds", type=int, default=2000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store.DB_PATH = Path(tmp) / "vitals.db"
+        store.init_db()
+        store.create_user("heavy", "pw")
+        rng = np.random.default_rng(0)
+        now = int(time.time()) - DAY_S
+        seed("heavy", args.readings, rng, now)
+        print(f"{args.readings} BP + {args.readings} sugar readings for one user")
+
+        t0 = time.perf_counter()
+        for _ in range(args.renders):
+            legacy_render("heavy")
+        before = (time.perf_counter() - t0) / args.renders
+
+        analytics = VitalsAnalytics()
+        t0 = time.perf_counter()
+        new_render(analytics, "heavy")
+        cold = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for _ in range(args.renders):
+            new_render(analytics, "heavy")
+        warm = (time.perf_counter() - t0) / args.renders
+
+        t0 = time.perf_counter()
+        for w in (DAY_S, WEEK_S, 30 * DAY_S, 365 * DAY_S, None):
+            for _ in range(100):
+                analytics.summary("heavy", "blood_pressure", window_s=w)
+        per_summary = (time.perf_counter() - t0) / 500
+
+        py = random.Random(0)
+        t0 = time.perf_counter()
+        for k in range(args.adds):
+            analytics.add_vital("heavy", "blood_pressure", py.uniform(90, 170), py.uniform(55, 105))
+        per_add = (time.perf_counter() - t0) / args.adds
+        # Back-dated readings (e.g. an import) go through the merge path
+        back = now - rng.integers(0, args.readings * 900, 500)
+        vals = rng.normal(130, 15, 500), rng.normal(82, 10, 500)
+        with store._write() as conn:
+            conn.executemany(
+                "INSERT INTO health_vitals (username, vitals_type, value_main, value_secondary, notes, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [("heavy", "blood_pressure", float(a), float(b), None, int(t)) for a, b, t in zip(*vals, back)],
+            )
+        analytics.record("heavy", "blood_pressure", back, *vals)
+        store.flush_writes()
+
+        print(f"page render before          : {before * 1000:8.1f} ms (every rerun)")
+        print(f"page render after, cold     : {cold * 1000:8.1f} ms (first view per process)")
+        print(f"page render after, warm     : {warm * 1000:8.1f} ms  x{before / warm:.1f}")
+        print(f"summary over any window     : {per_summary * 1e6:8.1f} us")
+        print(f"add_vital incl. aggregates  : {per_add * 1e6:8.1f} us")
+
+        failures = check_windows(analytics, "heavy", rng)
+        fresh = VitalsAnalytics()
+        inc = analytics.summary("heavy", "blood_pressure")
+        full = fresh.summary("heavy", "blood_pressure")
+        same = (inc.count == full.count and np.allclose(inc.mean, full.mean) and np.allclose(inc.std, full.std)
+                and np.allclose(inc.slope_per_week, full.slope_per_week)
+                and (inc.high_count, inc.low_count, inc.crossings) == (full.high_count, full.low_count, full.crossings))
+        print(f"window stats vs pandas/NumPy recomputation: {failures} mismatches")
+        print(f"incremental state vs fresh load after {args.adds} adds + 500 back-dated: {'identical' if same else 'DIFFERENT'}")
+        print(f"30-day summary: {analytics.summary('heavy', 'blood_pressure', window_s=30 * DAY_S).as_dict()}")
+        failed_ok = check_failed_write(analytics, "heavy")
+        if failures or not same or not failed_ok:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
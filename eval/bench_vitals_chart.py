@@ -0,0 +1,118 @@
+# eval/bench_vitals_chart.py
+"""Vitals chart data for CGM-style histories: every row vs downsampled queries on the new index.
+
+"before" is what the chart used to receive: get_vitals_history (all rows, no index on
+health_vitals). "after" runs migration 2 (index on username, vitals_type, created_at) and
+asks vitals_chart for a bounded number of points per range, as SQL bucket aggregates or
+LTTB-picked readings. Reports query time, point count and JSON payload per chart, and checks
+the buckets against a pandas recomputation and that LTTB keeps an isolated spike.
+
+Usage: PYTHONPATH=. python eval/bench_vitals_chart.py --readings 150000 --users 20
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import app.db.store as store
+from app.core.vitals_analytics import DAY_S
+from app.core.vitals_query import vitals_chart
+
+def populate(users: int, readings: int, now: int, rng: np.random.Generator):
+    # One glucose reading every 5 minutes per user, interleaved across users as a CGM sync would be
+    ts = now - np.arange(readings)[::-1] * 300
+    with store._write() as conn:
+        for u in range(users):
+            conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (f"user{u}", "pw"))
+        for chunk in np.array_split(np.arange(readings), 20):
+            rows = []
+            for u in range(users):
+                glu = 120 + 30 * np.sin(ts[chunk] / DAY_S * 2 * np.pi) + rng.normal(0, 20, len(chunk))
+                rows += [(f"user{u}", "sugar", float(g), None, None, int(t)) for g, t in zip(glu, ts[chunk])]
+            conn.executemany(
+                "INSERT INTO health_vitals (username, vitals_type, value_main, value_secondary, notes, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+
+def payload(dates, *series) -> int:
+    return len(json.dumps({"x": [int(d) for d in dates], "y": [[None if v != v else float(v) for v in s] for s in series]}))
+
+def timed(fn, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return out, best
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--readings", type=int, default=150_000, help="readings per user")
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--max-points", type=int, default=500)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store.DB_PATH = Path(tmp) / "vitals.db"
+        store.init_db()
+        with store._write() as conn:
+            # Start from the pre-migration schema
+            conn.execute("DROP INDEX IF EXISTS idx_vitals_user_type_created")
+            conn.execute("PRAGMA user_version=1")
+        rng = np.random.default_rng(0)
+        now = int(time.time())
+        t0 = time.perf_counter()
+        populate(args.users, args.readings, now, rng)
+        print(f"populated {args.users} users x {args.readings} readings in {time.perf_counter() - t0:.1f}s")
+        # An isolated spike LTTB has to keep
+        spike_ts = now - 40 * DAY_S + 123
+        store.add_vital("user0", "sugar", 420.0, created_at=spike_ts)
+        store.flush_writes()
+
+        rows, t_before = timed(lambda: store.get_vitals_history("user0", "sugar"), repeat=1)
+        print(f"\nbefore: all rows, no index      {t_before * 1000:8.1f} ms  {len(rows):7d} points  "
+              f"{payload([r[3] for r in rows], [r[0] for r in rows]) / 1e6:6.2f} MB")
+
+        t0 = time.perf_counter()
+        store.init_db()
+        print(f"migration 2 (index build): {time.perf_counter() - t0:.2f}s")
+        with store._read() as conn:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT value_main FROM health_vitals WHERE username=? AND vitals_type=? "
+                "AND created_at BETWEEN ? AND ?", ("user0", "sugar", 0, now)
+            ).fetchall()
+        print(f"query plan: {plan[0][-1]}")
+        rows, t_all = timed(lambda: store.get_vitals_history("user0", "sugar"), repeat=1)
+        print(f"after: all rows, indexed        {t_all * 1000:8.1f} ms  {len(rows):7d} points\n")
+
+        print(f"{'range':>8s} {'method':>8s} {'ms':>8s} {'points':>7s} {'KB':>8s}")
+        for days in (7, 30, 90, 365, None):
+            start = now - days * DAY_S if days else None
+            for method in ("buckets", "lttb"):
+                df, dt = timed(lambda: vitals_chart("user0", "sugar", start=start, max_points=args.max_points, method=method))
+                cols = ["main_min", "main", "main_max"] if method == "buckets" else ["main"]
+                size = payload(df["created_at"], *(df[c] for c in cols))
+                print(f"{(str(days) + 'd') if days else 'all':>8s} {method:>8s} {dt * 1000:8.1f} {len(df):7d} {size / 1e3:8.1f}")
+
+        # Correctness: SQL buckets vs pandas over the raw rows, and the spike in the LTTB output
+        start = now - 90 * DAY_S
+        got = vitals_chart("user0", "sugar", start=start, max_points=args.max_points, method="buckets")
+        raw = pd.DataFrame(store.get_vitals_range("user0", "sugar", start), columns=["v", "s", "t"])
+        width = int(got["created_at"].diff().dropna().min())
+        ref = raw.groupby(raw.t // width * width)["v"].agg(["count", "min", "mean", "max"]).reset_index()
+        buckets_ok = (len(ref) == len(got) and np.array_equal(ref["t"], got["created_at"])
+                      and np.allclose(ref[["count", "min", "mean", "max"]], got[["count", "main_min", "main", "main_max"]]))
+        lttb = vitals_chart("user0", "sugar", start=start, max_points=args.max_points, method="lttb")
+        spike_kept = spike_ts in set(lttb["created_at"])
+        spike_in_max = got["main_max"].max() == 420.0
+        print(f"\nbuckets match pandas: {buckets_ok}; spike kept by LTTB: {spike_kept}; spike in bucket max: {spike_in_max}")
+        if not (buckets_ok and spike_kept and spike_in_max):
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
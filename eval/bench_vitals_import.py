@@ -0,0 +1,136 @@
+# eval/bench_vitals_import.py
+"""Bulk vitals import: rows/sec and memory on a multi-million-row device export vs add_vital per row.
+
+Writes a synthetic CSV export (BP and glucose readings, part of the glucose in mmol/L, ~1%
+invalid rows and ~1% repeated timestamps) and imports it with import_vitals, tracking peak RSS
+while it runs. The baseline inserts readings one transaction each, as entering them through
+the old add_vital did. Re-importing the same file must insert nothing.
+
+Usage: PYTHONPATH=. python eval/bench_vitals_import.py --rows 2000000
+"""
+import argparse
+import csv
+import random
+import resource
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import app.db.store as store
+from app.db.vitals_import import import_vitals
+
+def write_export(path: Path, rows: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    expected = {"invalid": 0, "duplicates": 0}
+    t = int(time.time()) - rows * 60 - 86400
+    last = {}
+    with path.open("w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["timestamp", "type", "systolic", "diastolic", "glucose", "unit", "notes"])
+        for i in range(rows):
+            t += 60
+            kind = "bp" if i % 2 == 0 else "glucose"
+            ts = t
+            r = rng.random()
+            if r < 0.01 and kind in last:
+                ts = last[kind]  # device re-sent a reading
+                expected["duplicates"] += 1
+            stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts)) + "Z" if i % 3 == 0 else str(ts)
+            if 0.01 <= r < 0.02:
+                expected["invalid"] += 1
+                w.writerow([stamp, kind, "", "", "abc" if kind == "glucose" else "", "", "bad"])
+                continue
+            last[kind] = ts
+            if kind == "bp":
+                sys = rng.randint(100, 170)
+                w.writerow([stamp, "bp", sys, rng.randint(60, sys - 20), "", "", ""])
+            elif rng.random() < 0.3:
+                w.writerow([stamp, "glucose", "", "", round(rng.uniform(4, 12), 1), "mmol/L", ""])
+            else:
+                w.writerow([stamp, "glucose", "", "", rng.randint(70, 220), "mg/dL", "fasting" if rng.random() < 0.1 else ""])
+    return expected
+
+def peak_rss_during(fn):
+    """(result, peak RSS growth in MB) while fn runs, sampled every 20 ms."""
+    peak = [0]
+    done = threading.Event()
+
+    def current_kb():
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    base = current_kb()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], current_kb() - base)
+            time.sleep(0.02)
+
+    t = threading.Thread(target=sample, daemon=True)
+    t.start()
+    try:
+        return fn(), peak[0] / 1024
+    finally:
+        done.set()
+        t.join()
+
+def baseline(db_path: Path, rows: int) -> float:
+    # One connection and commit per reading, as the original add_vital did
+    rng = random.Random(1)
+    t0 = time.perf_counter()
+    for i in range(rows):
+        with sqlite3.connect(db_path) as conn:
+            conn.execute(
+                "INSERT INTO health_vitals (username, vitals_type, value_main, value_secondary, notes, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                ("base", "sugar", rng.uniform(70, 200), None, None, i),
+            )
+            conn.commit()
+    return rows / (time.perf_counter() - t0)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    ap.add_argument("--baseline-rows", type=int, default=3000)
+    ap.add_argument("--chunk-size", type=int, default=5000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export = Path(tmp) / "export.csv"
+        t0 = time.perf_counter()
+        expected = write_export(export, args.rows)
+        print(f"wrote {args.rows} rows ({export.stat().st_size / 1e6:.0f} MB) in {time.perf_counter() - t0:.1f}s")
+
+        store.DB_PATH = Path(tmp) / "vitals.db"
+        store.init_db()
+        store.create_user("importer", "pw")
+        base = baseline(store.DB_PATH, args.baseline_rows)
+
+        report, rss = peak_rss_during(lambda: import_vitals(export, "importer", chunk_size=args.chunk_size))
+        print(f"\nbaseline (add_vital, one transaction per row): {base:10,.0f} rows/s")
+        print(f"import_vitals (executemany per {args.chunk_size}-row chunk): {report.rows_per_s:10,.0f} rows/s  "
+              f"x{report.rows_per_s / base:.0f}")
+        print(f"peak RSS growth during import: {rss:.1f} MB")
+        print(f"report: {report.as_dict()}")
+
+        again = import_vitals(export, "importer", chunk_size=args.chunk_size)
+        print(f"re-import: inserted {again.inserted}, duplicates {again.duplicates}, {again.rows_per_s:,.0f} rows/s")
+
+        with store._read() as conn:
+            n, lo, hi = conn.execute(
+                "SELECT COUNT(*), MIN(value_main), MAX(value_main) FROM health_vitals WHERE username='importer' AND vitals_type='sugar'"
+            ).fetchone()
+        valid = args.rows - expected["invalid"]
+        ok = (report.invalid == expected["invalid"] and report.duplicates == expected["duplicates"]
+              and report.inserted == valid - expected["duplicates"] and again.inserted == 0
+              and lo >= 70 and hi <= 220)
+        print(f"counts as expected: {ok} (glucose range after unit normalisation {lo:.0f}-{hi:.0f} mg/dL over {n} readings)")
+        if not ok:
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
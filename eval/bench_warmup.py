@@ -0,0 +1,33 @@
+# eval/bench_warmup.py
+"""First-request vs steady-state latency with and without the startup warm-up pass.
+
+Usage: PYTHONPATH=. python eval/bench_warmup.py
+"""
+import time
+
+from app.core.prompts import build_user_prompt
+from app.models.startup import ModelStartup, warmup_medgemma
+from eval.tiny_model import build_tiny_client
+
+def request_latencies(client, n: int = 5) -> list[float]:
+    out = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        client.generate(build_user_prompt(f"w{i} w{i + 1} w{i + 2}", None), max_new_tokens=16, temperature=0.0)
+        out.append(time.perf_counter() - t0)
+    return out
+
+def main():
+    cold = request_latencies(build_tiny_client(hidden_size=256, num_layers=4))
+    startup = ModelStartup({"medgemma": lambda: build_tiny_client(hidden_size=256, num_layers=4)},
+                           {"medgemma": warmup_medgemma}, steps=("text",))
+    warm = request_latencies(startup.wait()["medgemma"])
+
+    steady = sorted(cold[1:])[len(cold[1:]) // 2]
+    print(f"steady-state latency : {steady * 1000:7.1f} ms")
+    print(f"first request (cold) : {cold[0] * 1000:7.1f} ms")
+    print(f"first request (warm) : {warm[0] * 1000:7.1f} ms")
+    print(f"startup report       : {startup.report}")
+
+if __name__ == "__main__":
+    main()
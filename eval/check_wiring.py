@@ -0,0 +1,125 @@
+# eval/check_wiring.py
+"""The Orchestrator as the UI builds it must actually use the client's per-request features.
+
+Builds the orchestrator through app.models.startup.build_orchestrator (what the Streamlit
+load_models calls) around the tiny model: in process and through the model server
+(MEDGEMMA_SERVER_URL), each bare and wrapped in MicroBatcher, and runs a two-turn session
+through achat and chat. Checks that session_id and sections=True reach the model: the second
+turn reuses the session KV cache and every generation logs a section_control event. Also
+checks that batched requests (no session) keep section control, and that the response cache
+does not serve one model's (or section-control mode's) answers to another.
+
+  PYTHONPATH=. python eval/check_wiring.py
+"""
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import warnings
+from pathlib import Path
+
+import app.core.metrics as metrics
+import app.core.orchestrator as orchestrator
+from app.core.guardrails import GuardrailResult
+from app.core.response_cache import ResponseCache
+from app.models.batching import MicroBatcher
+from app.models.startup import build_orchestrator
+from app.server.model_server import ModelServer
+from eval.fake_model import FakeMedGemmaClient
+from eval.tiny_model import build_tiny_client
+
+QUESTIONS = ["w1 w2 w3 w4 w5", "w6 w7 w8"]
+GEN = {"max_new_tokens": 16}
+
+def run_session(orch, session_id: str, use_achat: bool):
+    history = []
+    for q in QUESTIONS:
+        if use_achat:
+            answer = asyncio.run(orch.achat("check", q, session_id=session_id, history=history)).answer
+        else:
+            answer = orch.chat("check", q, None, None, session_id=session_id, history=history)
+        history += [("user", q), ("assistant", answer)]
+
+def check(label: str, orch, client, use_achat: bool) -> bool:
+    params = orch._generation_params(GuardrailResult(allowed=True), "s")
+    hits = client.session_cache.stats()["hits"]
+    sections = metrics.aggregator.counts["section_control"]
+    run_session(orch, f"{label}-{use_achat}", use_achat)
+    reused = client.session_cache.stats()["hits"] - hits
+    controlled = metrics.aggregator.counts["section_control"] - sections
+    ok = (params.get("session_id") == "s" and reused >= 1
+          and params.get("sections") is True and controlled == len(QUESTIONS))
+    print(f"{label:22s} {'achat' if use_achat else 'chat':6s} params {sorted(params)}; "
+          f"session cache hits {reused}; section_control events {controlled} -> {ok}")
+    return ok
+
+def check_batch(batcher: MicroBatcher) -> bool:
+    """Concurrent session-less requests share a batch, and each row still gets section control."""
+    batches = batcher.batches_run
+    sections = metrics.aggregator.counts["section_control"]
+    prompts = [f"w{i} w{i + 1} w{i + 2}" for i in range(4)]
+    with ThreadPoolExecutor(len(prompts)) as pool:
+        list(pool.map(lambda p: batcher.generate(p, sections=True, **GEN), prompts))
+    batched = batcher.batches_run - batches
+    controlled = metrics.aggregator.counts["section_control"] - sections
+    ok = batched < len(prompts) and controlled == len(prompts)
+    print(f"batched generate: {len(prompts)} requests in {batched} batches; section_control events {controlled} -> {ok}")
+    return ok
+
+class SectionedFake(FakeMedGemmaClient):
+    supports_sections = True
+    section_control = True
+
+    def generate(self, prompt, image=None, max_new_tokens=512, temperature=0.2, sections=False):
+        return super().generate(prompt, image, max_new_tokens, temperature)
+
+def check_cache_key() -> bool:
+    """One shared response cache: a repeat is a hit; another model or control mode is a miss."""
+    cache = ResponseCache()
+    base, other_model, no_sections = SectionedFake(), SectionedFake(), SectionedFake()
+    other_model.model_id = "other-model"
+    no_sections.section_control = False
+    q = "What does a high LDL cholesterol mean?"
+    for client in (base, base, other_model, no_sections):
+        with build_orchestrator({"medgemma": client, "medasr": None}, response_cache=cache) as orch:
+            orch.chat("check", q, None, None)
+    ok = (base.calls, other_model.calls, no_sections.calls) == (1, 1, 1)
+    print(f"response cache keyed by model and section control: generations {base.calls + other_model.calls + no_sections.calls} "
+          f"for 4 requests -> {ok}")
+    return ok
+
+def main():
+    warnings.filterwarnings("ignore")
+    metrics.LOG_PATH = Path(tempfile.mkdtemp()) / "metrics_log.jsonl"
+    client = build_tiny_client()
+    client.prefix_cache.prefix_text = None
+    orchestrator.GENERATION_PARAMS = {**orchestrator.GENERATION_PARAMS, **GEN}
+
+    ok = check_cache_key()
+    orch = build_orchestrator({"medgemma": client, "medasr": None})
+    for use_achat in (True, False):
+        ok &= check("in-process", orch, client, use_achat)
+    orch.close()
+
+    batcher = MicroBatcher(client, max_wait_ms=50)
+    orch = build_orchestrator({"medgemma": batcher, "medasr": None})
+    for use_achat in (True, False):
+        ok &= check("in-process+batcher", orch, client, use_achat)
+    orch.close()
+    ok &= check_batch(batcher)
+
+    for label, served in (("server", client), ("server+batcher", batcher)):
+        server = ModelServer(served, port=0).start()
+        try:
+            with build_orchestrator(server_url=server.url) as orch:
+                for use_achat in (True, False):
+                    ok &= check(label, orch, client, use_achat)
+        finally:
+            server.stop()
+    batcher.close()
+
+    print(f"session KV reuse and section control reach the model: {ok}")
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# eval/fake_model.py
+"""Deterministic stand-in for MedGemmaClient for CPU-only CI and load tests.
+
+Answers always contain the four required sections, are derived from a hash of the prompt,
+and can simulate prefill/decode time so latency-sensitive code paths can be exercised.
+"""
+import hashlib
+import time
+from typing import Iterator
+
+SECTIONS = [
+    "Plain-language summary",
+    "Questions to ask a doctor",
+    "Red flags (when to seek urgent care)",
+    "What this is based on",
+]
+
+class FakeMedGemmaClient:
+    def __init__(self, prefill_s: float = 0.0, per_token_s: float = 0.0, tokens_per_section: int = 30):
+        self.model_id = "fake-medgemma"
+        self.prefill_s = prefill_s
+        self.per_token_s = per_token_s
+        self.tokens_per_section = tokens_per_section
+        self.calls = 0
+
+    def _tokens(self, prompt: str, max_new_tokens: int) -> list[str]:
+        seed = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        tokens = []
+        for i, title in enumerate(SECTIONS):
+            tokens += [f"{i + 1}) **{title}**:"]
+            tokens += [f"t{seed[(i * 7 + j) % len(seed)]}" for j in range(self.tokens_per_section)]
+            tokens[-1] += "\n"
+        if "USER-PROVIDED REPORT" in prompt:
+            tokens.append('Based on the "USER-PROVIDED" report.')
+        return tokens[:max_new_tokens]
+
+    def generate_stream(self, prompt: str, image=None, max_new_tokens: int = 512, temperature: float = 0.2) -> Iterator[str]:
+        self.calls += 1
+        if self.prefill_s:
+            time.sleep(self.prefill_s)
+        for i, tok in enumerate(self._tokens(prompt, max_new_tokens)):
+            if self.per_token_s:
+                time.sleep(self.per_token_s)
+            yield tok if i == 0 else " " + tok
+
+    def generate(self, prompt: str, image=None, max_new_tokens: int = 512, temperature: float = 0.2) -> str:
+        return "".join(self.generate_stream(prompt, image, max_new_tokens, temperature)).strip()
+
+    def generate_batch(self, prompts: list[str], images: list | None = None,
+                       max_new_tokens: int = 512, temperature: float = 0.2) -> list[str]:
+        images = images or [None] * len(prompts)
+        return [self.generate(p, img, max_new_tokens, temperature) for p, img in zip(prompts, images)]
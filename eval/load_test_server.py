@@ -0,0 +1,125 @@
+# eval/load_test_server.py
+"""Load test of the model server with the fake model: queueing, priorities, backpressure.
+
+Starts app.server.model_server in-process around FakeMedGemmaClient (simulated prefill and
+per-token latency), then drives it over HTTP with concurrent clients sending ~10% urgent
+requests. For each worker count it reports throughput, latency and queue wait by priority,
+and how many attempts were turned away as "busy" (clients back off and retry).
+
+  PYTHONPATH=. python eval/load_test_server.py --workers 1,2,4,8 --clients 16 --requests 160
+"""
+import argparse
+import random
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import app.core.metrics as metrics
+from app.core.orchestrator import Orchestrator
+from app.server.client import ModelServerClient, RemoteMedGemmaClient
+from app.server.model_server import ModelServer
+from app.server.scheduler import ServerBusy
+from eval.fake_model import FakeMedGemmaClient
+from eval.offline_eval import percentile
+
+def run_load(workers: int, clients: int, requests: int, max_queue: int, urgent_share: float,
+             fake: FakeMedGemmaClient, retry_s: float = 0.05) -> dict:
+    server = ModelServer(fake, workers=workers, max_queue=max_queue, port=0).start()
+    client = ModelServerClient(server.url)
+    remote = RemoteMedGemmaClient(client)
+    rng = random.Random(0)
+    plan = ["urgent" if rng.random() < urgent_share else "routine" for _ in range(requests)]
+    lat = {"urgent": [], "routine": []}
+    queue_s = {"urgent": [], "routine": []}
+    busy = {"urgent": 0, "routine": 0}
+    lock = threading.Lock()
+    next_i = iter(range(requests))
+
+    def client_loop():
+        while True:
+            with lock:
+                i = next(next_i, None)
+            if i is None:
+                return
+            prio = plan[i]
+            body = remote._body(f"question {i}", None, 120, 0.2, prio)
+            t0 = time.perf_counter()
+            while True:
+                try:
+                    out = client.call("/generate", body)
+                    break
+                except ServerBusy:
+                    # Back off and retry, as the UI asks the user to; latency includes the retries
+                    with lock:
+                        busy[prio] += 1
+                    time.sleep(retry_s)
+            with lock:
+                lat[prio].append(time.perf_counter() - t0)
+                queue_s[prio].append(out["queue_s"])
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client_loop) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    stats = server.stats()
+    server.stop()
+
+    served = sum(len(v) for v in lat.values())
+    return {"wall": wall, "served": served, "busy": busy, "lat": lat, "queue_s": queue_s, "stats": stats}
+
+def check_orchestrator(fake: FakeMedGemmaClient):
+    """The Orchestrator works unchanged on the remote client, streamed and non-streamed."""
+    server = ModelServer(fake, workers=2, port=0).start()
+    try:
+        local = Orchestrator(fake)
+        remote = Orchestrator(RemoteMedGemmaClient(server.url))
+        q = "I have chest pain after climbing stairs, what should I ask?"
+        same = remote.chat("u", q, None, None) == local.chat("u", q, None, None)
+        streamed = "".join(remote.chat_stream("u", q, None, None)) == "".join(local.chat_stream("u", q, None, None))
+        return same and streamed
+    finally:
+        server.stop()
+
+def check_unix_socket(fake: FakeMedGemmaClient) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        server = ModelServer(fake, workers=1, socket_path=str(Path(tmp) / "medgemma.sock")).start()
+        try:
+            remote = RemoteMedGemmaClient(server.url)
+            return remote.generate("hello", max_new_tokens=8) == fake.generate("hello", max_new_tokens=8)
+        finally:
+            server.stop()
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", default="1,2,4,8")
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=160)
+    ap.add_argument("--max-queue", type=int, default=8)
+    ap.add_argument("--urgent-share", type=float, default=0.1)
+    ap.add_argument("--prefill-ms", type=float, default=20)
+    ap.add_argument("--token-ms", type=float, default=0.5)
+    args = ap.parse_args()
+    metrics.LOG_PATH = Path(tempfile.mkdtemp()) / "metrics_log.jsonl"
+
+    fake = FakeMedGemmaClient(prefill_s=args.prefill_ms / 1000, per_token_s=args.token_ms / 1000)
+    print(f"orchestrator over the server matches in-process: {check_orchestrator(fake)}")
+    print(f"unix socket transport: {check_unix_socket(fake)}")
+    print(f"{args.clients} clients, {args.requests} requests (~{args.urgent_share:.0%} urgent), queue limit {args.max_queue}\n")
+    print(f"{'workers':>7s} {'req/s':>7s} {'served':>7s} {'busy u/r':>9s} "
+          f"{'urgent p50/p95 ms':>18s} {'routine p50/p95 ms':>19s} {'urgent wait ms':>15s} {'routine wait ms':>16s}")
+    ms = lambda v: f"{v * 1000:.0f}" if v is not None else "-"
+    for w in [int(x) for x in args.workers.split(",")]:
+        r = run_load(w, args.clients, args.requests, args.max_queue, args.urgent_share, fake)
+        u, ro = r["lat"]["urgent"], r["lat"]["routine"]
+        mean = lambda xs: sum(xs) / len(xs) if xs else None
+        print(f"{w:7d} {r['served'] / r['wall']:7.1f} {r['served']:7d} {r['busy']['urgent']:>4d}/{r['busy']['routine']:<4d} "
+              f"{ms(percentile(u, .5)) + '/' + ms(percentile(u, .95)):>18s} "
+              f"{ms(percentile(ro, .5)) + '/' + ms(percentile(ro, .95)):>19s} "
+              f"{ms(mean(r['queue_s']['urgent'])):>15s} {ms(mean(r['queue_s']['routine'])):>16s}")
+
+if __name__ == "__main__":
+    main()
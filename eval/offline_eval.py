@@ -1 +1,172 @@
 # eval/offline_eval.py
+"""Offline quality + performance evaluation of Orchestrator.chat.
+
+Reads JSONL cases, runs them through the Orchestrator with a pluggable backend in parallel
+workers, and writes a results JSON (summary + per-case rows) that can be diffed against an
+earlier run to catch quality or latency regressions.
+
+Case fields: "question" (or "title"/"body" as in requests.jsonl), optional "pasted_text",
+"image_path" and "id"/"request_id".
+
+Usage:
+  PYTHONPATH=. python eval/offline_eval.py cases.jsonl --backend fake --workers 4 --out runs/fake.json
+  PYTHONPATH=. python eval/offline_eval.py cases.jsonl --backend medgemma --out runs/new.json --compare runs/old.json
+"""
+import argparse
+import math
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import app.core.metrics as metrics
+from app.core.guardrails import run_guardrails_batch
+from app.core.metrics import has_required_sections, groundedness_proxy
+from app.core.orchestrator import Orchestrator
+from app.utils.io import read_json, read_jsonl, write_json
+
+QUALITY_KEYS = {"sections_ok_rate", "groundedness_mean"}  # regression: absolute drop > 1 point
+SPEED_KEYS = {"throughput_rps"}  # regression: relative drop > tolerance
+# latency_* keys: regression on a relative rise > tolerance; other keys are informational
+
+def load_cases(path: str | Path, limit: int | None = None) -> list[dict]:
+    cases = []
+    for i, row in enumerate(read_jsonl(path)):
+        question = row.get("question") or " ".join(x for x in (row.get("title"), row.get("body")) if x)
+        cases.append({
+            "id": row.get("id") or row.get("request_id") or f"case-{i}",
+            "question": question,
+            "pasted_text": row.get("pasted_text"),
+            "image_path": row.get("image_path"),
+        })
+        if limit and len(cases) >= limit:
+            break
+    return cases
+
+def build_backend(name: str, model_id: str | None = None):
+    if name == "fake":
+        from eval.fake_model import FakeMedGemmaClient
+        return FakeMedGemmaClient()
+    if name == "tiny":
+        from eval.tiny_model import build_tiny_client
+        return build_tiny_client()
+    if name == "medgemma":
+        from app.models.medgemma import MedGemmaClient, DEFAULT_MODEL_ID
+        return MedGemmaClient(model_id or DEFAULT_MODEL_ID)
+    raise ValueError(f"unknown backend: {name}")
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, math.ceil(q * len(s)) - 1))]
+
+def run_case(orch: Orchestrator, case: dict) -> dict:
+    image = None
+    if case["image_path"]:
+        from PIL import Image
+        image = Image.open(case["image_path"]).convert("RGB")
+    t0 = time.perf_counter()
+    answer = orch.chat(user_id="offline-eval", user_question=case["question"],
+                       pasted_text=case["pasted_text"], image=image)
+    return {"answer": answer, "latency_s": time.perf_counter() - t0}
+
+def evaluate(cases: list[dict], backend, workers: int = 1) -> dict:
+    orch = Orchestrator(backend)
+    guard = run_guardrails_batch([c["question"] + "\n" + (c["pasted_text"] or "") for c in cases])
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outputs = list(pool.map(lambda c: run_case(orch, c), cases))
+    wall_s = time.perf_counter() - t0
+
+    rows = []
+    for case, gr, out in zip(cases, guard, outputs):
+        row = {
+            "id": case["id"],
+            "refused": not gr.allowed,
+            "urgent": gr.urgency == "urgent",
+            "rules": sorted({m.rule_id for m in gr.matches}),
+            "latency_s": round(out["latency_s"], 6),
+            "answer_chars": len(out["answer"] or ""),
+        }
+        if gr.allowed:
+            row["sections_ok"] = has_required_sections(out["answer"])
+            row["groundedness"] = groundedness_proxy(out["answer"], case["pasted_text"])
+        rows.append(row)
+
+    answered = [r for r in rows if not r["refused"]]
+    gen_latencies = [r["latency_s"] for r in answered]
+    mean = lambda xs: sum(xs) / len(xs) if xs else None
+    summary = {
+        "cases": len(rows),
+        "refusal_rate": mean([r["refused"] for r in rows]),
+        "urgent_rate": mean([r["urgent"] for r in rows]),
+        "sections_ok_rate": mean([r["sections_ok"] for r in answered]),
+        "groundedness_mean": mean([r["groundedness"] for r in answered]),
+        "answer_chars_mean": mean([r["answer_chars"] for r in answered]),
+        "latency_p50_s": percentile(gen_latencies, 0.50),
+        "latency_p95_s": percentile(gen_latencies, 0.95),
+        "latency_p99_s": percentile(gen_latencies, 0.99),
+        "latency_mean_s": mean(gen_latencies),
+        "throughput_rps": len(rows) / wall_s if wall_s else None,
+        "wall_s": wall_s,
+    }
+    return {"summary": summary, "cases": rows}
+
+def compare(new: dict, old: dict, tolerance: float = 0.10) -> list[str]:
+    """Lines describing each summary metric's change; regressions beyond `tolerance` are flagged."""
+    lines, regressions = [], 0
+    for key, new_v in new["summary"].items():
+        old_v = old["summary"].get(key)
+        if not isinstance(new_v, (int, float)) or not isinstance(old_v, (int, float)) or key in ("cases", "wall_s"):
+            continue
+        delta = new_v - old_v
+        rel = delta / old_v if old_v else 0.0
+        if key in QUALITY_KEYS:
+            worse = delta < -0.01
+        elif key in SPEED_KEYS:
+            worse = rel < -tolerance
+        else:
+            worse = key.startswith("latency_") and rel > tolerance
+        regressions += worse
+        lines.append(f"{key:20s} {old_v:12.4f} -> {new_v:12.4f}  ({rel:+7.1%}){'  REGRESSION' if worse else ''}")
+    lines.append(f"{regressions} regression(s)")
+    return lines
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("cases", help="JSONL file of eval cases")
+    ap.add_argument("--backend", choices=["fake", "tiny", "medgemma"], default="fake")
+    ap.add_argument("--model-id", default=None)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--limit", type=int, default=None)
+    ap.add_argument("--out", default=None, help="write results JSON here")
+    ap.add_argument("--compare", default=None, help="earlier results JSON to diff against")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="relative latency/throughput change treated as a regression")
+    args = ap.parse_args(argv)
+
+    cases = load_cases(args.cases, args.limit)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep eval traffic out of the app's metrics log
+        metrics.LOG_PATH = Path(tmp) / "metrics_log.jsonl"
+        result = evaluate(cases, build_backend(args.backend, args.model_id), workers=args.workers)
+        metrics.flush_metrics()
+    result["meta"] = {"backend": args.backend, "model_id": args.model_id, "workers": args.workers,
+                      "cases_file": str(args.cases), "created_at": time.time()}
+
+    for key, value in result["summary"].items():
+        print(f"{key:20s} {value:.4f}" if isinstance(value, float) else f"{key:20s} {value}")
+    if args.out:
+        write_json(args.out, result)
+
+    if args.compare:
+        lines = compare(result, read_json(args.compare), args.tolerance)
+        print("\n".join(lines))
+        if not lines[-1].startswith("0 "):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
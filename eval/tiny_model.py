@@ -0,0 +1,63 @@
+# eval/tiny_model.py
+"""Tiny randomly initialised Gemma3 text model + word-level tokenizer for CPU-only benchmarks.
+
+Needs no network access or Hugging Face token, so it can stand in for MedGemma in CI.
+"""
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import Gemma3ForCausalLM, Gemma3TextConfig, PreTrainedTokenizerFast
+
+from app.models.medgemma import MedGemmaClient
+
+SPECIAL_TOKENS = ["<pad>", "<bos>", "<eos>", "<unk>", "<start_of_turn>", "<end_of_turn>", "user", "model"]
+
+CHAT_TEMPLATE = (
+    "{% for m in messages %}<start_of_turn> {{ m['role'] }} "
+    "{% for c in m['content'] %}{% if c['type'] == 'text' %}{{ c['text'] }}{% endif %}{% endfor %}"
+    " <end_of_turn> {% endfor %}{% if add_generation_prompt %}<start_of_turn> model {% endif %}"
+)
+
+def build_tiny_tokenizer(extra_words: list[str] | None = None, n_words: int = 256) -> PreTrainedTokenizerFast:
+    words = SPECIAL_TOKENS + [f"w{i}" for i in range(n_words)] + list(extra_words or [])
+    vocab = {w: i for i, w in enumerate(dict.fromkeys(words))}
+    tk = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tk.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tok = PreTrainedTokenizerFast(
+        tokenizer_object=tk, pad_token="<pad>", bos_token="<bos>", eos_token="<eos>", unk_token="<unk>"
+    )
+    tok.chat_template = CHAT_TEMPLATE
+    return tok
+
+def build_tiny_model(vocab_size: int, hidden_size: int = 64, num_layers: int = 2, seed: int = 0,
+                     sliding_window: int | None = None) -> Gemma3ForCausalLM:
+    """`sliding_window` makes every layer but the last a sliding-window layer, like Gemma 3's 5:1 pattern."""
+    window = {}
+    if sliding_window:
+        window = {"sliding_window": sliding_window,
+                  "layer_types": ["sliding_attention"] * (num_layers - 1) + ["full_attention"]}
+    cfg = Gemma3TextConfig(
+        vocab_size=vocab_size,
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        head_dim=hidden_size // 4,
+        pad_token_id=0,
+        bos_token_id=1,
+        eos_token_id=2,
+        **window,
+    )
+    torch.manual_seed(seed)
+    return Gemma3ForCausalLM(cfg).eval()
+
+def build_tiny_client(hidden_size: int = 64, num_layers: int = 2, seed: int = 0,
+                      sliding_window: int | None = None) -> MedGemmaClient:
+    tok = build_tiny_tokenizer()
+    model = build_tiny_model(len(tok), hidden_size=hidden_size, num_layers=num_layers, seed=seed,
+                             sliding_window=sliding_window)
+    return MedGemmaClient.from_components(model, tok, device="cpu", model_id="tiny-random-gemma3")
+
+def random_prompt(rng, min_words: int = 4, max_words: int = 24) -> str:
+    n = rng.randint(min_words, max_words)
+    return " ".join(f"w{rng.randrange(256)}" for _ in range(n))